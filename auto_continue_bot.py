@@ -1,17 +1,90 @@
 import time
+import atexit
 import os
 import sys
 import argparse
 import logging
 import json
 import threading
-from logging.handlers import RotatingFileHandler
+import weakref
+import importlib
+import importlib.util
+import contextlib
+import contextvars
+import copy
+import tempfile
+import queue
+import select
+import signal
+import socket
+import stat
+import struct
+import ctypes
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor
+import subprocess
+import shutil
+import zlib
+from collections import namedtuple
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
-import pyautogui
-from pynput import keyboard
-import pystray
-from PIL import Image, ImageDraw, UnidentifiedImageError
-from plyer import notification
+import cv2
+import numpy as np
+
+class _LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access, so startup and
+    --scan-once runs only pay for the GUI libraries they actually use.
+    `attr` names a submodule/object to take from the imported module (e.g. pynput.mouse).
+    """
+
+    def __init__(self, name, attr=None):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_attr', attr)
+        object.__setattr__(self, '_module', None)
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            if self._attr:
+                module = getattr(module, self._attr)
+            object.__setattr__(self, '_module', module)
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._load(), name)
+
+    def __repr__(self):
+        target = f"{self._name}.{self._attr}" if self._attr else self._name
+        return f"<lazy module {target}{'' if self._module is None else ' (loaded)'}>"
+
+asyncio = _LazyModule('asyncio')
+multiprocessing = _LazyModule('multiprocessing')
+shared_memory = _LazyModule('multiprocessing.shared_memory')
+resource_tracker = _LazyModule('multiprocessing.resource_tracker')
+pyautogui = _LazyModule('pyautogui')
+keyboard = _LazyModule('pynput', 'keyboard')
+mouse = _LazyModule('pynput', 'mouse')
+pystray = _LazyModule('pystray')
+PIL = _LazyModule('PIL')
+Image = _LazyModule('PIL.Image')
+ImageDraw = _LazyModule('PIL.ImageDraw')
+notification = _LazyModule('plyer', 'notification')
+
+# Optional fast screen capture
+MSS_AVAILABLE = importlib.util.find_spec('mss') is not None
+mss = _LazyModule('mss')
+
+# Optional clipboard access for paste injection (installed with pyautogui)
+PYPERCLIP_AVAILABLE = importlib.util.find_spec('pyperclip') is not None
+pyperclip = _LazyModule('pyperclip')
 
 # Import winreg on Windows
 if sys.platform == 'win32':
@@ -20,30 +93,406 @@ if sys.platform == 'win32':
 else:
     WIN_REG_AVAILABLE = False
 
-# Configure logging with Rotation
 LOG_FILE = "bot.log"
-# Max 1MB per file, keep 3 backups
-handler = RotatingFileHandler(LOG_FILE, maxBytes=1024*1024, backupCount=3, encoding='utf-8')
-handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        handler
-    ]
-)
+LOG_FORMATS = ('text', 'json')
+# Max 5MB per file, keep 5 backups
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 5
+# Identical warnings/errors within this many seconds are collapsed into one summary line
+LOG_DEDUP_INTERVAL = 60.0
+# Distinct messages the deduplicator remembers before forgetting quiet ones
+LOG_DEDUP_MAX_KEYS = 256
+
+class _Cycle:
+    """One numbered cycle: its stage durations, and how many users still hold it open."""
+
+    def __init__(self, cycle_id):
+        self.id = cycle_id
+        self.stages = {}
+        self.holds = 1
+        self.state = None
+
+class CycleLog:
+    """
+    Cycle id and stage durations, kept in a context variable. Every log record is
+    tagged with the current cycle, so the lines of one scan/action can be grouped.
+    Work handed to other threads keeps its cycle when wrapped with in_context().
+    """
+
+    def __init__(self):
+        self._current = contextvars.ContextVar('cycle', default=None)
+        self._lock = threading.Lock()
+        self._last_id = 0
+
+    @contextlib.contextmanager
+    def cycle(self):
+        """Number the enclosed cycle; log its stage durations when it ends (INFO if it acted)."""
+        with self._lock:
+            self._last_id += 1
+            cycle = _Cycle(self._last_id)
+        token = self._current.set(cycle)
+        try:
+            yield cycle.id
+        finally:
+            self._current.reset(token)
+            if cycle.state is None:
+                cycle.state = cycle_state
+            self._release(cycle)
+
+    def hold(self):
+        """Keep the current cycle open for work that finishes after its block, e.g. a queued action."""
+        cycle = self._current.get()
+        if cycle is not None:
+            with self._lock:
+                cycle.holds += 1
+        return cycle
+
+    @contextlib.contextmanager
+    def resume(self, cycle):
+        """Continue a held cycle; its line is logged once the last holder is done."""
+        if cycle is None:
+            yield
+            return
+        token = self._current.set(cycle)
+        try:
+            yield
+        finally:
+            self._current.reset(token)
+            self._release(cycle)
+
+    def _release(self, cycle):
+        with self._lock:
+            cycle.holds -= 1
+            if cycle.holds:
+                return
+            stages = dict(cycle.stages)
+        if stages:
+            level = logging.INFO if cycle.state == 'acted' else logging.DEBUG
+            timings = ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in stages.items())
+            logging.log(level, f"Cycle {cycle.id} ({cycle.state}): {timings}",
+                        extra={'cycle': cycle.id,
+                               'stages': {stage: round(seconds, 6) for stage, seconds in stages.items()}})
+
+    def set_state(self, state):
+        """Override the state logged for the current cycle (a held cycle that acted later)."""
+        cycle = self._current.get()
+        if cycle is not None:
+            cycle.state = state
+
+    def current(self):
+        cycle = self._current.get()
+        return cycle.id if cycle is not None else None
+
+    def record(self, stage, seconds):
+        cycle = self._current.get()
+        if cycle is not None:
+            with self._lock:
+                cycle.stages[stage] = cycle.stages.get(stage, 0.0) + seconds
+
+cycle_log = CycleLog()
+
+def in_context(func):
+    """
+    Wrap func to run in a copy of the caller's context, so executor threads log
+    and time under the caller's cycle. Each call gets its own copy, so the
+    wrapper can be used from several threads at once.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+class LogDeduplicator(logging.Filter):
+    """
+    Lets the first of a run of identical messages through, swallows repeats
+    for `interval` seconds, then logs the next one with the number swallowed.
+    Only records at `level` or above are collapsed; normal action lines are kept.
+    """
+
+    def __init__(self, interval=LOG_DEDUP_INTERVAL, level=logging.WARNING, clock=time.monotonic):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.seen = {}  # (levelno, message) -> [window start, suppressed]
+
+    def filter(self, record):
+        if record.levelno < self.level or self.interval <= 0:
+            return True
+        message = record.getMessage()
+        key = (record.levelno, message)
+        now = self.clock()
+        with self._lock:
+            entry = self.seen.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                return False
+            if len(self.seen) >= LOG_DEDUP_MAX_KEYS:
+                self._forget(now)
+            self.seen[key] = [now, 0]
+        if entry is not None and entry[1]:
+            record.msg = f"{message} (repeated {entry[1]} more times in the last {now - entry[0]:.0f}s)"
+            record.args = None
+            record.repeated = entry[1]
+        return True
+
+    def _forget(self, now):
+        for key, (start, suppressed) in list(self.seen.items()):
+            if not suppressed or now - start >= self.interval:
+                del self.seen[key]
+
+    def flush(self):
+        """Log a summary for every message still being swallowed (at shutdown)."""
+        with self._lock:
+            pending = [(key, entry) for key, entry in self.seen.items() if entry[1]]
+            self.seen.clear()
+        for (levelno, message), (_, suppressed) in pending:
+            logging.log(levelno, f"{message} (repeated {suppressed} more times)", extra={'repeated': suppressed})
+
+class _CycleTagger(logging.Filter):
+    """Stamps records with the cycle id of the thread that logged them."""
+
+    def filter(self, record):
+        if not hasattr(record, 'cycle'):
+            record.cycle = cycle_log.current()
+        return True
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, thread, msg, plus cycle/stages/repeated when set."""
+
+    def format(self, record):
+        event = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key in ('cycle', 'stages', 'repeated'):
+            value = getattr(record, key, None)
+            if value is not None:
+                event[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            event['exc'] = record.exc_text
+        return json.dumps(event)
+
+class _TracebackQueueHandler(QueueHandler):
+    """
+    QueueHandler that keeps the traceback as its own field. The stock prepare()
+    folds it into msg and drops exc_info, which leaves the JSON 'exc' field empty.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Render now so the listener never touches live frames
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_log_listener = None
+_log_dedup = None
+
+def setup_logging(log_format='text', dedup_interval=LOG_DEDUP_INTERVAL):
+    """
+    Log to stdout and a rotating file. Callers only enqueue the record; a
+    QueueListener thread formats and writes it, so slow disks or consoles never
+    hold up the bot loop. Called from main() so importing the module has no side effects.
+    """
+    global _log_listener, _log_dedup
+    if log_format == 'json':
+        formatter = JsonLogFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+    console_handler = logging.StreamHandler(sys.stdout)
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    _log_dedup = LogDeduplicator(dedup_interval)
+    queue_handler = _TracebackQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(_CycleTagger())
+    queue_handler.addFilter(_log_dedup)
+    _log_listener = QueueListener(queue_handler.queue, console_handler, file_handler)
+    _log_listener.start()
+    atexit.register(stop_logging)
+
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+
+def stop_logging():
+    """Write pending repeat summaries and drain the log queue."""
+    global _log_listener
+    if _log_dedup:
+        _log_dedup.flush()
+    if _log_listener:
+        _log_listener.stop()
+        _log_listener = None
 
 DEFAULT_TEXT = """Continue with the plan. Develop the rest of the requirements. Make improvements.  Make sure everything works.  Write tests. Run the tests. If you have confirmed there is absolutely nothing left to do, execute 'sleep 60000' command in the shell (not in the background) and wait for it. Only if you are certain. Otherwise, wait for further instructions."""
 CONFIG_FILE = "config.json"
 APP_NAME = "Cursor Auto-Continue Bot"
 REG_KEY_PATH = r"Software\Microsoft\Windows\CurrentVersion\Run"
 
+# Template matching
+MATCH_CONFIDENCE = 0.95
+# Coarse pyramid level is allowed this much below MATCH_CONFIDENCE; candidates are re-checked at full resolution
+COARSE_CONFIDENCE_SLACK = 0.25
+# Don't shrink the template below this many pixels on the coarse level
+MIN_COARSE_TEMPLATE_SIZE = 12
+MAX_PYRAMID_CANDIDATES = 5
+# Multi-target mode: most icon instances reported per monitor
+MAX_TARGETS = 16
+# A detection within this distance (px) of a known target is the same target
+TARGET_MATCH_RADIUS = 150
+# Multi-target mode re-scans all monitors for new windows at least this often (s)
+DISCOVERY_INTERVAL = 30.0
+# Forget targets that haven't been seen for this long (s)
+TARGET_EXPIRY = 3600.0
+ROI_SIZE = 200
+# Adaptive ROI: box sizes tried around remembered locations before half-screen and full-screen scans
+ROI_LADDER = (ROI_SIZE, 3 * ROI_SIZE)
+ROI_CANDIDATES = 3
+# Shrink the ROI one step after this many consecutive hits without the icon moving much
+ROI_SHRINK_HITS = 3
+# Change detection samples every Nth pixel in both directions
+FINGERPRINT_STEP = 4
+
+# Scan scheduling (seconds)
+DEFAULT_MIN_INTERVAL = 0.25
+DEFAULT_MAX_INTERVAL = 5.0
+# Paused or locked: sleep long, pause/quit wake the loop immediately
+DORMANT_INTERVAL = 30.0
+SCAN_BACKOFF = 1.5
+# Poll fast from this fraction of the expected agent run time up to FAST_POLL_END times it
+FAST_POLL_START = 0.8
+FAST_POLL_END = 2.0
+
+Point = namedtuple('Point', ['x', 'y'])
+Match = namedtuple('Match', ['center', 'score', 'scale', 'variant'], defaults=[None])
+TemplateVariant = namedtuple('TemplateVariant', ['name', 'template', 'confidence'])
+
+# Text injection
+INJECT_METHODS = ['auto', 'clipboard', 'bulk', 'type']
+TYPE_INTERVAL = 0.02
+# Give the target app time to read the clipboard before restoring it
+CLIPBOARD_SETTLE = 0.15
+XDOTOOL_TIMEOUT = 30
+
+# Polite mode: seconds without mouse/keyboard input before the bot may act
+DEFAULT_IDLE_THRESHOLD = 2.0
+# Input events from our own clicks/typing can arrive slightly after we finish
+SYNTHETIC_INPUT_GRACE = 0.3
+
+# Virtual screen defaults (headless runs)
+VIRTUAL_SCREEN_SIZE = (1920, 1080)
+VIRTUAL_BUSY_SECONDS = 2.0
+
+# Config hot reload: how often config.json is checked when inotify isn't available
+CONFIG_POLL_INTERVAL = 1.0
+# Settings applied to the running bot; the others need a restart
+HOT_RELOAD_KEYS = ('text', 'cooldown', 'offset_x', 'offset_y', 'image', 'scales', 'pyramid_levels',
+                   'inject', 'min_interval', 'max_interval', 'idle_threshold', 'no_polite', 'notify',
+                   'verify_window')
+NUMBER = (int, float)
+CONFIG_TYPES = {
+    'text': str, 'cooldown': NUMBER, 'min_interval': NUMBER, 'max_interval': NUMBER,
+    'offset_x': int, 'offset_y': int, 'pyramid_levels': int, 'idle_threshold': NUMBER,
+    'image': (str, dict, list), 'scales': (str, list) + NUMBER, 'inject': str,
+    'capture_backend': str, 'runtime': str, 'workers': (int, type(None)), 'match_processes': int,
+    'metrics_port': (int, type(None)), 'metrics_file': (str, type(None)),
+    'multi': bool, 'no_polite': bool, 'notify': bool,
+    'log_format': str, 'log_dedup': NUMBER, 'grayscale': bool, 'roi_size': int,
+    'state_file': (str, type(None)), 'windows': str, 'verify_window': NUMBER,
+    'checkpoint': (str, type(None)), 'capture_socket': (str, type(None)), 'capture_interval': NUMBER,
+}
+
+# Match worker processes: seconds to wait for a result before restarting the worker
+MATCH_WORKER_TIMEOUT = 10.0
+
+# asyncio runtime: notifications waiting to be shown before new ones are dropped
+NOTIFY_QUEUE_SIZE = 8
+# On exit: how long (s) to wait for the bot thread to finish its cycle and save its state
+BOT_STOP_TIMEOUT = 10.0
+# UI dispatcher: notifications and tray updates waiting before new ones are dropped
+UI_QUEUE_SIZE = 16
+
+# --autotune: candidate settings, and how hard each is measured
+AUTOTUNE_LEVELS = (0, 1, 2, 3)
+AUTOTUNE_ROI_SIZES = (100, 150, 200, 300, 400)
+# The ROI box must be at least this many icon widths across, so small layout shifts stay inside it
+AUTOTUNE_ROI_FIT = 3
+AUTOTUNE_REPEATS = 5
+# A run slower than this (s) is not repeated; it won't be the winner
+AUTOTUNE_SLOW = 0.1
+# The tuned confidence sits this far below the weakest icon score and above the best look-alike
+AUTOTUNE_MARGIN = 0.05
+# Tuned thresholds never go below this, however weak the icon scores
+AUTOTUNE_MIN_SCORE = 0.6
+AUTOTUNE_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# Git checkpoints (--checkpoint): wait this long (s) after a continue so bursts become one commit
+CHECKPOINT_COALESCE = 1.0
+# Give up on a checkpoint that takes longer than this (s)
+CHECKPOINT_TIMEOUT = 60.0
+
+# Post-action verification: watch the icon for this long (s) after Enter, doubling per retry
+VERIFY_WINDOW = 1.5
+VERIFY_BACKOFF = 2.0
+VERIFY_RETRIES = 2
+VERIFY_POLL = 0.1
+# A cycle spends at most this many windows verifying, however many targets it acted on
+VERIFY_BUDGET = 4
+
+# Shared capture daemon (--capture-daemon): at most one capture per this many seconds, however many bots ask
+CAPTURE_DAEMON_INTERVAL = 0.25
+# Frames in the daemon's shared-memory ring
+CAPTURE_DAEMON_SLOTS = 4
+# The frame a bot was last given is not overwritten for this long (s), unless it asks for a newer one
+CAPTURE_PIN_TTL = 5.0
+# Bots without a daemon look for one again this often (s)
+CAPTURE_DAEMON_RETRY = 10.0
+CAPTURE_DAEMON_TIMEOUT = 2.0
+
+# Window discovery (--windows): WM_CLASS names of Cursor windows, lower case
+WINDOW_SOURCES = ('auto', 'x11', 'off')
+CURSOR_WINDOW_CLASSES = ('cursor',)
+# Only this bottom fraction of a Cursor window (the chat input row) is searched
+CHAT_AREA_FRACTION = 0.4
+# Re-list windows at least this often even without window-manager events (s)
+WINDOW_REFRESH_INTERVAL = 5.0
+
+# Detection state kept across restarts
+STATE_FILE = "bot_state.json"
+STATE_VERSION = 1
+# Write the state file at most this often (s), and only when it changed
+STATE_SAVE_INTERVAL = 10.0
+
+# Metrics
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_FILE_INTERVAL = 10.0
+
 # Global state for hotkeys and tray
 bot_paused = True
 bot_running = True
 tray_icon = None
 last_known_mic_pos = None
+last_matched_scale = 1.0
+last_matched_variant = None
+# --grayscale: confirm matches on the grayscale frame instead of color
+match_grayscale = False
+activity_tracker = None
+# What the last process_cycle observed: paused, cooldown, locked, busy, parked, found, acted
+cycle_state = None
+# Set to cut the bot loop's sleep short (pause toggled, quit)
+wake_event = threading.Event()
+# Held while clicking/typing so two injections never interleave
+action_lock = threading.Lock()
+# Registry "Run on Startup" state, read once and refreshed by toggle_run_on_startup
+_startup_enabled = None
+# Rendered tray icons keyed by paused state
+_tray_images = {}
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -55,17 +504,25 @@ def resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
-def is_run_on_startup():
-    """Check if the app is set to run on startup via Registry."""
+def is_run_on_startup(refresh=True):
+    """
+    Check if the app is set to run on startup via Registry.
+    refresh=False answers from the last read, so menu redraws never touch the registry.
+    """
+    global _startup_enabled
+    if _startup_enabled is not None and not refresh:
+        return _startup_enabled
     if not WIN_REG_AVAILABLE:
+        _startup_enabled = False
         return False
     try:
         key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, REG_KEY_PATH, 0, winreg.KEY_READ)
         value, _ = winreg.QueryValueEx(key, APP_NAME)
         winreg.CloseKey(key)
-        return True
+        _startup_enabled = True
     except OSError:
-        return False
+        _startup_enabled = False
+    return _startup_enabled
 
 def toggle_run_on_startup(icon=None, item=None):
     """Toggle the Run on Startup registry key."""
@@ -106,6 +563,8 @@ def toggle_run_on_startup(icon=None, item=None):
         
     except Exception as e:
         logging.error(f"Registry error: {e}")
+    finally:
+        is_run_on_startup()
 
 def create_tray_icon_image(paused):
     # Try to load a custom icon if it exists
@@ -130,12 +589,27 @@ def create_tray_icon_image(paused):
     
     return image
 
+def tray_icon_image(paused):
+    """The tray icon for a paused/running bot, rendered once and then served from memory."""
+    image = _tray_images.get(paused)
+    if image is None:
+        image = _tray_images[paused] = create_tray_icon_image(paused)
+    return image
+
 def update_tray_icon():
-    global tray_icon, bot_paused
+    """Queue a tray icon swap on the UI thread."""
+    if tray_icon:
+        ui_dispatcher.submit(_set_tray_icon, bot_paused)
+
+def _set_tray_icon(paused):
     if tray_icon:
-        tray_icon.icon = create_tray_icon_image(bot_paused)
+        tray_icon.icon = tray_icon_image(paused)
 
 def send_notification(title, message):
+    """Queue a desktop notification; plyer runs on the UI thread, never the caller's."""
+    ui_dispatcher.submit(_show_notification, title, message)
+
+def _show_notification(title, message):
     try:
         notification.notify(
             title=title,
@@ -146,22 +620,387 @@ def send_notification(title, message):
     except Exception as e:
         logging.error(f"Failed to send notification: {e}")
 
+class UiDispatcher:
+    """
+    One daemon thread that runs notifications and tray updates in order.
+    submit() never blocks: when the queue is full the job is dropped, so a hung
+    notification backend can't stall detection or clicking.
+    """
+
+    def __init__(self, maxsize=UI_QUEUE_SIZE):
+        self.jobs = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        self._ensure_started()
+        try:
+            self.jobs.put_nowait((func, args))
+            return True
+        except queue.Full:
+            logging.warning(f"UI queue full, dropping {func.__name__}")
+            return False
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ui-dispatcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                func, args = job
+                try:
+                    func(*args)
+                except Exception as e:
+                    logging.error(f"UI job {func.__name__} failed: {e}")
+            finally:
+                self.jobs.task_done()
+
+    def flush(self):
+        """Block until every queued job has run."""
+        if self._thread is not None and self._thread.is_alive():
+            self.jobs.join()
+
+    def stop(self, timeout=2.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self.jobs.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+ui_dispatcher = UiDispatcher()
+
+class CheckpointError(Exception):
+    """A git command for a checkpoint failed or timed out."""
+
+class Checkpointer:
+    """
+    Background git checkpoints of the agent's working tree (--checkpoint). request()
+    only sets a flag, so the action path never waits on git. The worker commits
+    CHECKPOINT_COALESCE seconds after a request; requests arriving meanwhile or
+    during a commit are merged into the next one, so at most one commit is pending.
+    The index is refreshed first (stat only), so `git add -A` rehashes just the
+    files that changed. Each checkpoint is bounded by `timeout`.
+    """
+
+    def __init__(self, repo, coalesce=CHECKPOINT_COALESCE, timeout=CHECKPOINT_TIMEOUT, clock=time.monotonic):
+        self.repo = repo
+        self.coalesce = coalesce
+        self.timeout = timeout
+        self.clock = clock
+        self.commits = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._requests = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def request(self):
+        """Ask for a checkpoint (never blocks)."""
+        with self._lock:
+            self._requests += 1
+        self._wake.set()
+
+    def _git(self, deadline, *args):
+        remaining = deadline - self.clock()
+        if remaining <= 0:
+            raise CheckpointError("timed out")
+        process = subprocess.Popen(['git', '-C', self.repo] + list(args), stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True)
+        try:
+            out, err = process.communicate(timeout=remaining)
+        except subprocess.TimeoutExpired:
+            # SIGTERM first so git can remove its index.lock
+            process.terminate()
+            try:
+                process.communicate(timeout=2)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+            raise CheckpointError(f"git {args[0]} timed out")
+        return process.returncode, out.strip(), err.strip()
+
+    def commit(self, merged=1):
+        """Commit the working tree. Returns the new commit's short hash, or None if nothing changed."""
+        deadline = self.clock() + self.timeout
+        self._git(deadline, 'update-index', '-q', '--refresh')
+        code, _, err = self._git(deadline, 'add', '-A')
+        if code:
+            raise CheckpointError(f"git add failed: {err}")
+        code, _, _ = self._git(deadline, 'diff', '--cached', '--quiet')
+        if code == 0:
+            return None
+        message = f"Auto-continue checkpoint {time.strftime('%Y-%m-%d %H:%M:%S')}"
+        if merged > 1:
+            message += f" ({merged} continues)"
+        code, _, err = self._git(deadline, 'commit', '-q', '--no-verify', '-m', message)
+        if code:
+            raise CheckpointError(f"git commit failed: {err}")
+        _, sha, _ = self._git(deadline, 'rev-parse', '--short', 'HEAD')
+        return sha
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            if self._stopping.is_set() and not self._requests:
+                return
+            # Let a burst of continues (several windows in one cycle) become one commit
+            self._stopping.wait(self.coalesce)
+            with self._lock:
+                merged, self._requests = self._requests, 0
+                if not self._stopping.is_set():
+                    self._wake.clear()
+            if not merged:
+                continue
+            if merged > 1:
+                metrics.inc('checkpoints_merged', merged - 1)
+            start = self.clock()
+            try:
+                sha = self.commit(merged)
+            except (CheckpointError, OSError) as e:
+                logging.error(f"Checkpoint failed after {self.clock() - start:.2f}s: {e}")
+                metrics.inc('checkpoint_failures')
+                continue
+            elapsed = self.clock() - start
+            metrics.observe('checkpoint', elapsed)
+            if sha is None:
+                logging.info(f"Checkpoint: no changes ({elapsed:.2f}s)")
+                continue
+            self.commits += 1
+            metrics.inc('checkpoints')
+            logging.info(f"Checkpoint {sha} committed in {elapsed:.2f}s"
+                         + (f" ({merged} continues merged)" if merged > 1 else ""))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="checkpoint", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Finish a pending checkpoint (bounded by the timeout) and stop the worker."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(self.timeout)
+        self._thread = None
+
+def create_checkpointer(repo):
+    """Checkpointer for --checkpoint, or None if git or the repository is missing."""
+    if not shutil.which('git'):
+        logging.error("Checkpoints need git on PATH. Checkpoints disabled.")
+        return None
+    result = subprocess.run(['git', '-C', repo, 'rev-parse', '--is-inside-work-tree'],
+                            capture_output=True, text=True, timeout=10)
+    if result.returncode != 0 or result.stdout.strip() != 'true':
+        logging.error(f"Checkpoints: {repo} is not a git working tree. Checkpoints disabled.")
+        return None
+    return Checkpointer(repo)
+
+checkpointer = None
+
+class _Inotify:
+    """Minimal inotify watch on a directory through libc (Linux). Raises OSError where unavailable."""
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch the directory: editors often replace the file instead of writing it in place
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        """Block until something in the directory changes or timeout passes. True if it changed."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+class ConfigWatcher:
+    """
+    Watches config.json and hot-applies changed settings to the running bot.
+    The file is parsed only when its mtime/size change (inotify on Linux, polling
+    elsewhere), validated, and templates are re-decoded on the watcher thread. The
+    result is applied between cycles by apply_pending(), so a cycle never sees half a
+    reload. Flags given on the command line keep overriding the file, as at startup.
+    """
+
+    def __init__(self, path, argv, args, poll_interval=CONFIG_POLL_INTERVAL):
+        self.path = path
+        self.argv = argv
+        self.args = args
+        self.poll_interval = poll_interval
+        self._signature = self._stat()
+        self._lock = threading.Lock()
+        # The watcher thread and the tray menu both call check()
+        self._check_lock = threading.Lock()
+        self._pending = None
+        self._force = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def force(self):
+        """Reload on the next check even if the file looks unchanged (tray menu)."""
+        self._force = True
+
+    def check(self):
+        """Parse and validate the config if it changed. Returns True if a reload is pending."""
+        with self._check_lock:
+            return self._check()
+
+    def _check(self):
+        signature = self._stat()
+        if signature == self._signature and not self._force:
+            return False
+        self._signature = signature
+        self._force = False
+        try:
+            config = {}
+            if signature is not None:
+                with open(self.path, 'r') as f:
+                    config = json.load(f)
+            validate_config(config)
+            new_args = parse_arguments(self.argv, config)
+        except SystemExit:
+            logging.error("Config reload rejected: invalid settings. Keeping the current configuration.")
+            return False
+        except Exception as e:
+            logging.error(f"Config reload rejected: {e}. Keeping the current configuration.")
+            return False
+
+        changes = {key: getattr(new_args, key) for key in HOT_RELOAD_KEYS
+                   if getattr(new_args, key) != getattr(self.args, key, None)}
+        for key, value in vars(new_args).items():
+            if key not in HOT_RELOAD_KEYS and hasattr(self.args, key) and getattr(self.args, key) != value:
+                logging.warning(f"Config: '{key}' changed; restart the bot to apply it.")
+        if not changes:
+            logging.info("Config reloaded: nothing to apply.")
+            return False
+
+        template = None
+        if 'image' in changes:
+            try:
+                template = TemplateSet.load([(resource_path(path), confidence) for path, confidence in changes['image']])
+            except Exception as e:
+                logging.error(f"Config reload rejected: could not load template: {e}")
+                return False
+        with self._lock:
+            self._pending = (changes, template)
+        wake_event.set()
+        return True
+
+    def apply_pending(self, args, mic_image):
+        """Apply a validated reload to the running bot. Returns the names of the changed settings."""
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            return set()
+        changes, template = pending
+        # Not in the middle of clicking/typing
+        with action_lock:
+            if template is not None:
+                mic_image.variants = template.variants
+                mic_image.last_matched = None
+                if match_pool:
+                    match_pool.reload([(v.template.path, v.confidence) for v in template.variants])
+            for key, value in changes.items():
+                setattr(args, key, value)
+        if 'no_polite' in changes:
+            set_polite_tracking(not args.no_polite)
+        self.args = args
+        logging.info(f"Config reloaded: {', '.join(sorted(changes))}")
+        return set(changes)
+
+    def _run(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            inotify = _Inotify(directory)
+        except (OSError, AttributeError) as e:
+            logging.info(f"Watching {self.path} by polling ({e})")
+            inotify = None
+        try:
+            while not self._stop.is_set():
+                if inotify:
+                    # The timeout keeps forced reloads and missed events bounded
+                    inotify.wait(self.poll_interval)
+                else:
+                    self._stop.wait(self.poll_interval)
+                try:
+                    self.check()
+                except Exception as e:
+                    logging.error(f"Error checking config file: {e}")
+        finally:
+            if inotify:
+                inotify.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="config-watcher")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+config_watcher = None
+
+def reload_config(icon=None, item=None):
+    """Tray menu: re-read config.json now."""
+    if config_watcher:
+        logging.info(">>> Config reload requested <<<")
+        config_watcher.force()
+        if config_watcher.check():
+            logging.info("Config will be applied before the next scan.")
+
 def toggle_pause(icon=None, item=None):
     global bot_paused
     bot_paused = not bot_paused
     state = "PAUSED" if bot_paused else "RESUMED"
     logging.info(f">>> Bot {state} by user <<<")
     update_tray_icon()
+    wake_event.set()
 
 def quit_app(icon=None, item=None):
     global bot_running, tray_icon
     logging.info(">>> Quit signal received. Stopping... <<<")
     bot_running = False
+    wake_event.set()
     if tray_icon:
         tray_icon.stop()
 
 def on_press(key):
     global bot_paused, bot_running
+    if activity_tracker:
+        activity_tracker.on_input()
     try:
         if key == keyboard.Key.f8:
             toggle_pause()
@@ -176,6 +1015,68 @@ def start_hotkey_listener():
     listener.start()
     return listener
 
+class ActivityTracker:
+    """
+    Remembers when the user last touched the mouse or keyboard.
+    Fed by a pynput mouse listener and the hotkey keyboard listener, so
+    "idle for N seconds?" is a timestamp comparison instead of a sleep.
+    Input generated by the bot itself is ignored.
+    """
+
+    def __init__(self):
+        self.last_input = time.monotonic()
+        self._synthetic_depth = 0
+        self._ignore_until = 0.0
+        self._listener = None
+
+    def on_input(self, *args):
+        now = time.monotonic()
+        if self._synthetic_depth or now < self._ignore_until:
+            return
+        self.last_input = now
+
+    def idle_seconds(self):
+        return time.monotonic() - self.last_input
+
+    def idle_for(self, seconds):
+        return self.idle_seconds() >= seconds
+
+    def synthetic_input(self):
+        """Context manager marking input generated by the bot."""
+        tracker = self
+
+        class _Synthetic:
+            def __enter__(self):
+                tracker._synthetic_depth += 1
+
+            def __exit__(self, *exc):
+                tracker._synthetic_depth -= 1
+                tracker._ignore_until = time.monotonic() + SYNTHETIC_INPUT_GRACE
+                return False
+
+        return _Synthetic()
+
+    def start(self):
+        self._listener = mouse.Listener(on_move=self.on_input, on_click=self.on_input, on_scroll=self.on_input)
+        self._listener.start()
+
+    def stop(self):
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+
+def set_polite_tracking(enabled):
+    """Start or stop the input listener when polite mode is switched on or off at runtime."""
+    global activity_tracker
+    if enabled and activity_tracker is None:
+        activity_tracker = ActivityTracker()
+        activity_tracker.start()
+        logging.info("Polite mode on: watching mouse input.")
+    elif not enabled and activity_tracker is not None:
+        tracker, activity_tracker = activity_tracker, None
+        tracker.stop()
+        logging.info("Polite mode off: stopped watching mouse input.")
+
 def load_config():
     """Load configuration from JSON file if it exists."""
     config_path = resource_path(CONFIG_FILE)
@@ -197,16 +1098,71 @@ def save_config(config_data):
     except Exception as e:
         logging.error(f"Error saving config file: {e}")
 
-def parse_arguments():
+def validate_config(config):
+    """Raise ValueError if config.json has settings of the wrong type or out of range."""
+    if not isinstance(config, dict):
+        raise ValueError("config must be a JSON object")
+    for key, value in config.items():
+        expected = CONFIG_TYPES.get(key)
+        if expected is None:
+            continue
+        allowed = expected if isinstance(expected, tuple) else (expected,)
+        # bool is an int subclass, but "cooldown": true is a mistake
+        if not isinstance(value, allowed) or (isinstance(value, bool) and bool not in allowed):
+            raise ValueError(f"{key}: unexpected value {value!r}")
+    # 0 pyramid levels searches at full size only, 0 match processes matches in the bot process
+    for key in ('cooldown', 'idle_threshold', 'log_dedup', 'verify_window', 'capture_interval',
+                'pyramid_levels', 'match_processes'):
+        if config.get(key, 0) < 0:
+            raise ValueError(f"{key} must not be negative")
+    for key in ('min_interval', 'max_interval', 'roi_size'):
+        if key in config and config[key] <= 0:
+            raise ValueError(f"{key} must be positive")
+    if config.get('inject', 'auto') not in INJECT_METHODS:
+        raise ValueError(f"inject must be one of {', '.join(INJECT_METHODS)}")
+    if config.get('windows', 'auto') not in WINDOW_SOURCES:
+        raise ValueError(f"windows must be one of {', '.join(WINDOW_SOURCES)}")
+    if config.get('log_format', 'text') not in LOG_FORMATS:
+        raise ValueError(f"log_format must be one of {', '.join(LOG_FORMATS)}")
+
+def parse_arguments(argv=None, config=None):
     # Load defaults from config file
-    config = load_config()
+    if config is None:
+        config = load_config()
     
     parser = argparse.ArgumentParser(description="Cursor Auto-Continue Bot")
     parser.add_argument("--text", type=str, default=config.get("text", DEFAULT_TEXT), help="Text to type into the chat")
     parser.add_argument("--cooldown", type=float, default=config.get("cooldown", 15.0), help="Cooldown in seconds between actions")
+    parser.add_argument("--verify-window", type=float, default=config.get("verify_window", VERIFY_WINDOW), help="After sending, watch this many seconds for the agent to start; retry if it didn't, end the cooldown if it did (0 = off)")
+    parser.add_argument("--min-interval", type=float, default=config.get("min_interval", DEFAULT_MIN_INTERVAL), help="Shortest delay between scans in seconds")
+    parser.add_argument("--max-interval", type=float, default=config.get("max_interval", DEFAULT_MAX_INTERVAL), help="Longest delay between scans while the agent is busy")
     parser.add_argument("--offset-x", type=int, default=config.get("offset_x", -200), help="X offset from microphone icon to click")
     parser.add_argument("--offset-y", type=int, default=config.get("offset_y", -50), help="Y offset from microphone icon to click")
-    parser.add_argument("--image", type=str, default=config.get("image", "microphone_icon.png"), help="Path to the microphone icon image")
+    image_default = config.get("image", "microphone_icon.png")
+    if not isinstance(image_default, list):
+        image_default = [image_default]
+    parser.add_argument("--image", type=parse_image_spec, nargs='+', default=[parse_image_spec(v) for v in image_default], help="Microphone icon image(s), e.g. light.png dark.png@0.9 (optional per-image confidence)")
+    parser.add_argument("--scales", type=parse_scales, default=parse_scales(config.get("scales", [1.0])), help="Comma-separated display scales to try, e.g. 1,1.25,1.5,2")
+    parser.add_argument("--pyramid-levels", type=int, default=config.get("pyramid_levels", 2), help="Downscale levels (factor 2 each) for the coarse full-screen search")
+    parser.add_argument("--grayscale", action="store_true", default=config.get("grayscale", False), help="Confirm matches in grayscale instead of color (faster, slightly less selective)")
+    parser.add_argument("--roi-size", type=int, default=config.get("roi_size", ROI_SIZE), help="Side of the box searched around the last known icon position (px)")
+    parser.add_argument("--capture-backend", choices=['auto', 'shared'] + sorted(CAPTURE_BACKENDS), default=config.get("capture_backend", "auto"), help="Screen capture backend (auto prefers mss; shared reads frames from a --capture-daemon)")
+    parser.add_argument("--capture-socket", type=str, default=config.get("capture_socket", None), metavar="PATH", help="Unix socket of the capture daemon (default: in $XDG_RUNTIME_DIR, else in a private directory in the temp directory)")
+    parser.add_argument("--capture-interval", type=float, default=config.get("capture_interval", CAPTURE_DAEMON_INTERVAL), metavar="SECONDS", help="Capture daemon: capture at most once per this many seconds, shared by all bots")
+    parser.add_argument("--inject", choices=INJECT_METHODS, default=config.get("inject", "auto"), help="How to enter the text: clipboard paste, bulk typing or per-character typing (auto = fastest available)")
+    multi_default = config.get("multi", False)
+    parser.add_argument("--multi", action="store_true", default=multi_default, help="Keep every Cursor window on every monitor busy, each with its own cooldown")
+    parser.add_argument("--workers", type=int, default=config.get("workers", None), help="Scan threads for multi-target mode (default: CPU count)")
+    parser.add_argument("--match-processes", type=int, default=config.get("match_processes", 0), help="Run template matching in N worker processes (0 = in the bot process)")
+    parser.add_argument("--runtime", choices=['thread', 'asyncio'], default=config.get("runtime", "thread"), help="Bot loop: one thread doing everything in series, or an asyncio pipeline that matches the next frame while an action is delivered")
+    parser.add_argument("--metrics-port", type=int, default=config.get("metrics_port", None), help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", type=str, default=config.get("metrics_file", None), help="Periodically rewrite this file with Prometheus-format metrics")
+    parser.add_argument("--log-format", choices=LOG_FORMATS, default=config.get("log_format", "text"), help="bot.log/console format: plain text or JSON lines with cycle ids and stage durations")
+    parser.add_argument("--log-dedup", type=float, default=config.get("log_dedup", LOG_DEDUP_INTERVAL), metavar="SECONDS", help="Collapse identical warnings/errors repeated within this window into one summary line (0 = off)")
+    parser.add_argument("--windows", choices=WINDOW_SOURCES, default=config.get("windows", "auto"), help="Search only the chat area of Cursor windows found through the window manager (auto = X11 when available)")
+    parser.add_argument("--checkpoint", type=str, default=config.get("checkpoint", None), metavar="REPO", help="git-commit the agent's working tree REPO in the background after each continue")
+    parser.add_argument("--state-file", type=str, default=config.get("state_file", STATE_FILE), help="Remember icon positions, variant and scale here across restarts (empty = don't)")
+    parser.add_argument("--virtual-screen", type=str, default=None, metavar="SCENE", help="Run against an in-memory screen (an image, or a JSON agent scene) instead of the desktop")
     parser.add_argument("--dry-run", action="store_true", help="Simulate actions without clicking or typing")
     
     # Handle boolean flags correctly when loading from config
@@ -214,27 +1170,37 @@ def parse_arguments():
     parser.add_argument("--no-polite", action="store_true", default=no_polite_default, help="Disable polite mode (user activity detection)")
     
     notify_default = config.get("notify", False)
+    parser.add_argument("--idle-threshold", type=float, default=config.get("idle_threshold", DEFAULT_IDLE_THRESHOLD), help="Polite mode: seconds without mouse/keyboard input before acting")
     parser.add_argument("--notify", action="store_true", default=notify_default, help="Send system notification when action is taken")
     
     parser.add_argument("--calibrate", action="store_true", help="Run interactive calibration wizard to find offsets")
-    parser.add_argument("--once", action="store_true", help="Run once and exit immediately after action (or if image not found)")
+    parser.add_argument("--autotune", nargs='?', const='', default=None, metavar="SCREENSHOTS", help="Benchmark matcher settings on the current screen (or a folder of screenshots) and save the fastest reliable ones to config.json")
+    parser.add_argument("--capture-daemon", action="store_true", help="Serve screen captures to the bots on this desktop (--capture-backend shared) instead of running a bot")
+    parser.add_argument("--once", action="store_true", help="Exit after the first successful action")
+    parser.add_argument("--scan-once", action="store_true", help="Scan once, act if the agent is idle and the cooldown has passed, and exit. Starts unpaused, with no tray, hotkeys or listeners (for cron/hooks)")
     parser.add_argument("--background", action="store_true", help="Running in background mode (suppress some outputs/console logic if needed)")
     
     # Allow overriding config with explicit flags
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 def is_user_active(check_duration=0.5, threshold=5):
     """
     Checks if the user is moving the mouse.
     Returns True if mouse moved more than threshold pixels in check_duration.
     """
-    x1, y1 = pyautogui.position()
+    x1, y1 = screen_driver.position()
     time.sleep(check_duration)
-    x2, y2 = pyautogui.position()
+    x2, y2 = screen_driver.position()
     
     distance = ((x2 - x1)**2 + (y2 - y1)**2)**0.5
     return distance > threshold
 
+def user_is_active(idle_threshold):
+    """Polite-mode check. Uses the activity tracker when running, else samples the mouse."""
+    if activity_tracker is not None:
+        return not activity_tracker.idle_for(idle_threshold)
+    return is_user_active()
+
 def run_calibration():
     print("=== Calibration Wizard ===")
     print("This tool will help you calculate the correct X and Y offsets.")
@@ -270,210 +1236,3159 @@ def run_calibration():
         print(f"   python auto_continue_bot.py --offset-x {offset_x} --offset-y {offset_y}")
     print("======================")
 
-def process_cycle(args, mic_image, last_action_time):
+class Metrics:
     """
-    Runs one cycle of scanning and action.
-    Returns (updated_last_action_time, action_taken_bool)
+    Hot-path counters, gauges and per-stage latency histograms, rendered in the
+    Prometheus text format for the metrics endpoint or metrics file.
     """
-    global bot_paused, last_known_mic_pos
-    
-    if bot_paused:
-        time.sleep(1)
-        return last_action_time, False
 
-    current_time = time.time()
-    
-    # Only check if cooldown has passed
-    if current_time - last_action_time < args.cooldown:
-        return last_action_time, False
+    def __init__(self, clock=time.perf_counter, buckets=STAGE_BUCKETS):
+        self.clock = clock
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.stages = {}  # stage -> [bucket counts..., sum, count]
 
-    mic_location = None
-    
-    # 1. Try Region of Interest (ROI) if we have a last known location
-    if last_known_mic_pos:
-        try:
-            # Define region around last pos: (left, top, width, height)
-            roi_size = 200
-            left = max(0, int(last_known_mic_pos.x - roi_size/2))
-            top = max(0, int(last_known_mic_pos.y - roi_size/2))
-            
-            mic_location = pyautogui.locateCenterOnScreen(mic_image, region=(left, top, roi_size, roi_size), confidence=0.95, grayscale=False)
-            if mic_location:
-                pass
-        except Exception:
-            pass
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
 
-    # 2. Fallback to Full Screen if not found in ROI
-    if not mic_location:
-        try:
-            mic_location = pyautogui.locateCenterOnScreen(mic_image, confidence=0.95, grayscale=False)
-        except pyautogui.ImageNotFoundException:
-                pass
-        except Exception as e:
-            if "ImageNotFoundException" in str(type(e)):
-                    pass
-            else:
-                logging.error(f"Error searching for image: {e}")
+    def set(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
 
-    if mic_location:
-        logging.info(f"Microphone detected at {mic_location}. Agent is idle.")
-        last_known_mic_pos = mic_location 
-        
-        # Polite mode check
-        if not args.no_polite:
-            logging.info("Checking for user activity...")
-            if is_user_active():
-                logging.warning("User activity detected (mouse moving). Skipping this cycle to be polite.")
-                return last_action_time, False
-        
-        try:
-            # Save current mouse position to restore later
-            original_mouse_x, original_mouse_y = pyautogui.position()
-            logging.info(f"Saved mouse position: ({original_mouse_x}, {original_mouse_y})")
-            
-            target_x = mic_location.x + args.offset_x
-            target_y = mic_location.y + args.offset_y
-            
-            logging.info(f"Target coordinates: ({target_x}, {target_y})")
-            
-            if args.dry_run:
-                logging.info("[DRY RUN] Moving to target...")
-                pyautogui.moveTo(target_x, target_y)
-                time.sleep(1)
-                logging.info("[DRY RUN] Would click and type here.")
-                pyautogui.moveRel(10, 0)
-                pyautogui.moveRel(-20, 0)
-                pyautogui.moveRel(10, 0)
-            else:
-                logging.info(f"Clicking at target...")
-                # Focus the chat input
-                pyautogui.click(target_x, target_y)
-                
-                # Small delay to ensure focus
-                time.sleep(0.3)
-                
-                # Type text and press Enter
-                logging.info("Typing text...")
-                pyautogui.write(args.text, interval=0.02)
-                logging.info("Pressing Enter...")
-                pyautogui.press('enter')
-                
-                logging.info("Sent 'continue'.")
-                last_action_time = time.time()
-                
-                if args.notify:
-                    send_notification("Cursor Auto-Continue", "Sent 'continue' command.")
-
-            # Restore mouse position
-            logging.info(f"Restoring mouse to: ({original_mouse_x}, {original_mouse_y})")
-            pyautogui.moveTo(original_mouse_x, original_mouse_y)
-            
-            return (last_action_time if args.dry_run else time.time()), True
-            
-        except Exception as e:
-            logging.error(f"Error performing action: {e}")
-            return last_action_time, False
-    else:
-        pass
-        
-    return last_action_time, False
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
 
-def bot_loop(args, mic_image):
-    """Thread function for the main bot logic"""
-    global bot_running
-    last_action_time = 0
-    logging.info("Starting background bot thread...")
-    
-    while bot_running:
+    @contextlib.contextmanager
+    def time(self, stage):
+        """Record how long the block takes, even if it raises."""
+        start = self.clock()
         try:
-            last_action_time, action_taken = process_cycle(args, mic_image, last_action_time)
-            
-            if args.once:
-                if action_taken:
-                    logging.info("Action taken. Exiting (--once mode).")
-                    quit_app()
-                    break
-            
-            time.sleep(2)
-        except Exception as e:
-            logging.error(f"Error in bot loop: {e}")
-            time.sleep(5) 
+            yield
+        finally:
+            seconds = self.clock() - start
+            self.observe(stage, seconds)
+            cycle_log.record(stage, seconds)
 
-def validate_image(image_path):
-    """Ensure image file exists and is readable."""
-    if not os.path.exists(image_path):
-        logging.error(f"Image file not found: {image_path}")
-        return False
-    try:
-        with Image.open(image_path) as img:
-            img.verify() # Verify it's a valid image
-        return True
-    except (IOError, SyntaxError, UnidentifiedImageError) as e:
-        logging.error(f"Invalid image file '{image_path}': {e}")
-        return False
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted(self.counters):
+                lines.append(f"# TYPE bot_{name}_total counter")
+                lines.append(f"bot_{name}_total {self.counters[name]}")
+            for name in sorted(self.gauges):
+                lines.append(f"# TYPE bot_{name} gauge")
+                lines.append(f"bot_{name} {self.gauges[name]:g}")
+            if self.stages:
+                lines.append("# HELP bot_stage_seconds Time spent in each hot-path stage")
+                lines.append("# TYPE bot_stage_seconds histogram")
+            for stage in sorted(self.stages):
+                histogram = self.stages[stage]
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f'bot_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {count}')
+                lines.append(f'bot_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram[-1]}')
+                lines.append(f'bot_stage_seconds_sum{{stage="{stage}"}} {histogram[-2]:.6f}')
+                lines.append(f'bot_stage_seconds_count{{stage="{stage}"}} {histogram[-1]}')
+        return "\n".join(lines) + "\n"
 
-def main():
-    global tray_icon
-    args = parse_arguments()
+metrics = Metrics()
 
-    if args.calibrate:
-        run_calibration()
-        return
-    
-    logging.info("=== Cursor Auto-Continue Bot ===")
-    
-    logging.info(f"Configuration: Cooldown={args.cooldown}s, Notifications={args.notify}, Once={args.once}, Background={args.background}")
-    if args.dry_run:
-        logging.info("Mode: DRY RUN (No clicks/typing)")
-    
-    mic_image = resource_path(args.image)
-    if not validate_image(mic_image):
-        print(f"Error: Invalid or missing image file: {mic_image}")
-        return
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serve /metrics (Prometheus text format) on localhost from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-    if args.once:
-        logging.info("Mode: ONCE (Will exit after first successful action)")
-    else:
-        logging.info("Hotkeys: [F8] Pause/Resume | [F9] Quit")
-    
-    logging.info(f"Logging to {os.path.abspath(LOG_FILE)}")
-    
-    # Start Hotkey Listener
-    listener = start_hotkey_listener()
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
 
-    # Start Bot Thread
-    bot_thread = threading.Thread(target=bot_loop, args=(args, mic_image), daemon=True)
-    bot_thread.start()
+        def log_message(self, format, *args):
+            pass
 
-    # Start Tray Icon (blocks main thread)
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    logging.info(f"Metrics endpoint: http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+def write_atomic(path, text, prefix='.tmp-'):
+    """Replace `path` with `text` via a temporary file, so readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix)
     try:
-        def get_startup_checked(item):
-            return is_run_on_startup()
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
 
-        menu = pystray.Menu(
-            pystray.MenuItem("Cursor Auto-Bot", None, enabled=False),
+def write_metrics_file(path):
+    """Atomically replace `path` with the current metrics."""
+    write_atomic(path, metrics.render(), prefix='.metrics-')
+
+def start_metrics_file_writer(path, interval=METRICS_FILE_INTERVAL):
+    """Rewrite the metrics file every `interval` seconds from a daemon thread."""
+    def writer():
+        while bot_running:
+            try:
+                write_metrics_file(path)
+            except Exception as e:
+                logging.error(f"Error writing metrics file: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=writer, daemon=True, name="metrics-file").start()
+    logging.info(f"Writing metrics to {os.path.abspath(path)} every {interval:g}s")
+
+class TemplateCache:
+    """
+    Decoded microphone template, kept in the forms the matcher needs.
+    The image is re-decoded only when the file's mtime changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.color = None
+        self.gray = None
+        self._scaled = {}
+        self.load()
+
+    def load(self):
+        """Decode the template from disk."""
+        mtime = os.path.getmtime(self.path)
+        # imdecode instead of imread so non-ASCII paths work on Windows
+        data = np.fromfile(self.path, dtype=np.uint8)
+        color = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if color is None:
+            raise ValueError(f"Could not decode template image: {self.path}")
+        gray = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+        self.color = color
+        self.gray = gray
+        self.mtime = mtime
+        self._scaled = {}
+        logging.info(f"Template loaded: {self.path} ({color.shape[1]}x{color.shape[0]})")
+
+    def refresh(self):
+        """Reload the template if the file changed on disk. Keeps the last good copy on errors."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logging.error(f"Cannot stat template image: {e}")
+            return
+        if mtime == self.mtime:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            # Remember the mtime so a broken file is not re-decoded every cycle
+            self.mtime = mtime
+            logging.error(f"Error reloading template image: {e}")
+
+    def get(self, grayscale=False):
+        """Return the decoded template as a BGR (or grayscale) NumPy array."""
+        self.refresh()
+        return self.gray if grayscale else self.color
+
+    def scaled(self, scale, grayscale=False):
+        """Return the template resized by `scale` (e.g. 1.25 for 125% display scaling), cached per scale."""
+        if scale == 1.0:
+            return self.get(grayscale)
+        self.refresh()
+        key = (scale, grayscale)
+        if key not in self._scaled:
+            base = self.gray if grayscale else self.color
+            width = max(1, int(round(base.shape[1] * scale)))
+            height = max(1, int(round(base.shape[0] * scale)))
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+            self._scaled[key] = cv2.resize(base, (width, height), interpolation=interpolation)
+        return self._scaled[key]
+
+class TemplateSet:
+    """
+    Several icon templates (themes, hover states) matched together against one frame.
+    Each variant can have its own confidence threshold. The last matched variant is tried
+    first, and a single-icon search stops at the first variant that confirms a match.
+    """
+
+    def __init__(self, variants):
+        self.variants = list(variants)
+        self.last_matched = None
+
+    @classmethod
+    def load(cls, specs):
+        """Build from (path, confidence) pairs; confidence None means MATCH_CONFIDENCE."""
+        specs = list(specs)
+        names = _variant_names([path for path, _ in specs])
+        return cls([TemplateVariant(name, TemplateCache(path), MATCH_CONFIDENCE if confidence is None else confidence)
+                    for name, (path, confidence) in zip(names, specs)])
+
+    @property
+    def mtime(self):
+        return tuple(v.template.mtime for v in self.variants)
+
+    def ordered(self):
+        """Variants with the last matched one first."""
+        return sorted(self.variants, key=lambda v: v.name != self.last_matched)
+
+def _variant_names(paths):
+    """
+    Variant names: the file name without its extension, or, where two templates
+    share a file name (dark/icon.png, light/icon.png), the path below their common folder.
+    """
+    full = [os.path.abspath(path) for path in paths]
+    if len(set(full)) < len(full):
+        raise ValueError(f"Template listed more than once: {', '.join(sorted({p for p in paths if full.count(os.path.abspath(p)) > 1}))}")
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    if len(set(names)) == len(names):
+        return names
+    root = os.path.commonpath(full)
+    return [os.path.relpath(path, root).replace(os.sep, '/') for path in full]
+
+def parse_image_spec(value):
+    """
+    Parse a template given as "path", "path@0.9" (CLI) or {"path": ..., "confidence": ...} (config).
+    Returns (path, confidence or None).
+    """
+    if isinstance(value, dict):
+        return value["path"], value.get("confidence")
+    path, sep, tail = value.rpartition('@')
+    if sep:
+        try:
+            return path, float(tail)
+        except ValueError:
+            pass
+    return value, None
+
+def _variants(template, confidence):
+    if isinstance(template, TemplateSet):
+        return template.ordered()
+    return [TemplateVariant(None, template, confidence)]
+
+def parse_scales(value):
+    """Parse display scales given as "1,1.25,1.5" (CLI), or a list or single number (config)."""
+    if isinstance(value, str):
+        value = [v for v in value.split(',') if v.strip()]
+    elif isinstance(value, NUMBER):
+        value = [value]
+    scales = [float(v) for v in value]
+    if not scales or any(v <= 0 for v in scales):
+        raise argparse.ArgumentTypeError(f"Invalid scales: {value}")
+    return scales
+
+class CaptureBackend:
+    """
+    Grabs screen regions as BGR NumPy arrays.
+    Frames are written into preallocated buffers that are reused per size and thread,
+    so a returned frame is only valid until the next grab of the same size.
+    """
+    name = None
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _buffer(self, width, height):
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buffer = buffers.get((width, height))
+        if buffer is None:
+            buffer = buffers[(width, height)] = np.empty((height, width, 3), dtype=np.uint8)
+        return buffer
+
+    def screen_region(self):
+        """(left, top, width, height) of the area searched by the full-screen fallback."""
+        raise NotImplementedError
+
+    def monitor_regions(self):
+        """One region per monitor, for searching monitors in parallel."""
+        return [self.screen_region()]
+
+    def grab(self, region, out=None):
+        """Grab a region into `out` if given, else into the reused buffer for its size."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class PyscreezeCapture(CaptureBackend):
+    """pyautogui/pyscreeze screenshots. Always available; captures the primary screen."""
+    name = 'pyscreeze'
+
+    def screen_region(self):
+        width, height = pyautogui.size()
+        return (0, 0, width, height)
+
+    def grab(self, region, out=None):
+        rgb = np.asarray(pyautogui.screenshot(region=region))
+        buffer = self._buffer(rgb.shape[1], rgb.shape[0]) if out is None else out
+        cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR, dst=buffer)
+        return buffer
+
+class MssCapture(CaptureBackend):
+    """mss screenshots: grabs only the requested rectangle and covers all monitors."""
+    name = 'mss'
+
+    def _sct(self):
+        # mss instances must not be shared between threads
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._local.sct = mss.mss()
+        return sct
+
+    def screen_region(self):
+        monitor = self._sct().monitors[0]
+        return (monitor['left'], monitor['top'], monitor['width'], monitor['height'])
+
+    def monitor_regions(self):
+        # monitors[0] is the union of all monitors
+        return [(m['left'], m['top'], m['width'], m['height']) for m in self._sct().monitors[1:]]
+
+    def grab(self, region, out=None):
+        left, top, width, height = region
+        shot = self._sct().grab({'left': left, 'top': top, 'width': width, 'height': height})
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        buffer = self._buffer(shot.width, shot.height) if out is None else out
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=buffer)
+        return buffer
+
+    def close(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+CAPTURE_BACKENDS = {
+    'pyscreeze': PyscreezeCapture,
+    'mss': MssCapture,
+}
+
+def create_capture_backend(name, socket_path=None):
+    """Create the named capture backend. 'auto' prefers mss and falls back to pyscreeze."""
+    if name == 'shared':
+        if hasattr(socket, 'AF_UNIX'):
+            return SharedCapture(socket_path)
+        logging.warning("Shared capture needs Unix sockets, which this Python lacks. Capturing locally.")
+        name = 'auto'
+    if name == 'auto':
+        name = 'mss' if MSS_AVAILABLE else 'pyscreeze'
+    if name == 'mss' and not MSS_AVAILABLE:
+        logging.warning("mss is not installed (pip install mss). Falling back to pyscreeze capture.")
+        name = 'pyscreeze'
+    if name not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown capture backend: {name}")
+    return CAPTURE_BACKENDS[name]()
+
+capture_backend = PyscreezeCapture()
+
+def capture_screen(region=None):
+    """Grab a (left, top, width, height) region, or the full-screen search area, as a BGR NumPy array."""
+    if region is None:
+        region = capture_backend.screen_region()
+    return capture_backend.grab(region)
+
+def default_capture_socket():
+    """
+    Per-user path of the capture daemon's socket: in $XDG_RUNTIME_DIR, else in a
+    private directory under the temp directory, so other users can't take the name.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "cursor-capture.sock")
+    user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+    return os.path.join(tempfile.gettempdir(), f"cursor-capture-{user}", "capture.sock")
+
+def prepare_socket_dir(path):
+    """Create the socket's directory (owner only) if needed; refuse one other users can write to."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, 'getuid'):
+        return
+    info = os.stat(directory)
+    # Root-owned sticky directories such as /tmp are fine: nobody can replace our entries
+    if info.st_uid not in (os.getuid(), 0) or (info.st_mode & 0o022 and not info.st_mode & stat.S_ISVTX):
+        raise PermissionError(f"{directory} is not private: another user could replace the capture socket")
+
+def check_socket_owner(path):
+    """Raise PermissionError unless the socket at `path` was created by this user."""
+    if hasattr(os, 'getuid'):
+        owner = os.stat(path).st_uid
+        if owner != os.getuid():
+            raise PermissionError(f"{path} belongs to uid {owner}")
+
+def check_peer(sock):
+    """Raise PermissionError unless the other end of a Unix socket runs as this user (Linux SO_PEERCRED)."""
+    if not hasattr(socket, 'SO_PEERCRED') or not hasattr(os, 'getuid'):
+        return
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    if uid != os.getuid():
+        raise PermissionError(f"peer runs as uid {uid}")
+
+def attach_shared_memory(name):
+    """Open another process's segment without letting our resource tracker unlink it at exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 always tracks
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+class CaptureDaemon:
+    """
+    Screen capture shared by several bots on one desktop (--capture-daemon). Frames are
+    grabbed only when a bot asks, at most once per `interval`, straight into a ring of
+    shared-memory slots; bots connect over a Unix socket and read the frames in place.
+    Each connection pins the slot it was last given, and a pinned slot is not
+    overwritten for `pin_ttl` seconds, so a frame stays intact while a bot matches it.
+    Capture cost depends on the interval, not on the number of bots.
+    """
+
+    def __init__(self, backend, path, interval=CAPTURE_DAEMON_INTERVAL, slots=CAPTURE_DAEMON_SLOTS,
+                 pin_ttl=CAPTURE_PIN_TTL, clock=time.monotonic):
+        self.backend = backend
+        self.path = path
+        self.interval = interval
+        self.slots = max(2, slots)
+        self.pin_ttl = pin_ttl
+        self.clock = clock
+        self.captures = 0
+        self.clients = 0
+        self._lock = threading.Lock()
+        # mss instances belong to one thread, so every capture runs on this one
+        self._grabber = ThreadPoolExecutor(1, thread_name_prefix="capture")
+        self._shm = None
+        self._ring = None
+        self._screen = None
+        self._monitors = None
+        self._frame_ids = [0] * self.slots
+        self._frame_times = [0.0] * self.slots
+        self._last_id = 0
+        self._newest = None
+        self._pins = {}  # client -> (slot, time)
+        self._connections = set()
+        self._next_client = 0
+        self._server = None
+        self._stopping = threading.Event()
+
+    def _allocate(self, screen):
+        self._release()
+        _, _, width, height = screen
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * width * height * 3)
+        self._ring = np.ndarray((self.slots, height, width, 3), dtype=np.uint8, buffer=self._shm.buf)
+        self._screen = screen
+        self._frame_ids = [0] * self.slots
+        self._newest = None
+        # Bots keep their old mapping until they see the new segment name
+        self._pins.clear()
+        logging.info(f"Capture daemon: sharing {width}x{height} frames in {self.slots} slots ({self._shm.name})")
+
+    def _release(self):
+        if self._shm is not None:
+            self._ring = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def _free_slot(self):
+        now = self.clock()
+        pinned = {slot for slot, since in self._pins.values() if now - since < self.pin_ttl}
+        free = [i for i in range(self.slots) if i != self._newest and i not in pinned]
+        return min(free, key=lambda i: self._frame_ids[i]) if free else None
+
+    def _capture(self):
+        screen = tuple(self._grabber.submit(self.backend.screen_region).result())
+        if screen != self._screen:
+            self._allocate(screen)
+            self._monitors = [list(r) for r in self._grabber.submit(self.backend.monitor_regions).result()]
+        slot = self._free_slot()
+        if slot is None:
+            # Every other slot is still being read: serve the newest frame again
+            metrics.inc('capture_daemon_stalls')
+            return
+        with metrics.time('daemon_capture'):
+            self._grabber.submit(self.backend.grab, screen, self._ring[slot]).result()
+        self._last_id += 1
+        self._frame_ids[slot], self._frame_times[slot] = self._last_id, self.clock()
+        self._newest = slot
+        self.captures += 1
+
+    def frame(self, client):
+        """Where the current frame is, capturing a new one if the newest is older than the interval."""
+        with self._lock:
+            now = self.clock()
+            if self._newest is None or now - self._frame_times[self._newest] >= self.interval:
+                self._capture()
+            slot = self._newest
+            self._pins[client] = (slot, now)
+            return {'shm': self._shm.name, 'shape': list(self._ring.shape), 'slot': slot,
+                    'frame': self._frame_ids[slot], 'age': round(now - self._frame_times[slot], 3),
+                    'screen': list(self._screen), 'monitors': self._monitors}
+
+    def _listen(self):
+        prepare_socket_dir(self.path)
+        if os.path.exists(self.path):
+            check_socket_owner(self.path)
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                # Left over from a daemon that did not exit cleanly
+                os.unlink(self.path)
+            else:
+                raise OSError(f"a capture daemon is already listening on {self.path}")
+            finally:
+                probe.close()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # The socket hands out screen contents: owner only
+        umask = os.umask(0o177)
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(umask)
+        server.listen()
+        server.settimeout(0.5)
+        return server
+
+    def _handle(self, conn, client):
+        with self._lock:
+            self.clients += 1
+            self._connections.add(conn)
+        logging.info(f"Capture daemon: bot connected ({self.clients} attached)")
+        try:
+            with conn, conn.makefile('rb') as reader:
+                for line in reader:
+                    if line.strip() != b'frame':
+                        break
+                    try:
+                        reply = self.frame(client)
+                    except Exception as e:
+                        logging.warning(f"Capture daemon: capture failed: {e}")
+                        reply = {'error': str(e)}
+                    conn.sendall(json.dumps(reply).encode() + b'\n')
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._pins.pop(client, None)
+                self._connections.discard(conn)
+                self.clients -= 1
+            logging.info(f"Capture daemon: bot disconnected ({self.clients} attached)")
+
+    def serve(self):
+        """Answer bots until stop() (blocks)."""
+        self._server = self._listen()
+        logging.info(f"Capture daemon listening on {self.path} (at most one capture per {self.interval:g}s)")
+        while not self._stopping.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                check_peer(conn)
+            except PermissionError as e:
+                logging.warning(f"Capture daemon: refused a connection ({e})")
+                conn.close()
+                continue
+            conn.settimeout(None)
+            self._next_client += 1
+            threading.Thread(target=self._handle, args=(conn, self._next_client), daemon=True,
+                             name=f"capture-client-{self._next_client}").start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def close(self):
+        """Stop serving, disconnect the bots (they fall back to local capture) and free the ring."""
+        if self._stopping.is_set() and self._server is None:
+            return
+        self.stop()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            with contextlib.suppress(OSError):
+                os.unlink(self.path)
+        with self._lock:
+            for conn in self._connections:
+                with contextlib.suppress(OSError):
+                    conn.shutdown(socket.SHUT_RDWR)
+            self._release()
+        self._grabber.submit(self.backend.close).result()
+        self._grabber.shutdown()
+
+class SharedCapture(CaptureBackend):
+    """
+    Frames from a capture daemon (--capture-backend shared). Each thread keeps its own
+    connection, and a grab returns a read-only view into the daemon's shared memory, so
+    nothing is copied. Without a daemon, or when it goes away, grabs fall back to local
+    capture and the daemon is looked for again every `retry` seconds.
+    """
+    name = 'shared'
+
+    def __init__(self, path=None, fallback='auto', retry=CAPTURE_DAEMON_RETRY, timeout=CAPTURE_DAEMON_TIMEOUT,
+                 clock=time.monotonic):
+        super().__init__()
+        self.path = path or default_capture_socket()
+        self.fallback_name = fallback
+        self.retry = retry
+        self.timeout = timeout
+        self.clock = clock
+        self.attached = False
+        self._lock = threading.Lock()
+        self._fallback = None
+        self._segments = {}  # shm name -> (SharedMemory, ring view)
+        self._retired = []  # (SharedMemory, weakref to ring) of replaced segments still read from
+        self._sockets = []
+        self._retry_at = 0.0
+        self._layout = None  # last reply: screen and monitor regions
+
+    def fallback(self):
+        with self._lock:
+            if self._fallback is None:
+                self._fallback = create_capture_backend(self.fallback_name)
+            return self._fallback
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None or self.clock() < self._retry_at:
+            return conn
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            # Only talk to a daemon run by this user: it decides what we "see"
+            check_socket_owner(self.path)
+            sock.connect(self.path)
+            check_peer(sock)
+        except OSError as e:
+            sock.close()
+            if isinstance(e, PermissionError):
+                logging.warning(f"Not using the capture daemon at {self.path}: {e}. Capturing locally.")
+            elif self.attached or not self._retry_at:
+                logging.info(f"No capture daemon at {self.path}. Capturing locally.")
+            self.attached = False
+            self._retry_at = self.clock() + self.retry
+            return None
+        conn = self._local.conn = (sock, sock.makefile('rb'))
+        # A new daemon may share a different screen
+        self._layout = None
+        with self._lock:
+            self._sockets.append(sock)
+        if not self.attached:
+            logging.info(f"Screen capture: attached to the capture daemon at {self.path}")
+            self.attached = True
+        return conn
+
+    def _disconnect(self, reason):
+        sock, reader = self._local.conn
+        self._local.conn = None
+        reader.close()
+        sock.close()
+        with self._lock:
+            if sock in self._sockets:
+                self._sockets.remove(sock)
+        self.attached = False
+        self._layout = None
+        self._retry_at = self.clock() + self.retry
+        metrics.inc('capture_daemon_fallbacks')
+        logging.warning(f"Capture daemon connection lost ({reason}). Capturing locally.")
+
+    def _request(self):
+        conn = self._connection()
+        if conn is None:
+            return None
+        sock, reader = conn
+        try:
+            sock.sendall(b'frame\n')
+            line = reader.readline()
+            if not line:
+                raise OSError("closed by the daemon")
+            reply = json.loads(line)
+        except (OSError, ValueError) as e:
+            self._disconnect(str(e) or type(e).__name__)
+            return None
+        if 'error' in reply:
+            logging.warning(f"Capture daemon: {reply['error']}")
+            return None
+        self._layout = reply
+        return reply
+
+    @staticmethod
+    def _unmap(segments):
+        """
+        Close each (SharedMemory, ring ref) whose ring is gone. Frames are views that keep
+        their ring alive, and unmapping under a live view would crash the reader, so
+        segments still in use are returned to be tried again later.
+        """
+        in_use = []
+        for shm, ring in segments:
+            if ring() is None:
+                shm.close()
+            else:
+                in_use.append((shm, ring))
+        return in_use
+
+    def _retire_segments(self):
+        """Unmap the rings the daemon has replaced (new frame size or a restart). Called under _lock."""
+        stale = [(shm, weakref.ref(ring)) for shm, ring in self._segments.values()]
+        self._segments = {}
+        self._retired = self._unmap(stale + self._retired)
+
+    def _ring(self, reply):
+        with self._lock:
+            entry = self._segments.get(reply['shm'])
+            if entry is None:
+                self._retire_segments()
+                shm = attach_shared_memory(reply['shm'])
+                ring = np.ndarray(reply['shape'], dtype=np.uint8, buffer=shm.buf)
+                ring.flags.writeable = False
+                entry = self._segments[reply['shm']] = (shm, ring)
+            return entry[1]
+
+    def screen_region(self):
+        layout = self._layout or self._request()
+        if layout is None:
+            return self.fallback().screen_region()
+        return tuple(layout['screen'])
+
+    def monitor_regions(self):
+        layout = self._layout or self._request()
+        if layout is None:
+            return self.fallback().monitor_regions()
+        return [tuple(region) for region in layout['monitors']]
+
+    def grab(self, region, out=None):
+        reply = self._request()
+        if reply is not None:
+            left, top, width, height = region
+            screen_left, screen_top, screen_width, screen_height = reply['screen']
+            x, y = left - screen_left, top - screen_top
+            if x >= 0 and y >= 0 and x + width <= screen_width and y + height <= screen_height:
+                try:
+                    ring = self._ring(reply)
+                except (OSError, ValueError) as e:
+                    # The segment is gone, e.g. the daemon restarted since replying
+                    self._disconnect(f"can't open frame memory {reply['shm']}: {e}")
+                    return self.fallback().grab(region, out)
+                frame = ring[reply['slot'], y:y + height, x:x + width]
+                if out is None:
+                    return frame
+                out[...] = frame
+                return out
+        return self.fallback().grab(region, out)
+
+    def close(self):
+        with self._lock:
+            for sock in self._sockets:
+                sock.close()
+            self._sockets = []
+            segments, self._segments = self._segments, {}
+            retired, self._retired = self._retired, []
+            fallback, self._fallback = self._fallback, None
+        self._local = threading.local()
+        stale = [(shm, weakref.ref(ring)) for shm, ring in segments.values()] + retired
+        del segments
+        # Mappings with frames still in use go away with the process
+        self._unmap(stale)
+        if fallback is not None:
+            fallback.close()
+
+def run_capture_daemon(args):
+    """--capture-daemon: share screen captures with the bots on this desktop until Ctrl+C."""
+    name = 'auto' if args.capture_backend == 'shared' else args.capture_backend
+    daemon = CaptureDaemon(create_capture_backend(name), args.capture_socket or default_capture_socket(),
+                           interval=args.capture_interval)
+    logging.info(f"Screen capture: {daemon.backend.name}")
+    # Shut down cleanly under a service manager too, so the socket and ring are removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        logging.error(f"Capture daemon failed: {e}")
+        print(f"Error: Capture daemon failed: {e}")
+    finally:
+        daemon.close()
+        logging.info(f"Capture daemon stopped after {daemon.captures} capture(s).")
+
+ClientWindow = namedtuple('ClientWindow', ['id', 'wm_class', 'title', 'region', 'visible'])
+Window = namedtuple('Window', ['id', 'title', 'region'])
+
+class _X11Windows:
+    """
+    EWMH client list through libX11 (ctypes). Raises OSError where there is no X display.
+    Window-manager events (stacking, focus, moves, resizes, state changes) are
+    only queued; changed() polls them without blocking.
+    """
+    AnyPropertyType = 0
+    IsViewable = 2
+    StructureNotifyMask = 1 << 17
+    PropertyChangeMask = 1 << 22
+    ALL_DESKTOPS = 0xFFFFFFFF
+
+    class _Attributes(ctypes.Structure):
+        _fields_ = [
+            ('x', ctypes.c_int), ('y', ctypes.c_int), ('width', ctypes.c_int), ('height', ctypes.c_int),
+            ('border_width', ctypes.c_int), ('depth', ctypes.c_int), ('visual', ctypes.c_void_p),
+            ('root', ctypes.c_ulong), ('class_', ctypes.c_int), ('bit_gravity', ctypes.c_int),
+            ('win_gravity', ctypes.c_int), ('backing_store', ctypes.c_int), ('backing_planes', ctypes.c_ulong),
+            ('backing_pixel', ctypes.c_ulong), ('save_under', ctypes.c_int), ('colormap', ctypes.c_ulong),
+            ('map_installed', ctypes.c_int), ('map_state', ctypes.c_int), ('all_event_masks', ctypes.c_long),
+            ('your_event_mask', ctypes.c_long), ('do_not_propagate_mask', ctypes.c_long),
+            ('override_redirect', ctypes.c_int), ('screen', ctypes.c_void_p),
+        ]
+
+    def __init__(self, display_name=None):
+        path = ctypes.util.find_library('X11')
+        if not path:
+            raise OSError("libX11 not found")
+        x = self.x = ctypes.CDLL(path)
+        x.XOpenDisplay.restype = ctypes.c_void_p
+        x.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x.XDefaultRootWindow.restype = ctypes.c_ulong
+        x.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x.XInternAtom.restype = ctypes.c_ulong
+        x.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+        x.XGetWindowProperty.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_long, ctypes.c_long, ctypes.c_int,
+            ctypes.c_ulong, ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_int),
+            ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_void_p)]
+        x.XFree.argtypes = [ctypes.c_void_p]
+        x.XGetWindowAttributes.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(self._Attributes)]
+        x.XTranslateCoordinates.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_int, ctypes.c_int,
+            ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_ulong)]
+        x.XSelectInput.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_long]
+        x.XPending.argtypes = [ctypes.c_void_p]
+        x.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        x.XFlush.argtypes = [ctypes.c_void_p]
+        x.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self.display = x.XOpenDisplay(display_name.encode() if display_name else None)
+        if not self.display:
+            raise OSError("cannot open the X display")
+        # Windows can close between listing and querying them; the default handler would exit
+        self._on_error = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)(lambda display, event: 0)
+        x.XSetErrorHandler(self._on_error)
+        self.root = x.XDefaultRootWindow(self.display)
+        self._atoms = {}
+        self._watched = set()
+        self._event = (ctypes.c_long * 24)()
+        x.XSelectInput(self.display, self.root, self.PropertyChangeMask)
+        x.XFlush(self.display)
+
+    def _atom(self, name):
+        atom = self._atoms.get(name)
+        if atom is None:
+            atom = self._atoms[name] = self.x.XInternAtom(self.display, name.encode(), 0)
+        return atom
+
+    def _property(self, window, name):
+        """A window property as bytes (format 8) or a list of ints (format 32); None if missing."""
+        actual_type, actual_format = ctypes.c_ulong(), ctypes.c_int()
+        nitems, bytes_after, data = ctypes.c_ulong(), ctypes.c_ulong(), ctypes.c_void_p()
+        status = self.x.XGetWindowProperty(
+            self.display, window, self._atom(name), 0, 4096, 0, self.AnyPropertyType,
+            ctypes.byref(actual_type), ctypes.byref(actual_format), ctypes.byref(nitems),
+            ctypes.byref(bytes_after), ctypes.byref(data))
+        if status != 0 or not data.value:
+            return None
+        try:
+            if actual_format.value == 32:
+                # Format 32 properties come back as C longs
+                return list(ctypes.cast(data, ctypes.POINTER(ctypes.c_ulong))[:nitems.value])
+            if actual_format.value == 8:
+                return ctypes.string_at(data, nitems.value)
+            return None
+        finally:
+            self.x.XFree(data)
+
+    def _text(self, window, *names):
+        for name in names:
+            value = self._property(window, name)
+            if isinstance(value, bytes):
+                return value.decode('utf-8', 'replace')
+        return ''
+
+    def _geometry(self, window):
+        attributes = self._Attributes()
+        if not self.x.XGetWindowAttributes(self.display, window, ctypes.byref(attributes)):
+            return None, False
+        x, y, child = ctypes.c_int(), ctypes.c_int(), ctypes.c_ulong()
+        if not self.x.XTranslateCoordinates(self.display, window, self.root, 0, 0,
+                                            ctypes.byref(x), ctypes.byref(y), ctypes.byref(child)):
+            return None, False
+        region = (x.value, y.value, attributes.width, attributes.height)
+        return region, attributes.map_state == self.IsViewable
+
+    def clients(self):
+        """Top-level windows, bottom to top of the stacking order."""
+        ids = self._property(self.root, '_NET_CLIENT_LIST_STACKING') or self._property(self.root, '_NET_CLIENT_LIST') or []
+        desktop = (self._property(self.root, '_NET_CURRENT_DESKTOP') or [None])[0]
+        hidden = self._atom('_NET_WM_STATE_HIDDEN')
+        result = []
+        for window in ids:
+            region, viewable = self._geometry(window)
+            if region is None:
+                continue
+            on_desktop = (self._property(window, '_NET_WM_DESKTOP') or [desktop])[0]
+            visible = (viewable and hidden not in (self._property(window, '_NET_WM_STATE') or [])
+                       and on_desktop in (desktop, self.ALL_DESKTOPS))
+            wm_class = tuple(part.lower() for part in self._text(window, 'WM_CLASS').split('\0') if part)
+            result.append(ClientWindow(window, wm_class, self._text(window, '_NET_WM_NAME', 'WM_NAME'), region, visible))
+        return result
+
+    def watch(self, windows):
+        """Also report moves, resizes and state changes of these windows."""
+        for window in set(windows) - self._watched:
+            self.x.XSelectInput(self.display, window, self.StructureNotifyMask | self.PropertyChangeMask)
+        self._watched = set(windows)
+        self.x.XFlush(self.display)
+
+    def changed(self):
+        """True if window-manager events arrived since the last call (never blocks)."""
+        changed = False
+        while self.x.XPending(self.display):
+            self.x.XNextEvent(self.display, self._event)
+            changed = True
+        return changed
+
+    def close(self):
+        if self.display:
+            self.x.XCloseDisplay(self.display)
+            self.display = None
+
+def _subtract(rect, cover):
+    """The parts of rect (left, top, width, height) not inside cover, as up to four rects."""
+    x, y, w, h = rect
+    left, top = max(x, cover[0]), max(y, cover[1])
+    right, bottom = min(x + w, cover[0] + cover[2]), min(y + h, cover[1] + cover[3])
+    if left >= right or top >= bottom:
+        return [rect]
+    parts = []
+    if y < top:
+        parts.append((x, y, w, top - y))
+    if bottom < y + h:
+        parts.append((x, bottom, w, y + h - bottom))
+    if x < left:
+        parts.append((x, top, left - x, bottom - top))
+    if right < x + w:
+        parts.append((right, top, x + w - right, bottom - top))
+    return parts
+
+def _clip(rect, bounds):
+    left, top = max(rect[0], bounds[0]), max(rect[1], bounds[1])
+    right = min(rect[0] + rect[2], bounds[0] + bounds[2])
+    bottom = min(rect[1] + rect[3], bounds[1] + bounds[3])
+    if left >= right or top >= bottom:
+        return None
+    return (left, top, right - left, bottom - top)
+
+def visible_part(rect, covers):
+    """Bounding box of what is left of rect after the covering rects are removed, or None."""
+    parts = [rect]
+    for cover in covers:
+        parts = [piece for part in parts for piece in _subtract(part, cover)]
+        if not parts:
+            return None
+    left, top = min(p[0] for p in parts), min(p[1] for p in parts)
+    right, bottom = max(p[0] + p[2] for p in parts), max(p[1] + p[3] for p in parts)
+    return (left, top, right - left, bottom - top)
+
+def chat_area(region, fraction=CHAT_AREA_FRACTION):
+    """The bottom `fraction` of a window, where the chat input and its microphone icon are."""
+    left, top, width, height = region
+    chat_height = max(1, int(height * fraction))
+    return (left, top + height - chat_height, width, chat_height)
+
+class WindowTracker:
+    """
+    Cursor windows and the part of the screen worth searching in each: the chat area,
+    minus whatever other windows cover. Minimized, unmapped, other-workspace and fully
+    covered windows are dropped. The list is cached and rebuilt on window-manager
+    events, or every refresh_interval seconds.
+    """
+
+    def __init__(self, source, classes=CURSOR_WINDOW_CLASSES, refresh_interval=WINDOW_REFRESH_INTERVAL, clock=time.monotonic):
+        self.source = source
+        self.classes = classes
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self.windows = None  # visible Cursor windows, topmost first
+        self.present = False  # any Cursor window exists, even minimized
+        self._listed = None
+
+    def _is_cursor(self, client):
+        return any(part in self.classes for part in client.wm_class)
+
+    def refresh(self):
+        clients = self.source.clients()
+        cursor = [c for c in clients if self._is_cursor(c)]
+        self.source.watch([c.id for c in cursor])
+        bounds = capture_backend.screen_region()
+        windows = []
+        for i, client in enumerate(clients):
+            if not client.visible or not self._is_cursor(client):
+                continue
+            area = _clip(chat_area(client.region), bounds)
+            if area is not None:
+                area = visible_part(area, [c.region for c in clients[i + 1:] if c.visible])
+            if area is not None:
+                windows.append(Window(client.id, client.title, area))
+        windows.reverse()
+        if windows != self.windows:
+            logging.info(f"Cursor windows: {len(windows)} visible of {len(cursor)}"
+                         + "".join(f"; '{w.title}' chat area {w.region}" for w in windows))
+        self.windows = windows
+        self.present = bool(cursor)
+
+    def regions(self):
+        """
+        Regions to search instead of the full screen, or None to search the full
+        screen (no Cursor window known, or discovery failed). [] means every Cursor
+        window is minimized or covered.
+        """
+        now = self.clock()
+        if self.windows is None or self.source.changed() or now - self._listed >= self.refresh_interval:
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.warning(f"Window discovery failed: {e}")
+                return None
+            self._listed = now
+        if not self.present:
+            return None
+        return [w.region for w in self.windows]
+
+    def close(self):
+        self.source.close()
+
+def create_window_tracker(name):
+    """WindowTracker for --windows, or None. 'auto' uses X11 on Linux when a display is available."""
+    if name == 'off' or (name == 'auto' and not (sys.platform.startswith('linux') and os.environ.get('DISPLAY'))):
+        return None
+    try:
+        return WindowTracker(_X11Windows())
+    except OSError as e:
+        if name == 'x11':
+            logging.warning(f"X11 window discovery unavailable ({e}). Searching the full screen.")
+        return None
+
+window_tracker = None
+
+def search_regions():
+    """Cursor chat areas to search, or None for the full screen."""
+    if window_tracker is None:
+        return None
+    return window_tracker.regions()
+
+class ScreenDriver:
+    """
+    Mouse and keyboard side of the screen: everything process_cycle does to the desktop.
+    Capture is the CaptureBackend's job; a driver that is also a CaptureBackend (VirtualScreen)
+    replaces both.
+    """
+    name = None
+    # Seconds to wait after clicking before typing, so the input has focus
+    focus_delay = 0.0
+
+    def position(self):
+        raise NotImplementedError
+
+    def move_to(self, x, y):
+        raise NotImplementedError
+
+    def move_rel(self, dx, dy):
+        x, y = self.position()
+        self.move_to(x + dx, y + dy)
+
+    def click(self, x, y):
+        raise NotImplementedError
+
+    def press(self, key):
+        raise NotImplementedError
+
+    def inject_text(self, text, method='auto'):
+        """Enter text into the focused input. Returns the method that was used."""
+        raise NotImplementedError
+
+class PyautoguiDriver(ScreenDriver):
+    """The real desktop, through pyautogui."""
+    name = 'pyautogui'
+    focus_delay = 0.3
+
+    def position(self):
+        return pyautogui.position()
+
+    def move_to(self, x, y):
+        pyautogui.moveTo(x, y)
+
+    def move_rel(self, dx, dy):
+        pyautogui.moveRel(dx, dy)
+
+    def click(self, x, y):
+        pyautogui.click(x, y)
+
+    def press(self, key):
+        pyautogui.press(key)
+
+    def inject_text(self, text, method='auto'):
+        return inject_text(text, method)
+
+screen_driver = PyautoguiDriver()
+
+class VirtualScreen(CaptureBackend, ScreenDriver):
+    """
+    In-memory screen for headless runs. Serves frames from a static image or from a
+    scripted agent scene, and records injected actions instead of sending them.
+
+    In a scene the icon is shown while the agent is idle. Pressing Enter after
+    typing submits the text and hides the icon for `busy_seconds` (the agent working);
+    the time from the icon reappearing to the bot's click is recorded as latency.
+    """
+    name = 'virtual'
+
+    def __init__(self, background, icon=None, icon_pos=None, busy_seconds=VIRTUAL_BUSY_SECONDS,
+                 max_actions=None, clock=time.monotonic):
+        super().__init__()
+        self.clock = clock
+        self.busy_seconds = busy_seconds
+        self.max_actions = max_actions
+        self.busy_frame = np.ascontiguousarray(background)
+        self.idle_frame = self.busy_frame
+        self.icon_pos = None
+        if icon is not None:
+            height, width = icon.shape[:2]
+            if icon_pos is None:
+                icon_pos = Point(self.busy_frame.shape[1] // 2, self.busy_frame.shape[0] // 2)
+            self.icon_pos = Point(*icon_pos)
+            left, top = self.icon_pos.x - width // 2, self.icon_pos.y - height // 2
+            self.idle_frame = self.busy_frame.copy()
+            self.idle_frame[top:top + height, left:left + width] = icon
+        self.mouse = Point(0, 0)
+        self.actions = []  # (time, kind, detail)
+        self.submitted = []
+        self.latencies = []
+        self._lock = threading.Lock()
+        self._typed = []
+        self._busy_until = None
+        self._idle_since = clock()
+        self._latency_pending = True
+
+    def _frame(self):
+        with self._lock:
+            now = self.clock()
+            if self._busy_until is not None and now >= self._busy_until:
+                self._idle_since = self._busy_until
+                self._busy_until = None
+                self._latency_pending = True
+            return self.busy_frame if self._busy_until is not None else self.idle_frame
+
+    def _record(self, kind, detail=None):
+        self.actions.append((self.clock(), kind, detail))
+
+    def screen_region(self):
+        height, width = self.busy_frame.shape[:2]
+        return (0, 0, width, height)
+
+    def grab(self, region, out=None):
+        frame = self._frame()
+        left, top, width, height = region
+        buffer = self._buffer(width, height) if out is None else out
+        buffer[:] = 0
+        # Parts of the region outside the virtual screen stay black
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + width, frame.shape[1]), min(top + height, frame.shape[0])
+        if x1 > x0 and y1 > y0:
+            buffer[y0 - top:y1 - top, x0 - left:x1 - left] = frame[y0:y1, x0:x1]
+        return buffer
+
+    def position(self):
+        return self.mouse
+
+    def move_to(self, x, y):
+        self.mouse = Point(x, y)
+        self._record('move', self.mouse)
+
+    def click(self, x, y):
+        self.mouse = Point(x, y)
+        with self._lock:
+            now = self.clock()
+            if self._latency_pending and self._busy_until is None and self.icon_pos is not None:
+                self.latencies.append(now - self._idle_since)
+                self._latency_pending = False
+        self._record('click', self.mouse)
+
+    def press(self, key):
+        self._record('press', key)
+        if key != 'enter':
+            return
+        text = ''.join(self._typed)
+        self._typed = []
+        self.submitted.append(text)
+        if self.icon_pos is not None:
+            with self._lock:
+                self._busy_until = self.clock() + self.busy_seconds
+
+    def inject_text(self, text, method='auto'):
+        self._typed.append(text)
+        self._record('text', text)
+        return 'virtual'
+
+    @property
+    def done(self):
+        return self.max_actions is not None and len(self.submitted) >= self.max_actions
+
+    def summary(self):
+        """One-line report of what the bot did on this screen."""
+        text = f"Virtual screen: {len(self.submitted)} submission(s), {len(self.actions)} recorded action(s)"
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            p50 = latencies[len(latencies) // 2]
+            text += f", detection-to-click latency p50 {p50 * 1000:.0f}ms / max {latencies[-1] * 1000:.0f}ms"
+        return text
+
+def _virtual_background(width, height):
+    """Default scene background: a gradient, so the blank-screen check doesn't think it is locked."""
+    row = np.linspace(40, 90, width, dtype=np.float32).astype(np.uint8)
+    return np.repeat(np.broadcast_to(row, (height, width))[:, :, None], 3, axis=2)
+
+def load_virtual_screen(path, default_icon=None):
+    """
+    Build a VirtualScreen from an image (served as a static frame) or a JSON scene:
+    {"size": [w, h], "background": img, "icon": img, "icon_pos": [x, y], "busy_seconds": s, "max_actions": n}.
+    Scene paths are relative to the scene file; the icon defaults to the first --image.
+    """
+    if not path.lower().endswith('.json'):
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Could not read virtual screen image: {path}")
+        return VirtualScreen(image)
+
+    with open(path, 'r') as f:
+        scene = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+
+    def scene_image(key, fallback=None):
+        value = scene.get(key)
+        if value is None:
+            value = fallback
+            if value is None:
+                return None
+        else:
+            value = os.path.join(base, value)
+        image = cv2.imread(value, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Could not read scene {key}: {value}")
+        return image
+
+    background = scene_image('background')
+    if background is None:
+        background = _virtual_background(*scene.get('size', VIRTUAL_SCREEN_SIZE))
+    return VirtualScreen(
+        background,
+        icon=scene_image('icon', default_icon),
+        icon_pos=scene.get('icon_pos'),
+        busy_seconds=scene.get('busy_seconds', VIRTUAL_BUSY_SECONDS),
+        max_actions=scene.get('max_actions'))
+
+def _to_gray(image):
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+def _find_peaks(result, threshold, suppress_w, suppress_h, limit):
+    """Return up to `limit` (x, y, score) peaks above threshold, suppressing neighbours of each peak."""
+    peaks = []
+    for _ in range(limit):
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        if max_val < threshold:
+            break
+        x, y = max_loc
+        peaks.append((x, y, max_val))
+        result[max(0, y - suppress_h):y + suppress_h + 1, max(0, x - suppress_w):x + suppress_w + 1] = -1.0
+    return peaks
+
+def _pyramid_matches(hay_gray, hay_full, small_cache, template, scale, confidence, levels, grayscale, limit, variant=None):
+    """Confirmed matches for one template scale: coarse candidates, each re-checked at full resolution."""
+    tpl_gray = template.scaled(scale, grayscale=True)
+    tpl_full = tpl_gray if grayscale else template.scaled(scale)
+    th, tw = tpl_gray.shape[:2]
+    if th > hay_gray.shape[0] or tw > hay_gray.shape[1]:
+        return []
+
+    # Small templates can't be shrunk as far
+    level = levels
+    while level > 0 and min(th, tw) / (2 ** level) < MIN_COARSE_TEMPLATE_SIZE:
+        level -= 1
+    factor = 2 ** level
+
+    if level == 0:
+        full = cv2.matchTemplate(hay_full, tpl_full, cv2.TM_CCOEFF_NORMED)
+        np.nan_to_num(full, copy=False, nan=-1.0, posinf=-1.0, neginf=-1.0)
+        peaks = _find_peaks(full, confidence, tw // 2, th // 2, limit)
+        return [Match(Point(x + tw // 2, y + th // 2), score, scale, variant) for x, y, score in peaks]
+
+    if level not in small_cache:
+        small_cache[level] = cv2.resize(hay_gray, None, fx=1.0 / factor, fy=1.0 / factor, interpolation=cv2.INTER_AREA)
+    small_hay = small_cache[level]
+    small_tpl = cv2.resize(tpl_gray, (max(1, tw // factor), max(1, th // factor)), interpolation=cv2.INTER_AREA)
+    if small_tpl.shape[0] > small_hay.shape[0] or small_tpl.shape[1] > small_hay.shape[1]:
+        return []
+    coarse = cv2.matchTemplate(small_hay, small_tpl, cv2.TM_CCOEFF_NORMED)
+    # Flat areas produce NaN/inf scores
+    np.nan_to_num(coarse, copy=False, nan=-1.0, posinf=-1.0, neginf=-1.0)
+    peaks = _find_peaks(coarse, confidence - COARSE_CONFIDENCE_SLACK,
+                        small_tpl.shape[1] // 2, small_tpl.shape[0] // 2, limit)
+
+    # Full-resolution windows: template plus a margin covering the rounding of the coarse level
+    margin = 2 * factor
+    matches = []
+    for px, py, _ in peaks:
+        left = max(0, px * factor - margin)
+        top = max(0, py * factor - margin)
+        right = min(hay_full.shape[1], px * factor + tw + margin)
+        bottom = min(hay_full.shape[0], py * factor + th + margin)
+        if right - left < tw or bottom - top < th:
+            continue
+        fine = cv2.matchTemplate(hay_full[top:bottom, left:right], tpl_full, cv2.TM_CCOEFF_NORMED)
+        np.nan_to_num(fine, copy=False, nan=-1.0, posinf=-1.0, neginf=-1.0)
+        _, score, _, loc = cv2.minMaxLoc(fine)
+        if score >= confidence:
+            matches.append(Match(Point(left + loc[0] + tw // 2, top + loc[1] + th // 2), score, scale, variant))
+    return matches
+
+def locate_pyramid(haystack, template, confidence=MATCH_CONFIDENCE, scales=(1.0,), levels=2, grayscale=False):
+    """
+    Coarse-to-fine template search.
+    Candidates are found on a 2**levels downscaled copy of the screen and template,
+    then confirmed at full resolution in small windows around each candidate.
+    Scales are tried in the given order and the search stops at the first scale
+    with a confirmed match. Returns the best Match (center in haystack coordinates) or None.
+
+    `template` may be a TemplateSet: its variants share the grayscale conversion and
+    the downscaled pyramid, and are tried last-matched first. The first variant that
+    confirms a match at a scale ends the search, so while the theme stays the same
+    extra variants cost nothing.
+    """
+    hay_gray = _to_gray(haystack)
+    hay_full = hay_gray if grayscale else haystack
+    small_cache = {}
+    variants = _variants(template, confidence)
+    for scale in scales:
+        for variant in variants:
+            matches = _pyramid_matches(hay_gray, hay_full, small_cache, variant.template, scale,
+                                       variant.confidence, levels, grayscale, MAX_PYRAMID_CANDIDATES, variant.name)
+            if matches:
+                return max(matches, key=lambda m: m.score)
+    return None
+
+def locate_all_pyramid(haystack, template, confidence=MATCH_CONFIDENCE, scales=(1.0,), levels=2, grayscale=False, limit=MAX_TARGETS):
+    """
+    Like locate_pyramid, but returns every icon instance (all scales, duplicates removed), best first.
+    Every variant is matched, since each window may show a different theme or state.
+    """
+    hay_gray = _to_gray(haystack)
+    hay_full = hay_gray if grayscale else haystack
+    small_cache = {}
+    variants = _variants(template, confidence)
+    matches = []
+    for scale in scales:
+        for variant in variants:
+            matches.extend(_pyramid_matches(hay_gray, hay_full, small_cache, variant.template, scale,
+                                            variant.confidence, levels, grayscale, limit, variant.name))
+
+    # The same icon can be confirmed from neighbouring candidates, at several scales or by several variants
+    kept = []
+    min_distance = min(min(v.template.gray.shape) for v in variants) / 2
+    for match in sorted(matches, key=lambda m: m.score, reverse=True):
+        if all(abs(match.center.x - k.center.x) > min_distance or abs(match.center.y - k.center.y) > min_distance for k in kept):
+            kept.append(match)
+    return kept[:limit]
+
+def _match_worker_main(conn, specs):
+    """Match worker process: match frames from shared memory until told to stop."""
+    templates = TemplateSet.load(specs)
+    shm = None
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        name, shape, dtype, scales, levels, find_all, grayscale, first = request
+        # The parent tracks which variant matched last, whichever worker found it
+        templates.last_matched = first
+        try:
+            if shm is None or shm.name != name:
+                if shm is not None:
+                    shm.close()
+                # Workers share the main process's resource tracker, which unlinks the segment
+                shm = shared_memory.SharedMemory(name=name)
+            frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            if find_all:
+                matches = locate_all_pyramid(frame, templates, scales=scales, levels=levels, grayscale=grayscale)
+            else:
+                match = locate_pyramid(frame, templates, scales=scales, levels=levels, grayscale=grayscale)
+                matches = [match] if match else []
+            del frame
+            conn.send(('ok', [(int(m.center.x), int(m.center.y), float(m.score), m.scale, m.variant) for m in matches]))
+        except Exception as e:
+            conn.send(('error', str(e)))
+    if shm is not None:
+        shm.close()
+
+class MatchWorkerError(Exception):
+    """The match worker process died or stopped answering."""
+
+class _MatchWorker:
+    """One match process, its pipe and the shared-memory buffer frames are copied into."""
+
+    def __init__(self, ctx, specs, index):
+        self.ctx = ctx
+        self.specs = specs
+        self.index = index
+        self.shm = None
+        self.process = None
+        self.conn = None
+        self.start()
+
+    def start(self):
+        parent, child = self.ctx.Pipe()
+        self.process = self.ctx.Process(target=_match_worker_main, args=(child, self.specs),
+                                        daemon=True, name=f"match-{self.index}")
+        self.process.start()
+        child.close()
+        self.conn = parent
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(1)
+        self.conn.close()
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def match(self, frame, scales, levels, find_all, timeout, grayscale=False, first=None):
+        if self.shm is None or self.shm.size < frame.nbytes:
+            self.release()
+            self.shm = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf)
+        view[...] = frame
+        del view
+        try:
+            self.conn.send((self.shm.name, frame.shape, frame.dtype.str, tuple(scales), levels, find_all, grayscale, first))
+            if not self.conn.poll(timeout):
+                raise MatchWorkerError(f"no result after {timeout:g}s")
+            status, result = self.conn.recv()
+        except (OSError, EOFError) as e:
+            raise MatchWorkerError(str(e) or type(e).__name__) from e
+        if status == 'error':
+            raise RuntimeError(f"Match worker: {result}")
+        return [Match(Point(x, y), score, scale, variant) for x, y, score, scale, variant in result]
+
+    def release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+class MatchWorkerPool:
+    """
+    Template matching in separate processes (--match-processes), so a long full-screen
+    match never holds the GIL the hotkey listener and tray need. Frames are copied into
+    one shared-memory buffer per worker instead of being pickled, and only match
+    results come back. A worker that dies or hangs is restarted and the frame retried once.
+    """
+
+    def __init__(self, specs, processes=1, timeout=MATCH_WORKER_TIMEOUT, context='spawn'):
+        self.timeout = timeout
+        ctx = multiprocessing.get_context(context)
+        if os.name == 'posix':
+            # Start the tracker before the workers so they share it instead of each
+            # starting one that would unlink our buffers when the worker dies
+            resource_tracker.ensure_running()
+        self.workers = [_MatchWorker(ctx, specs, i) for i in range(max(1, processes))]
+        self._free = queue.Queue()
+        for worker in self.workers:
+            self._free.put(worker)
+
+    def reload(self, specs):
+        """Restart every worker with new templates (waits for matches in progress)."""
+        workers = [self._free.get() for _ in self.workers]
+        try:
+            for worker in workers:
+                worker.specs = specs
+                worker.restart()
+        finally:
+            for worker in workers:
+                self._free.put(worker)
+
+    def match(self, frame, scales, levels, find_all=False, grayscale=False, first=None):
+        """Match in a free worker. `first` names the variant to try first (the last one matched)."""
+        worker = self._free.get()
+        try:
+            try:
+                return worker.match(frame, scales, levels, find_all, self.timeout, grayscale, first)
+            except MatchWorkerError as e:
+                logging.warning(f"Match worker {worker.index} failed ({e}). Restarting it.")
+                metrics.inc('match_worker_restarts')
+                worker.restart()
+            return worker.match(frame, scales, levels, find_all, self.timeout, grayscale, first)
+        finally:
+            self._free.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+            worker.release()
+
+match_pool = None
+
+def match_frame(frame, mic_image, scales, levels, find_all=False):
+    """
+    Find the icon in a frame with the pyramid matcher, in this process or in the match
+    worker pool. Returns the best Match or None (find_all: a list of every Match).
+    """
+    if match_pool is not None:
+        first = mic_image.last_matched if isinstance(mic_image, TemplateSet) else None
+        matches = match_pool.match(frame, scales, levels, find_all, match_grayscale, first)
+        return matches if find_all else (matches[0] if matches else None)
+    if find_all:
+        return locate_all_pyramid(frame, mic_image, confidence=MATCH_CONFIDENCE, scales=scales, levels=levels, grayscale=match_grayscale)
+    return locate_pyramid(frame, mic_image, confidence=MATCH_CONFIDENCE, scales=scales, levels=levels, grayscale=match_grayscale)
+
+class FrameChangeDetector:
+    """
+    Skips template matching when a watched region looks exactly like last time.
+    Keeps a fingerprint (CRC of a strided subsample) and the detection result per region kind.
+    """
+
+    def __init__(self, step=FINGERPRINT_STEP):
+        self.step = step
+        self._entries = {}
+        self.matched = 0
+        self.reused = 0
+        self.last_reused = False
+        self._reused_kinds = {}
+
+    def fingerprint(self, frame):
+        sample = np.ascontiguousarray(frame[::self.step, ::self.step])
+        return zlib.crc32(sample.tobytes()) ^ hash(frame.shape)
+
+    def detect(self, kind, params, frame, match_func):
+        """
+        Return match_func(frame), or the previous result for `kind` if both the
+        search parameters and the frame's fingerprint are unchanged.
+        """
+        fingerprint = self.fingerprint(frame)
+        entry = self._entries.get(kind)
+        if entry and entry[0] == params and entry[1] == fingerprint:
+            self.reused += 1
+            self.last_reused = self._reused_kinds[kind] = True
+            return entry[2]
+        result = match_func(frame)
+        self._entries[kind] = (params, fingerprint, result)
+        self.matched += 1
+        self.last_reused = self._reused_kinds[kind] = False
+        return result
+
+    def was_reused(self, kind):
+        """Whether the last detect() for `kind` reused the previous result."""
+        return self._reused_kinds.get(kind, False)
+
+    def reset(self):
+        self._entries.clear()
+        self._reused_kinds.clear()
+
+frame_detector = FrameChangeDetector()
+
+class ScreenUnavailableError(Exception):
+    """The screen can't be captured or shows nothing (locked, screensaver, display off)."""
+
+def is_blank(frame, tolerance=8):
+    """True if a subsample of the frame is a single flat color."""
+    sample = frame[::16, ::16]
+    return int(sample.max()) - int(sample.min()) <= tolerance
+
+def roi_around(pos, size=ROI_SIZE):
+    """(left, top, width, height) square centered on a screen position."""
+    return (max(0, int(pos.x - size / 2)), max(0, int(pos.y - size / 2)), size, size)
+
+class RoiTracker:
+    """
+    Where to look before paying for a full-screen scan.
+    Remembers the last few detections and searches a small box around them. On a miss
+    the search widens step by step (ROI_LADDER, then a half-screen strip) around the most
+    recent one. The wider boxes are matched with the pyramid like the full-screen scan,
+    so the whole ladder costs less than one full scan. The next cycle starts at the size
+    the last hit needed, and shrinks back after stable hits. While the icon is absent
+    everywhere (agent busy) only the starting size is tried, since widening can't help
+    until it comes back.
+    """
+
+    def __init__(self, sizes=ROI_LADDER, max_candidates=ROI_CANDIDATES, shrink_after=ROI_SHRINK_HITS):
+        self.sizes = sizes
+        self.max_candidates = max_candidates
+        self.shrink_after = shrink_after
+        self.candidates = []  # most recent first
+        self.level = 0
+        self.stable_hits = 0
+        self.absent = False
+        self.searches = 0
+        self.hits = 0
+        self.full_scans = 0
+        self.searched_area = 0
+        self.last_scan_area = None  # pixels searched by the last full scan, if not the whole screen
+        self._bounds = None
+
+    def bounds(self):
+        if self._bounds is None:
+            self._bounds = tuple(capture_backend.screen_region())
+        return self._bounds
+
+    def remember(self, pos):
+        """Move pos to the front of the candidates, replacing a candidate it is close to."""
+        radius = self.sizes[0] / 4
+        self.candidates = [c for c in self.candidates if abs(c.x - pos.x) > radius or abs(c.y - pos.y) > radius]
+        self.candidates.insert(0, Point(pos.x, pos.y))
+        del self.candidates[self.max_candidates:]
+
+    def _region(self, pos, level):
+        if level < len(self.sizes):
+            return roi_around(pos, self.sizes[level])
+        # Half screen: full height, half the width, centered on pos but kept on screen
+        left, top, width, height = self.bounds()
+        half_left = min(max(int(pos.x - width / 4), left), left + width - width // 2)
+        return (half_left, top, width // 2, height)
+
+    def regions(self):
+        """(level, kind, region) to search in order. Computed lazily: the screen size is only needed when widening."""
+        for i, pos in enumerate(self.candidates):
+            yield self.level, f'roi-{i}', self._region(pos, self.level)
+        if self.absent or not self.candidates:
+            return
+        for level in range(self.level + 1, len(self.sizes) + 1):
+            yield level, f'roi-level-{level}', self._region(self.candidates[0], level)
+
+    def locate(self, mic_image, levels=0):
+        """
+        Search the remembered locations, widening on a miss. Returns the icon position or None.
+        Boxes wider than the first step are matched with `levels` pyramid levels.
+        """
+        if not self.candidates:
+            return None
+        self.searches += 1
+        for level, kind, region in self.regions():
+            self.searched_area += region[2] * region[3]
+            metrics.inc('searched_pixels', region[2] * region[3])
+            pos = locate_in_region(region, mic_image, kind=kind, levels=levels if level else 0)
+            if pos:
+                self._hit(pos, level)
+                return pos
+        return None
+
+    def _hit(self, pos, level):
+        self.hits += 1
+        self.absent = False
+        moved = min((max(abs(c.x - pos.x), abs(c.y - pos.y)) for c in self.candidates), default=0)
+        if level > self.level:
+            # The icon moved past the current box: start wider next time
+            self.level = min(level, len(self.sizes) - 1)
+            self.stable_hits = 0
+        elif moved <= self.sizes[self.level] / 4:
+            self.stable_hits += 1
+            if self.level and self.stable_hits >= self.shrink_after:
+                self.level -= 1
+                self.stable_hits = 0
+        else:
+            self.stable_hits = 0
+        self.remember(pos)
+
+    def full_scan(self, pos):
+        """Record the outcome of the full-screen fallback."""
+        self.full_scans += 1
+        self._bounds = None  # pick up resolution changes
+        try:
+            area = self.last_scan_area
+            if area is None:
+                left, top, width, height = self.bounds()
+                area = width * height
+            self.searched_area += area
+            metrics.inc('searched_pixels', area)
+        except Exception:
+            pass
+        self.last_scan_area = None
+        if pos:
+            self.absent = False
+            self.level = 0
+            self.stable_hits = 0
+            self.remember(pos)
+        else:
+            self.absent = True
+
+    def report(self):
+        cycles = self.hits + self.full_scans
+        if not cycles:
+            return "ROI: no searches yet"
+        hit_rate = self.hits / self.searches if self.searches else 0.0
+        return (f"ROI hit rate {hit_rate:.0%} ({self.hits}/{self.searches}), "
+                f"average searched area {self.searched_area / cycles / 1000:.0f}k px per cycle")
+
+roi_tracker = RoiTracker()
+
+def screen_fingerprint():
+    """The monitor layout as a list of [left, top, width, height]; saved state is only valid for the same layout."""
+    return [list(region) for region in capture_backend.monitor_regions()]
+
+def _monitor_index(pos, monitors):
+    for i, (left, top, width, height) in enumerate(monitors):
+        if left <= pos.x < left + width and top <= pos.y < top + height:
+            return i
+    return None
+
+class DetectionState:
+    """
+    Where the icon was last seen (recent ROI positions, multi-target windows, the
+    matched variant and scale), kept in a small JSON file so a restart or --scan-once run
+    starts with an ROI search instead of a full-screen scan. The file carries a
+    schema version and the monitor layout; either one changing discards it.
+    --scan-once also keeps the time of its last action there, for the cooldown.
+    """
+
+    def __init__(self, path, save_interval=STATE_SAVE_INTERVAL, clock=time.monotonic):
+        self.path = path
+        self.save_interval = save_interval
+        self.clock = clock
+        self.last_action = 0.0
+        self._saved = None
+        self._last_save = None
+
+    def snapshot(self, multi=None):
+        monitors = screen_fingerprint()
+        def place(pos):
+            return {'x': int(pos.x), 'y': int(pos.y), 'monitor': _monitor_index(pos, monitors)}
+        state = {
+            'version': STATE_VERSION,
+            'screen': monitors,
+            'scale': last_matched_scale,
+            'variant': last_matched_variant,
+            'positions': [place(pos) for pos in roi_tracker.candidates],
+        }
+        if multi is not None:
+            state['targets'] = [place(target.pos) for target in multi.targets]
+        if self.last_action:
+            state['last_action'] = self.last_action
+        return state
+
+    def save(self, multi=None, force=False):
+        """Write the state if it changed and the last write is older than save_interval (or force)."""
+        now = self.clock()
+        if not force and self._last_save is not None and now - self._last_save < self.save_interval:
+            return False
+        try:
+            state = self.snapshot(multi)
+            if state == self._saved or not (state['positions'] or state.get('targets')):
+                return False
+            write_atomic(self.path, json.dumps(state, indent=1), prefix='.state-')
+        except Exception as e:
+            logging.error(f"Error saving detection state: {e}")
+            return False
+        self._saved, self._last_save = state, now
+        return True
+
+    def restore(self, args, mic_image, multi=None):
+        """Seed the ROI tracker (or the multi-target tracker) from the file. Returns True if it was used."""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            monitors = screen_fingerprint()
+        except Exception as e:
+            logging.warning(f"Ignoring detection state {self.path}: {e}")
+            return False
+        if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+            logging.info(f"Ignoring detection state {self.path}: unknown version")
+            return False
+        # The cooldown holds even if the positions are stale
+        if isinstance(state.get('last_action'), NUMBER):
+            self.last_action = state['last_action']
+        if state.get('screen') != monitors:
+            logging.info("Ignoring detection state: the display layout changed")
+            return False
+        self._apply(state, args, mic_image, multi)
+        self._saved = state
+        return True
+
+    def _apply(self, state, args, mic_image, multi):
+        global last_matched_scale, last_matched_variant
+        if state.get('scale') in (getattr(args, 'scales', None) or [1.0]):
+            last_matched_scale = state['scale']
+        variant = state.get('variant')
+        if variant is not None and isinstance(mic_image, TemplateSet) and any(v.name == variant for v in mic_image.variants):
+            mic_image.last_matched = last_matched_variant = variant
+        positions = [Point(p['x'], p['y']) for p in state.get('positions', [])]
+        for pos in reversed(positions):
+            roi_tracker.remember(pos)
+        if multi is not None:
+            now = time.time()
+            for p in state.get('targets', []):
+                multi.targets.append(Target(multi._next_id, Point(p['x'], p['y']), now))
+                multi._next_id += 1
+        logging.info(f"Warm start from {self.path}: {len(positions)} position(s)"
+                     + (f", {len(state.get('targets', []))} window(s)" if multi is not None else "")
+                     + f", scale {last_matched_scale:g}" + (f", variant {variant}" if variant else ""))
+
+detection_state = None
+
+def locate_in_region(region, mic_image, kind='roi', levels=0):
+    """
+    ROI search at the last matched scale. Returns the icon center in screen coordinates or None.
+    Small boxes are matched at full resolution; `levels` > 0 adds the pyramid's coarse pass for wide ones.
+    """
+    with metrics.time('roi_capture'):
+        frame = capture_screen(region)
+    params = (region, last_matched_scale, levels, mic_image.mtime)
+    with metrics.time('roi_match'):
+        match = frame_detector.detect(
+            kind, params, frame,
+            lambda f: match_frame(f, mic_image, [last_matched_scale], levels))
+    if frame_detector.was_reused(kind):
+        metrics.inc('match_skipped')
+    if not match:
+        return None
+    _remember_variant(mic_image, match)
+    return Point(region[0] + match.center.x, region[1] + match.center.y)
+
+def _remember_variant(mic_image, match):
+    global last_matched_variant
+    if isinstance(mic_image, TemplateSet):
+        mic_image.last_matched = match.variant
+    if match.variant != last_matched_variant:
+        if match.variant is not None:
+            logging.info(f"Template variant '{match.variant}' matched")
+        last_matched_variant = match.variant
+
+def locate_full_screen(args, mic_image):
+    """Full-screen fallback: pyramid search over a fresh screenshot, trying the last matched scale first."""
+    scales = list(getattr(args, 'scales', None) or [1.0])
+    if last_matched_scale in scales:
+        scales.remove(last_matched_scale)
+        scales.insert(0, last_matched_scale)
+
+    levels = getattr(args, 'pyramid_levels', 2)
+    windows = search_regions()
+    if windows is not None:
+        return _locate_in_windows(windows, mic_image, scales, levels)
+    try:
+        with metrics.time('full_capture'):
+            region = capture_backend.screen_region()
+            screen = capture_screen(region)
+    except Exception as e:
+        raise ScreenUnavailableError(f"Screen capture failed: {e}") from e
+    roi_tracker.last_scan_area = region[2] * region[3]
+    if is_blank(screen):
+        raise ScreenUnavailableError("Screen is blank")
+    with metrics.time('full_match'):
+        match = frame_detector.detect(
+            'full', (region, tuple(scales), levels, mic_image.mtime), screen,
+            lambda f: match_frame(f, mic_image, scales, levels))
+    if frame_detector.was_reused('full'):
+        metrics.inc('match_skipped')
+    return _matched_position(region, mic_image, match)
+
+def _matched_position(region, mic_image, match):
+    """Screen position of a full-scan match (None if no match), remembering its variant and scale."""
+    global last_matched_scale
+    if not match:
+        return None
+    _remember_variant(mic_image, match)
+    if match.scale != last_matched_scale:
+        logging.info(f"Template matched at display scale {match.scale:g}")
+        last_matched_scale = match.scale
+    return Point(region[0] + match.center.x, region[1] + match.center.y)
+
+def _locate_in_windows(regions, mic_image, scales, levels):
+    """
+    Full-scan fallback restricted to the chat areas of Cursor windows (--windows).
+    Each region is captured and matched in turn (capture buffers are reused per size).
+    """
+    roi_tracker.last_scan_area = sum(r[2] * r[3] for r in regions)
+    best = None
+    blank = 0
+    for i, region in enumerate(regions):
+        kind = f'window-{i}'
+        try:
+            with metrics.time('full_capture'):
+                frame = capture_screen(region)
+        except Exception as e:
+            raise ScreenUnavailableError(f"Screen capture failed: {e}") from e
+        if is_blank(frame):
+            blank += 1
+            continue
+        with metrics.time('full_match'):
+            match = frame_detector.detect(
+                kind, (region, tuple(scales), levels, mic_image.mtime), frame,
+                lambda f: match_frame(f, mic_image, scales, levels))
+        if frame_detector.was_reused(kind):
+            metrics.inc('match_skipped')
+        if match and (best is None or match.score > best[1].score):
+            best = (region, match)
+    if regions and blank == len(regions):
+        raise ScreenUnavailableError("Screen is blank")
+    # Parked only if no window changed
+    frame_detector.last_reused = all(frame_detector.was_reused(f'window-{i}') for i in range(len(regions)))
+    if best is None:
+        return None
+    return _matched_position(best[0], mic_image, best[1])
+
+def paste_text(text):
+    """Paste text through the clipboard, restoring the previous clipboard contents afterwards."""
+    try:
+        saved = pyperclip.paste()
+    except Exception as e:
+        logging.warning(f"Could not read clipboard, it will not be restored: {e}")
+        saved = None
+    pyperclip.copy(text)
+    try:
+        pyautogui.hotkey('command' if sys.platform == 'darwin' else 'ctrl', 'v')
+        time.sleep(CLIPBOARD_SETTLE)
+    finally:
+        if saved is not None:
+            pyperclip.copy(saved)
+
+def bulk_type_text(text):
+    """Type text in one burst: xdotool on X11, otherwise synthetic keys without per-key delay."""
+    if sys.platform.startswith('linux') and shutil.which('xdotool'):
+        subprocess.run(['xdotool', 'type', '--delay', '0', '--', text], check=True, timeout=XDOTOOL_TIMEOUT)
+    else:
+        pyautogui.write(text, interval=0)
+
+def type_text(text):
+    """Type text one character at a time (slowest, works everywhere)."""
+    pyautogui.write(text, interval=TYPE_INTERVAL)
+
+INJECTORS = {
+    'clipboard': paste_text,
+    'bulk': bulk_type_text,
+    'type': type_text,
+}
+
+def inject_text(text, method='auto'):
+    """
+    Deliver text into the focused input with the chosen method, falling back to
+    the next slower one if it fails. Returns the method that was used.
+    """
+    if method == 'auto':
+        method = 'clipboard' if PYPERCLIP_AVAILABLE else 'bulk'
+    if method == 'clipboard' and not PYPERCLIP_AVAILABLE:
+        logging.warning("pyperclip is not installed. Falling back to bulk typing.")
+        method = 'bulk'
+
+    order = ['clipboard', 'bulk', 'type']
+    for candidate in order[order.index(method):]:
+        start = time.perf_counter()
+        try:
+            INJECTORS[candidate](text)
+        except Exception as e:
+            if candidate == 'type':
+                raise
+            logging.warning(f"Text injection via {candidate} failed: {e}. Trying a slower method.")
+            continue
+        logging.info(f"Text delivered via {candidate} in {time.perf_counter() - start:.2f}s ({len(text)} chars)")
+        return candidate
+
+class ScanScheduler:
+    """
+    Picks the delay before the next scan from what the last cycle observed.
+    Polls fast around the time the agent is expected to finish (learned from
+    previous runs) and backs off exponentially while it is busy or parked.
+    """
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = min_interval
+        self.last_interval = None
+        self.action_time = None
+        self.expected_run = None
+
+    def set_bounds(self, min_interval, max_interval):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+
+    def _record_run(self, now):
+        # Time from our previous action to the agent being idle again
+        if self.action_time is None:
+            return
+        duration = now - self.action_time
+        if self.expected_run is None:
+            self.expected_run = duration
+        else:
+            self.expected_run = 0.7 * self.expected_run + 0.3 * duration
+
+    def _finish_expected(self, now):
+        if self.action_time is None or self.expected_run is None:
+            return False
+        elapsed = now - self.action_time
+        return FAST_POLL_START * self.expected_run <= elapsed <= FAST_POLL_END * self.expected_run
+
+    def next_interval(self, state, now, cooldown_remaining=0.0):
+        if state in ('paused', 'locked'):
+            self.interval = self.min_interval
+            interval = max(DORMANT_INTERVAL, self.max_interval)
+        elif state == 'acted':
+            self._record_run(now)
+            self.action_time = now
+            self.interval = self.min_interval
+            interval = max(cooldown_remaining, self.min_interval)
+        elif state == 'cooldown':
+            # Nothing to do until the cooldown ends; poll fast right after it
+            self.interval = self.min_interval
+            interval = max(cooldown_remaining, self.min_interval)
+        elif state == 'found':
+            # Icon is there but we held back (polite mode); retry soon
+            interval = self.min_interval
+        elif self._finish_expected(now):
+            self.interval = self.min_interval
+            interval = self.interval
+        else:
+            # busy or parked: back off
+            self.interval = min(self.interval * SCAN_BACKOFF, self.max_interval)
+            interval = self.interval
+        self.last_interval = interval
+        return interval
+
+def report_scan_interval(interval, state, previous):
+    """Publish the delay the scheduler chose; log it at INFO when it changed."""
+    metrics.set('scan_interval_seconds', interval)
+    level = logging.DEBUG if previous is not None and abs(interval - previous) < 0.005 else logging.INFO
+    logging.log(level, f"Next scan in {interval:.2f}s (state: {state})")
+
+def wait_for_next_cycle(interval):
+    """Sleep until the next scan, waking early on pause/resume or quit."""
+    wake_event.wait(interval)
+    wake_event.clear()
+
+class ActionVerifier:
+    """
+    Post-action check (--verify-window). After Enter, the icon's ROI is watched: once
+    the icon is gone the agent has started, the time from detection is logged and the
+    cooldown is released. If it is still there when the window ends, the action is sent
+    again with a window VERIFY_BACKOFF times longer, at most VERIFY_RETRIES times.
+    All of a cycle's verification ends by its deadline (VERIFY_BUDGET windows).
+    """
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+
+    def _icon_gone(self, region, mic_image):
+        """True or False, or None if the screen couldn't be checked."""
+        try:
+            with metrics.time('verify'):
+                return locate_in_region(region, mic_image, kind='verify') is None
+        except Exception as e:
+            logging.warning(f"Verification capture failed: {e}. Not retrying.")
+            return None
+
+    def deadline(self, args):
+        """Time by which a cycle starting now must finish verifying."""
+        return self.clock() + getattr(args, 'verify_window', 0) * VERIFY_BUDGET
+
+    def verify(self, args, mic_image, pos, detected_at, action_time, retry, deadline=None):
+        """
+        Returns the last_action_time to keep: one that ends the cooldown now if the agent
+        started, else the time of the last attempt. retry(action_time) sends the action
+        again and returns (action_time, action_taken) like act_on. deadline is shared by
+        the targets of a multi cycle; by default this call gets the whole budget.
+        """
+        window = getattr(args, 'verify_window', 0)
+        if not window or args.dry_run:
+            return action_time
+        if deadline is None:
+            deadline = self.deadline(args)
+        if self.clock() >= deadline:
+            logging.debug("No verification time left in this cycle.")
+            return action_time
+        region = roi_around(pos, getattr(args, 'roi_size', ROI_SIZE))
+        for attempt in range(VERIFY_RETRIES + 1):
+            window_end = min(self.clock() + window * VERIFY_BACKOFF ** attempt, deadline)
+            while True:
+                gone = self._icon_gone(region, mic_image)
+                if gone is None:
+                    # Unknown: sending again could type the prompt twice
+                    metrics.inc('actions_unconfirmed')
+                    return action_time
+                if gone:
+                    elapsed = self.clock() - detected_at
+                    logging.info(f"Agent restarted {elapsed:.2f}s after detection"
+                                 + (f" ({attempt} retr{'y' if attempt == 1 else 'ies'})" if attempt else "") + ".")
+                    metrics.observe('detect_to_restart', elapsed)
+                    metrics.inc('actions_confirmed')
+                    return time.time() - args.cooldown
+                if self.clock() >= window_end:
+                    break
+                self.sleep(VERIFY_POLL)
+            if attempt == VERIFY_RETRIES or bot_paused or not bot_running or self.clock() >= deadline:
+                break
+            logging.warning(f"Icon still visible {window * VERIFY_BACKOFF ** attempt:g}s after sending. Sending again...")
+            metrics.inc('action_retries')
+            action_time, action_taken = retry(action_time)
+            if not action_taken:
+                break
+        logging.warning(f"Could not confirm that the agent started. Waiting out the {args.cooldown:g}s cooldown.")
+        metrics.inc('actions_unconfirmed')
+        return action_time
+
+action_verifier = ActionVerifier()
+
+def process_cycle(args, mic_image, last_action_time):
+    """
+    Runs one cycle of scanning and action.
+    Returns (updated_last_action_time, action_taken_bool)
+    """
+    global cycle_state
+    
+    if bot_paused:
+        cycle_state = 'paused'
+        return last_action_time, False
+
+    current_time = time.time()
+    
+    # Only check if cooldown has passed
+    if current_time - last_action_time < args.cooldown:
+        cycle_state = 'cooldown'
+        return last_action_time, False
+
+    mic_location = find_icon(args, mic_image)
+    if not mic_location:
+        return last_action_time, False
+    detected_at = action_verifier.clock()
+    last_action_time, action_taken = act_on(args, mic_location, last_action_time)
+    if action_taken:
+        last_action_time = action_verifier.verify(
+            args, mic_image, mic_location, detected_at, last_action_time,
+            lambda t: act_on(args, mic_location, t, notify=False))
+    return last_action_time, action_taken
+
+def find_icon(args, mic_image):
+    """
+    Detection half of a cycle: remembered ROIs first, then the full screen.
+    Returns the icon position or None, and sets cycle_state (locked, busy, parked or found).
+    """
+    global last_known_mic_pos, cycle_state
+    mic_location = None
+    
+    # 1. Try the Regions of Interest (ROI) around remembered locations
+    if roi_tracker.candidates:
+        try:
+            mic_location = roi_tracker.locate(mic_image, levels=getattr(args, 'pyramid_levels', 2))
+        except Exception:
+            pass
+        metrics.inc('roi_hits' if mic_location else 'roi_misses')
+
+    # 2. Fallback to Full Screen if not found in ROI
+    if not mic_location:
+        try:
+            mic_location = locate_full_screen(args, mic_image)
+        except ScreenUnavailableError as e:
+            if cycle_state != 'locked':
+                logging.warning(f"{e}. Waiting for the screen to come back.")
+            cycle_state = 'locked'
+            return None
+        except Exception as e:
+            logging.error(f"Error searching for image: {e}")
+        roi_tracker.full_scan(mic_location)
+
+    if not mic_location:
+        cycle_state = 'parked' if frame_detector.last_reused else 'busy'
+        return None
+
+    cycle_state = 'found'
+    metrics.inc('detections')
+    variant = f" (variant: {last_matched_variant})" if last_matched_variant else ""
+    logging.info(f"Microphone detected at {mic_location}{variant}. Agent is idle.")
+    last_known_mic_pos = mic_location 
+    return mic_location
+
+def act_on(args, mic_location, last_action_time, notify=None):
+    """Action half of a cycle: polite-mode check, then click and type. Returns like process_cycle."""
+    # Polite mode check
+    if not args.no_polite:
+        logging.info("Checking for user activity...")
+        with metrics.time('polite_check'):
+            user_active = user_is_active(args.idle_threshold)
+        if user_active:
+            logging.warning("User activity detected. Skipping this cycle to be polite.")
+            return last_action_time, False
+    
+    synthetic = activity_tracker.synthetic_input() if activity_tracker else contextlib.nullcontext()
+    try:
+        with action_lock, synthetic:
+            return _perform_action(args, mic_location, last_action_time, notify)
+    except Exception as e:
+        logging.error(f"Error performing action: {e}")
+        return last_action_time, False
+
+def _perform_action(args, mic_location, last_action_time, notify=None):
+    """
+    Click the chat input, send the text and restore the mouse. Returns like process_cycle.
+    notify overrides args.notify (the asyncio runtime sends notifications itself).
+    """
+    global cycle_state
+    # Save current mouse position to restore later
+    original_mouse_x, original_mouse_y = screen_driver.position()
+    logging.info(f"Saved mouse position: ({original_mouse_x}, {original_mouse_y})")
+    
+    target_x = mic_location.x + args.offset_x
+    target_y = mic_location.y + args.offset_y
+    
+    logging.info(f"Target coordinates: ({target_x}, {target_y})")
+    
+    if args.dry_run:
+        logging.info("[DRY RUN] Moving to target...")
+        screen_driver.move_to(target_x, target_y)
+        time.sleep(1)
+        logging.info("[DRY RUN] Would click and type here.")
+        screen_driver.move_rel(10, 0)
+        screen_driver.move_rel(-20, 0)
+        screen_driver.move_rel(10, 0)
+        cycle_state = 'acted'
+    else:
+        logging.info(f"Clicking at target...")
+        # Focus the chat input
+        with metrics.time('click'):
+            screen_driver.click(target_x, target_y)
+        
+        # Small delay to ensure focus
+        if screen_driver.focus_delay:
+            time.sleep(screen_driver.focus_delay)
+        
+        # Type text and press Enter
+        logging.info("Typing text...")
+        with metrics.time('text_injection'):
+            screen_driver.inject_text(args.text, args.inject)
+            logging.info("Pressing Enter...")
+            screen_driver.press('enter')
+        
+        logging.info("Sent 'continue'.")
+        last_action_time = time.time()
+        cycle_state = 'acted'
+        metrics.inc('actions')
+        
+        if args.notify if notify is None else notify:
+            send_notification("Cursor Auto-Continue", "Sent 'continue' command.")
+        if checkpointer:
+            checkpointer.request()
+
+    # Restore mouse position
+    logging.info(f"Restoring mouse to: ({original_mouse_x}, {original_mouse_y})")
+    with metrics.time('mouse_restore'):
+        screen_driver.move_to(original_mouse_x, original_mouse_y)
+    
+    return (last_action_time if args.dry_run else time.time()), True
+
+class Target:
+    """One Cursor chat (microphone icon instance) tracked in multi-target mode."""
+
+    def __init__(self, target_id, pos, now):
+        self.id = target_id
+        self.pos = pos
+        self.last_action_time = 0.0
+        self.last_seen = now
+        self.idle = False  # icon visible in the last cycle
+        self.actions = 0
+
+    def __repr__(self):
+        return f"Target {self.id} at ({self.pos.x}, {self.pos.y})"
+
+class MultiTargetTracker:
+    """
+    Finds every microphone icon on every monitor and keeps per-target state.
+    Known targets are checked in their own ROI; all monitors are scanned when
+    an ROI misses or periodically to discover new windows. Scans run on a thread pool.
+    """
+
+    def __init__(self, args, mic_image, workers=None):
+        self.args = args
+        self.mic_image = mic_image
+        self.targets = []
+        self._next_id = 1
+        self._last_discovery = 0.0
+        self.unchanged = False
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="scan")
+
+    def _scan_roi(self, target):
+        try:
+            return locate_in_region(roi_around(target.pos, getattr(self.args, 'roi_size', ROI_SIZE)), self.mic_image, kind=f'roi-{target.id}')
+        except Exception:
+            return None
+
+    def _scan_monitor(self, index, region, prefix='monitor'):
+        kind = f'{prefix}-{index}'
+        try:
+            with metrics.time('full_capture'):
+                frame = capture_screen(region)
+        except Exception as e:
+            raise ScreenUnavailableError(f"Screen capture failed: {e}") from e
+        if is_blank(frame):
+            return None
+        scales = tuple(getattr(self.args, 'scales', None) or [1.0])
+        levels = getattr(self.args, 'pyramid_levels', 2)
+        with metrics.time('full_match'):
+            matches = frame_detector.detect(
+                kind, (region, scales, levels, self.mic_image.mtime), frame,
+                lambda f: match_frame(f, self.mic_image, scales, levels, find_all=True))
+        if frame_detector.was_reused(kind):
+            metrics.inc('match_skipped')
+        return [Point(region[0] + m.center.x, region[1] + m.center.y) for m in matches]
+
+    def scan(self, now):
+        """Return the screen positions of all visible icons."""
+        found = []
+        missed = not self.targets
+        if self.targets:
+            results = list(self.executor.map(in_context(self._scan_roi), self.targets))
+            found = [pos for pos in results if pos]
+            missed = len(found) < len(self.targets)
+            metrics.inc('roi_hits', len(found))
+            metrics.inc('roi_misses', len(self.targets) - len(found))
+
+        self.unchanged = False
+        if missed or now - self._last_discovery >= DISCOVERY_INTERVAL:
+            self._last_discovery = now
+            windows = search_regions()
+            regions = capture_backend.monitor_regions() if windows is None else windows
+            prefix = 'monitor' if windows is None else 'window'
+            scan_monitor = in_context(lambda i: self._scan_monitor(i, regions[i], prefix))
+            results = list(self.executor.map(scan_monitor, range(len(regions))))
+            if regions and all(r is None for r in results):
+                raise ScreenUnavailableError("Screen is blank")
+            found = [pos for r in results if r for pos in r]
+            self.unchanged = all(frame_detector.was_reused(f'{prefix}-{i}') for i in range(len(regions)))
+        return found
+
+    def update(self, found, now):
+        """Match detections to known targets (nearest within TARGET_MATCH_RADIUS). Returns targets with a visible icon."""
+        for target in self.targets:
+            target.idle = False
+        for pos in found:
+            nearest = None
+            for target in self.targets:
+                distance = abs(target.pos.x - pos.x) + abs(target.pos.y - pos.y)
+                if not target.idle and distance <= TARGET_MATCH_RADIUS and (nearest is None or distance < nearest[0]):
+                    nearest = (distance, target)
+            if nearest:
+                target = nearest[1]
+            else:
+                target = Target(self._next_id, pos, now)
+                self._next_id += 1
+                self.targets.append(target)
+                logging.info(f"New agent window: {target}")
+            target.pos = pos
+            target.idle = True
+            target.last_seen = now
+        self.targets = [t for t in self.targets if now - t.last_seen < TARGET_EXPIRY]
+        return [t for t in self.targets if t.idle]
+
+    def cooldown_remaining(self, now, cooldown):
+        """
+        Seconds until the next target leaves cooldown. 0 if one is ready now or
+        if some agent is busy, since it may finish at any moment.
+        """
+        if not self.targets or not all(t.idle for t in self.targets):
+            return 0.0
+        return min(max(0.0, t.last_action_time + cooldown - now) for t in self.targets)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+def find_ready_targets(args, tracker):
+    """
+    Detection half of a multi-target cycle: scan all targets and return the idle
+    ones whose cooldown has passed. Sets cycle_state.
+    """
+    global cycle_state
+    now = time.time()
+    try:
+        found = tracker.scan(now)
+    except ScreenUnavailableError as e:
+        if cycle_state != 'locked':
+            logging.warning(f"{e}. Waiting for the screen to come back.")
+        cycle_state = 'locked'
+        return []
+
+    idle = tracker.update(found, now)
+    if not idle:
+        cycle_state = 'parked' if tracker.unchanged else 'busy'
+        return []
+
+    ready = [t for t in idle if now - t.last_action_time >= args.cooldown]
+    if not ready:
+        if len(idle) == len(tracker.targets):
+            cycle_state = 'cooldown'
+        else:
+            cycle_state = 'parked' if tracker.unchanged else 'busy'
+        return []
+    cycle_state = 'found'
+    return ready
+
+def process_multi_cycle(args, tracker):
+    """
+    One multi-target cycle: scan all targets, then act on every idle agent whose
+    cooldown has passed. Actions run one at a time. Returns the number of actions taken.
+    """
+    global cycle_state
+    if bot_paused:
+        cycle_state = 'paused'
+        return 0
+
+    ready = find_ready_targets(args, tracker)
+    if not ready:
+        return 0
+
+    detected_at = action_verifier.clock()
+    verify_deadline = action_verifier.deadline(args)
+    acted = 0
+    for target in ready:
+        if not args.no_polite:
+            with metrics.time('polite_check'):
+                user_active = user_is_active(args.idle_threshold)
+            if user_active:
+                logging.warning("User activity detected. Skipping remaining targets to be polite.")
+                break
+        metrics.inc('detections')
+        logging.info(f"Microphone detected: {target}. Agent is idle.")
+        synthetic = activity_tracker.synthetic_input() if activity_tracker else contextlib.nullcontext()
+        try:
+            with action_lock, synthetic:
+                action_time, action_taken = _perform_action(args, target.pos, target.last_action_time)
+        except Exception as e:
+            logging.error(f"Error performing action on {target}: {e}")
+            continue
+        if action_taken:
+            target.last_action_time = action_verifier.verify(
+                args, tracker.mic_image, target.pos, detected_at, action_time,
+                lambda t, pos=target.pos: act_on(args, pos, t, notify=False), verify_deadline)
+            target.actions += 1
+            acted += 1
+    cycle_state = 'acted' if acted else 'found'
+    return acted
+
+class AsyncRuntime:
+    """
+    asyncio runtime (--runtime asyncio). The same cycle as bot_loop, split into
+    pipeline stages connected by bounded queues: detection (capture and match on an
+    executor), action (polite check, click and typing on a dedicated input thread)
+    and notifications. The activity tracker keeps feeding the polite check from its
+    own listener thread. The next frame is captured and matched while the previous
+    action is still being delivered; a target is never queued twice.
+    """
+
+    def __init__(self, args, mic_image):
+        self.args = args
+        self.mic_image = mic_image
+        self.multi = MultiTargetTracker(args, mic_image, args.workers) if args.multi else None
+        self.scheduler = ScanScheduler(args.min_interval, args.max_interval)
+        self.last_action_time = 0.0
+        self.pending = set()  # targets queued or being acted on
+        self.detected_at = {}  # target -> when its action was queued
+        self.verify_deadlines = {}  # target -> verification deadline shared with its scan
+        self.acted = False  # an action finished since the last scheduling decision
+        self.match_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="match")
+        # pyautogui is not thread-safe: all input comes from one thread
+        self.action_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="action")
+        self.actions = None
+        self.notifications = None
+
+    async def run(self):
+        self.actions = asyncio.Queue(maxsize=MAX_TARGETS if self.multi else 1)
+        self.notifications = asyncio.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        logging.info("Starting asyncio pipeline...")
+        if detection_state:
+            detection_state.restore(self.args, self.mic_image, self.multi)
+        stages = [asyncio.create_task(self.action_stage()), asyncio.create_task(self.notify_stage())]
+        try:
+            await self.detect_stage()
+        finally:
+            await self.actions.put(None)
+            # Let the last actions queue their notifications before the notifier stops
+            await asyncio.gather(stages[0], return_exceptions=True)
+            await self.notifications.put(None)
+            await asyncio.gather(*stages, return_exceptions=True)
+            if detection_state:
+                detection_state.save(self.multi, force=True)
+            self.match_executor.shutdown(wait=False)
+            self.action_executor.shutdown(wait=False)
+            if self.multi:
+                self.multi.close()
+            else:
+                logging.info(roi_tracker.report())
+
+    def cooldown_remaining(self, now):
+        if self.multi:
+            return self.multi.cooldown_remaining(now, self.args.cooldown)
+        return max(0.0, self.last_action_time + self.args.cooldown - now)
+
+    def offer(self, key, item, verify_deadline=None):
+        """Queue an action unless one for the same target is already pending."""
+        if key in self.pending:
+            return False
+        try:
+            # The action is timed and logged under the cycle that found it
+            self.actions.put_nowait((key, item, cycle_log.hold()))
+        except asyncio.QueueFull:
+            # The action stage is behind; the next scan offers it again
+            return False
+        self.pending.add(key)
+        self.detected_at[key] = action_verifier.clock()
+        self.verify_deadlines[key] = verify_deadline
+        return True
+
+    async def detect(self, loop):
+        global cycle_state
+        if bot_paused:
+            cycle_state = 'paused'
+        elif self.multi:
+            ready = await loop.run_in_executor(self.match_executor, in_context(find_ready_targets), self.args, self.multi)
+            # Targets found by one scan share one verification budget
+            verify_deadline = action_verifier.deadline(self.args)
+            for target in ready:
+                self.offer(target.id, target, verify_deadline)
+        elif time.time() - self.last_action_time < self.args.cooldown:
+            cycle_state = 'cooldown'
+        else:
+            mic_location = await loop.run_in_executor(self.match_executor, in_context(find_icon), self.args, self.mic_image)
+            if mic_location:
+                self.offer(None, mic_location)
+
+    async def detect_stage(self):
+        loop = asyncio.get_running_loop()
+        while bot_running:
+            try:
+                if config_watcher:
+                    if config_watcher.apply_pending(self.args, self.mic_image) & {'min_interval', 'max_interval'}:
+                        self.scheduler.set_bounds(self.args.min_interval, self.args.max_interval)
+                with cycle_log.cycle(), metrics.time('detect'):
+                    await self.detect(loop)
+                state = cycle_state
+                if self.acted:
+                    state, self.acted = 'acted', False
+                now = time.time()
+                previous = self.scheduler.last_interval
+                interval = self.scheduler.next_interval(state, now, self.cooldown_remaining(now))
+                report_scan_interval(interval, state, previous)
+                if detection_state:
+                    detection_state.save(self.multi)
+                await loop.run_in_executor(None, wait_for_next_cycle, interval)
+            except Exception as e:
+                logging.error(f"Error in bot loop: {e}")
+                await asyncio.sleep(5)
+
+    async def act(self, loop, key, item):
+        pos = item if key is None else item.pos
+        if key is None:
+            previous = self.last_action_time
+        else:
+            previous = item.last_action_time
+            metrics.inc('detections')
+            logging.info(f"Microphone detected: {item}. Agent is idle.")
+        action_time, action_taken = await loop.run_in_executor(
+            self.action_executor, in_context(act_on), self.args, pos, previous, False)
+        if not action_taken:
+            return
+        cycle_log.set_state('acted')
+        # Verification (and any resend) stays on the input thread
+        action_time = await loop.run_in_executor(
+            self.action_executor, in_context(action_verifier.verify), self.args, self.mic_image, pos,
+            self.detected_at.get(key, action_verifier.clock()), action_time,
+            lambda t: act_on(self.args, pos, t, False), self.verify_deadlines.get(key))
+        if key is None:
+            self.last_action_time = action_time
+        else:
+            item.last_action_time = action_time
+            item.actions += 1
+        self.acted = True
+        if self.args.notify:
+            try:
+                self.notifications.put_nowait("Sent 'continue' command.")
+            except asyncio.QueueFull:
+                logging.warning("Too many pending notifications. Dropping one.")
+        if self.args.once:
+            logging.info("Action taken. Exiting (--once mode).")
+            quit_app()
+
+    async def action_stage(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.actions.get()
+            if job is None:
+                return
+            key, item, cycle = job
+            try:
+                with cycle_log.resume(cycle):
+                    if bot_running and not bot_paused:
+                        with metrics.time('action'):
+                            await self.act(loop, key, item)
+            except Exception as e:
+                logging.error(f"Error performing action: {e}")
+            finally:
+                self.pending.discard(key)
+                self.detected_at.pop(key, None)
+                self.verify_deadlines.pop(key, None)
+
+    async def notify_stage(self):
+        while True:
+            message = await self.notifications.get()
+            if message is None:
+                return
+            send_notification("Cursor Auto-Continue", message)
+
+def bot_loop(args, mic_image):
+    """Thread function for the main bot logic"""
+    global bot_running
+    if getattr(args, 'runtime', 'thread') == 'asyncio':
+        asyncio.run(AsyncRuntime(args, mic_image).run())
+        return
+    last_action_time = 0
+    scheduler = ScanScheduler(args.min_interval, args.max_interval)
+    multi = MultiTargetTracker(args, mic_image, args.workers) if args.multi else None
+    logging.info("Starting background bot thread...")
+    if detection_state:
+        detection_state.restore(args, mic_image, multi)
+    
+    while bot_running:
+        try:
+            if config_watcher:
+                if config_watcher.apply_pending(args, mic_image) & {'min_interval', 'max_interval'}:
+                    scheduler.set_bounds(args.min_interval, args.max_interval)
+            with cycle_log.cycle(), metrics.time('cycle'):
+                if multi:
+                    action_taken = process_multi_cycle(args, multi) > 0
+                else:
+                    last_action_time, action_taken = process_cycle(args, mic_image, last_action_time)
+            
+            if args.once:
+                if action_taken:
+                    logging.info("Action taken. Exiting (--once mode).")
+                    quit_app()
+                    break
+            
+            now = time.time()
+            if multi:
+                cooldown_remaining = multi.cooldown_remaining(now, args.cooldown)
+            else:
+                cooldown_remaining = max(0.0, last_action_time + args.cooldown - now)
+            previous = scheduler.last_interval
+            interval = scheduler.next_interval(cycle_state, now, cooldown_remaining)
+            report_scan_interval(interval, cycle_state, previous)
+            if detection_state:
+                detection_state.save(multi)
+            wait_for_next_cycle(interval)
+        except Exception as e:
+            logging.error(f"Error in bot loop: {e}")
+            time.sleep(5) 
+
+    if detection_state:
+        detection_state.save(multi, force=True)
+    if multi:
+        multi.close()
+    else:
+        logging.info(roi_tracker.report())
+
+def validate_image(image_path, verify=True):
+    """Ensure image file exists and is readable."""
+    if not os.path.exists(image_path):
+        logging.error(f"Image file not found: {image_path}")
+        return False
+    if not verify:
+        return True
+    try:
+        with Image.open(image_path) as img:
+            img.verify() # Verify it's a valid image
+        return True
+    except (IOError, SyntaxError, PIL.UnidentifiedImageError) as e:
+        logging.error(f"Invalid image file '{image_path}': {e}")
+        return False
+
+def load_autotune_frames(source=None):
+    """(name, BGR frame) pairs to tune on: every image in the `source` folder, or one capture of the screen."""
+    if not source:
+        return [('screen', capture_screen())]
+    frames = []
+    for name in sorted(os.listdir(source)):
+        if not name.lower().endswith(AUTOTUNE_IMAGE_EXTENSIONS):
+            continue
+        frame = cv2.imread(os.path.join(source, name), cv2.IMREAD_COLOR)
+        if frame is None:
+            logging.warning(f"Autotune: skipping unreadable screenshot {name}")
+            continue
+        frames.append((name, frame))
+    if not frames:
+        raise ValueError(f"no screenshots in {source}")
+    return frames
+
+def _best_time(func, repeats=AUTOTUNE_REPEATS):
+    """Fastest of `repeats` runs in seconds, and the last result."""
+    best, result = None, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        if elapsed > AUTOTUNE_SLOW:
+            break
+    return best, result
+
+def _score_map(frame, tpl, grayscale):
+    hay = _to_gray(frame) if grayscale else frame
+    if tpl.shape[0] > hay.shape[0] or tpl.shape[1] > hay.shape[1]:
+        return None
+    result = cv2.matchTemplate(hay, tpl, cv2.TM_CCOEFF_NORMED)
+    np.nan_to_num(result, copy=False, nan=-1.0, posinf=-1.0, neginf=-1.0)
+    return result
+
+def _icon_margins(frames, references, template, scales, grayscale):
+    """
+    Per variant: the weakest full-resolution score of a reference icon it matched,
+    and the best score anywhere else (look-alikes). Returns {name: [icon, other]}.
+    """
+    margins = {v.name: [None, -1.0] for v in template.variants}
+    for (_, frame), matches in zip(frames, references):
+        for variant in template.variants:
+            for scale in scales:
+                tpl = variant.template.scaled(scale, grayscale=grayscale)
+                result = _score_map(frame, tpl, grayscale)
+                if result is None:
+                    continue
+                th, tw = tpl.shape[:2]
+                for match in matches:
+                    # Blank every icon instance (whichever variant found it) before looking for look-alikes
+                    x, y = match.center.x - tw // 2, match.center.y - th // 2
+                    window = result[max(0, y - th // 2):max(0, y + th // 2 + 1), max(0, x - tw // 2):max(0, x + tw // 2 + 1)]
+                    if match.variant == variant.name and match.scale == scale and window.size:
+                        score = float(window.max())
+                        icon = margins[variant.name][0]
+                        margins[variant.name][0] = score if icon is None else min(icon, score)
+                    window[...] = -1.0
+                margins[variant.name][1] = max(margins[variant.name][1], float(result.max()))
+    return margins
+
+def _tuned_confidence(variant, icon, other):
+    """Highest safe threshold for a variant, or None if its icon and look-alikes are too close."""
+    if icon is None:
+        # Never seen: keep its threshold, but stay clear of look-alikes
+        confidence = max(variant.confidence, other + 2 * AUTOTUNE_MARGIN)
+    else:
+        confidence = icon - AUTOTUNE_MARGIN
+    # Round down to 0.01 (the round() keeps 0.95 from flooring to 0.94)
+    confidence = np.floor(round(min(confidence, 0.99) * 100, 6)) / 100
+    if confidence - other < AUTOTUNE_MARGIN or confidence < AUTOTUNE_MIN_SCORE:
+        return None
+    return float(confidence)
+
+def _same_spot(match, references, tolerance=2):
+    """True if `match` is one of the reference icons, or if both are empty."""
+    if match is None or not references:
+        return match is None and not references
+    return any(abs(match.center.x - r.center.x) <= tolerance and abs(match.center.y - r.center.y) <= tolerance
+               for r in references)
+
+def autotune(frames, template, scales):
+    """
+    Benchmark matcher settings on `frames` and return the fastest reliable ones:
+    {'grayscale', 'pyramid_levels', 'confidences', 'roi_size', 'timings_ms'}.
+    A setting is reliable if it finds every reference icon at the same spot, finds nothing on
+    frames without one, and leaves AUTOTUNE_MARGIN between the icon score and the best look-alike.
+    The reference icons are the matches at each variant's configured confidence.
+    Raises ValueError if no frame shows the icon or no setting is reliable.
+    """
+    probe = TemplateSet(template.variants)
+    references = [locate_all_pyramid(frame, probe, scales=scales, levels=0) for _, frame in frames]
+    if not any(references):
+        raise ValueError("the icon is not visible in any screenshot")
+    seen_scales = [scale for scale in scales if any(m.scale == scale for matches in references for m in matches)]
+    timings = {}
+    candidates = []
+    for grayscale in (False, True):
+        mode = 'grayscale' if grayscale else 'color'
+        margins = _icon_margins(frames, references, template, scales, grayscale)
+        confidences = {v.name: _tuned_confidence(v, *margins[v.name]) for v in template.variants}
+        if None in confidences.values():
+            logging.info(f"Autotune: {mode} can't tell the icon from look-alikes "
+                         f"({', '.join(f'{name} icon={icon} other={other:.3f}' for name, (icon, other) in margins.items())})")
+            continue
+        tuned = TemplateSet([v._replace(confidence=confidences[v.name]) for v in template.variants])
+        for levels in AUTOTUNE_LEVELS:
+            total = 0.0
+            for (_, frame), matches in zip(frames, references):
+                seconds, match = _best_time(lambda: locate_pyramid(frame, tuned, scales=seen_scales, levels=levels, grayscale=grayscale))
+                if not _same_spot(match, matches):
+                    total = None
+                    break
+                total += seconds
+            key = f"{mode}/levels={levels}"
+            timings[key] = None if total is None else round(total / len(frames) * 1000, 2)
+            if total is not None:
+                candidates.append((total, grayscale, levels, confidences, tuned))
+    if not candidates:
+        raise ValueError("no setting detects the icon reliably")
+    _, grayscale, levels, confidences, tuned = min(candidates, key=lambda c: c[0])
+
+    # ROI box: the fastest size that still fits the icon comfortably
+    templates = {v.name: v.template for v in tuned.variants}
+    roi_size, roi_best = None, None
+    for size in AUTOTUNE_ROI_SIZES:
+        total, found = 0.0, 0
+        for (_, frame), matches in zip(frames, references):
+            if not matches:
+                continue
+            best = max(matches, key=lambda m: m.score)
+            tpl = templates[best.variant].scaled(best.scale)
+            if size < AUTOTUNE_ROI_FIT * max(tpl.shape[:2]):
+                total = None
+                break
+            left, top, width, height = roi_around(best.center, size)
+            left, top = max(0, left), max(0, top)
+            crop = frame[top:top + height, left:left + width]
+            seconds, match = _best_time(lambda: locate_pyramid(crop, tuned, scales=[best.scale], levels=0, grayscale=grayscale))
+            total += seconds
+            found += match is not None
+        if total is None or not found:
+            continue
+        timings[f"roi={size}"] = round(total / found * 1000, 3)
+        if roi_best is None or total < roi_best:
+            roi_size, roi_best = size, total
+    return {
+        'grayscale': grayscale,
+        'pyramid_levels': levels,
+        'confidences': confidences,
+        'roi_size': roi_size or ROI_SIZE,
+        'timings_ms': timings,
+    }
+
+def autotune_capture_backends(region):
+    """Best full-screen grab time (ms) per installed capture backend."""
+    timings = {}
+    for name in sorted(CAPTURE_BACKENDS):
+        if name == 'mss' and not MSS_AVAILABLE:
+            continue
+        backend = None
+        try:
+            backend = CAPTURE_BACKENDS[name]()
+            seconds, _ = _best_time(lambda: backend.grab(region))
+            timings[name] = round(seconds * 1000, 2)
+        except Exception as e:
+            logging.warning(f"Autotune: capture backend {name} failed: {e}")
+        finally:
+            if backend is not None:
+                backend.close()
+    return timings
+
+def run_autotune(args, template):
+    """--autotune: measure, log the timings and save the fastest reliable settings to config.json."""
+    source = args.autotune or None
+    frames = load_autotune_frames(source)
+    logging.info(f"Autotune: {len(frames)} screenshot(s) from {source or 'the current screen'}")
+    result = autotune(frames, template, list(args.scales))
+    for key, ms in result['timings_ms'].items():
+        logging.info(f"Autotune: {key}: {'unreliable' if ms is None else f'{ms:.2f}ms'}")
+
+    config = load_config()
+    # Only replace a backend that is still the default or was picked by an earlier autotune
+    tuned_backend = config.get('autotune', {}).get('capture_backend')
+    if tuned_backend is not None and config.get('capture_backend') != tuned_backend:
+        tuned_backend = None
+    if source is None and args.capture_backend in ('auto', tuned_backend):
+        capture = autotune_capture_backends(capture_backend.screen_region())
+        for name, ms in capture.items():
+            logging.info(f"Autotune: capture {name}: {ms:.2f}ms")
+        if capture:
+            tuned_backend = config['capture_backend'] = min(capture, key=capture.get)
+            result['timings_ms'].update({f"capture={name}": ms for name, ms in capture.items()})
+    elif source is None:
+        logging.info(f"Autotune: keeping capture_backend={args.capture_backend} chosen by the user")
+    config['grayscale'] = result['grayscale']
+    config['pyramid_levels'] = result['pyramid_levels']
+    config['roi_size'] = result['roi_size']
+    config['image'] = [{"path": path, "confidence": result['confidences'][variant.name]}
+                       for (path, _), variant in zip(args.image, template.variants)]
+    config['autotune'] = {
+        'tuned_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'screenshots': len(frames),
+        'timings_ms': result['timings_ms'],
+        # None when the backend is the user's choice
+        'capture_backend': tuned_backend,
+    }
+    logging.info(f"Autotune: grayscale={result['grayscale']}, pyramid_levels={result['pyramid_levels']}, "
+                 f"roi_size={result['roi_size']}, confidence={result['confidences']}"
+                 + (f", capture_backend={tuned_backend}" if tuned_backend else ""))
+    save_config(config)
+    return result
+
+def run_virtual(args, template):
+    """Run the bot loop against the virtual screen in the foreground, without hotkeys or tray."""
+    global bot_paused
+    bot_paused = False
+    logging.info(f"Virtual screen {args.virtual_screen}: {capture_backend.screen_region()[2]}x{capture_backend.screen_region()[3]}")
+    bot_thread = threading.Thread(target=bot_loop, args=(args, template), daemon=True)
+    bot_thread.start()
+    try:
+        while bot_thread.is_alive() and not screen_driver.done:
+            bot_thread.join(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_bot_thread(bot_thread)
+        logging.info(screen_driver.summary())
+
+def stop_bot_thread(bot_thread, timeout=BOT_STOP_TIMEOUT):
+    """Tell the bot loop to stop and wait for it, so its final state save runs before exit."""
+    global bot_running
+    bot_running = False
+    wake_event.set()
+    bot_thread.join(timeout)
+    if bot_thread.is_alive():
+        logging.warning(f"Bot thread still busy after {timeout:g}s. Exiting without waiting for it.")
+
+def run_once(args, template):
+    """
+    --scan-once: a single scan (and at most one action) in the foreground, then exit.
+    Starts no tray, hotkey listener or input listener; polite mode samples the mouse instead.
+    The cooldown counts from the last action recorded in the state file.
+    """
+    global bot_paused
+    bot_paused = False
+    if args.multi:
+        tracker = MultiTargetTracker(args, template, args.workers)
+        try:
+            if detection_state:
+                detection_state.restore(args, template, tracker)
+            action_taken = process_multi_cycle(args, tracker) > 0
+            if detection_state:
+                detection_state.save(tracker, force=True)
+        finally:
+            tracker.close()
+    else:
+        last_action_time = 0
+        if detection_state:
+            detection_state.restore(args, template)
+            last_action_time = detection_state.last_action
+        last_action_time, action_taken = process_cycle(args, template, last_action_time)
+        if detection_state:
+            detection_state.last_action = last_action_time
+            detection_state.save(force=True)
+    logging.info("Action taken." if action_taken else f"No action taken (state: {cycle_state}).")
+    return action_taken
+
+def release_resources(args):
+    """
+    Stop the match workers, window discovery and checkpoints, close the screen
+    capture (shared-memory mappings, daemon connections) and write the final metrics file.
+    """
+    if match_pool:
+        match_pool.close()
+    try:
+        capture_backend.close()
+    except Exception as e:
+        logging.error(f"Error closing screen capture: {e}")
+    if checkpointer:
+        checkpointer.stop()
+    if window_tracker:
+        window_tracker.close()
+    if args.metrics_file:
+        try:
+            write_metrics_file(args.metrics_file)
+        except Exception as e:
+            logging.error(f"Error writing metrics file: {e}")
+
+def main():
+    global capture_backend, match_grayscale, roi_tracker
+    args = parse_arguments()
+    setup_logging(args.log_format, args.log_dedup)
+
+    if args.calibrate:
+        run_calibration()
+        return
+
+    if args.capture_daemon:
+        run_capture_daemon(args)
+        return
+    
+    logging.info("=== Cursor Auto-Continue Bot ===")
+    
+    logging.info(f"Configuration: Cooldown={args.cooldown}s, Notifications={args.notify}, Once={args.once}, Background={args.background}")
+    if args.dry_run:
+        logging.info("Mode: DRY RUN (No clicks/typing)")
+    
+    specs = [(resource_path(path), confidence) for path, confidence in args.image]
+    for mic_image, _ in specs:
+        # --scan-once skips the PIL check; decoding the template below reports broken files too
+        if not validate_image(mic_image, verify=not args.scan_once):
+            print(f"Error: Invalid or missing image file: {mic_image}")
+            return
+
+    try:
+        template = TemplateSet.load(specs)
+    except Exception as e:
+        logging.error(f"Error decoding image file: {e}")
+        print(f"Error: Could not decode image file: {e}")
+        return
+    if len(template.variants) > 1:
+        logging.info(f"Template variants: {', '.join(v.name for v in template.variants)}")
+
+    if args.autotune is not None:
+        if not args.autotune:
+            capture_backend = create_capture_backend(args.capture_backend, args.capture_socket)
+        try:
+            run_autotune(args, template)
+        except (OSError, ValueError) as e:
+            logging.error(f"Autotune failed: {e}")
+            print(f"Error: Autotune failed: {e}")
+        finally:
+            capture_backend.close()
+        return
+
+    match_grayscale = args.grayscale
+    roi_tracker = RoiTracker(sizes=(args.roi_size, 3 * args.roi_size))
+    # Every way out of run_bot (errors included) releases the workers, capture and checkpoints
+    try:
+        run_bot(args, template, specs)
+    finally:
+        release_resources(args)
+
+def run_bot(args, template, specs):
+    """Start the bot after setup: virtual screen, --scan-once, or the tray with hotkeys and a bot thread."""
+    global tray_icon, capture_backend, activity_tracker, screen_driver, match_pool, config_watcher
+    global detection_state, window_tracker, checkpointer
+    if args.metrics_port is not None:
+        try:
+            start_metrics_server(args.metrics_port)
+        except OSError as e:
+            logging.error(f"Could not start metrics endpoint on port {args.metrics_port}: {e}")
+    if args.metrics_file:
+        start_metrics_file_writer(args.metrics_file)
+
+    if args.match_processes > 0:
+        match_pool = MatchWorkerPool(specs, args.match_processes)
+        logging.info(f"Template matching in {args.match_processes} worker process(es)")
+
+    if args.virtual_screen:
+        try:
+            screen_driver = load_virtual_screen(args.virtual_screen, default_icon=specs[0][0])
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading virtual screen: {e}")
+            print(f"Error: Could not load virtual screen: {e}")
+            return
+        capture_backend = screen_driver
+        run_virtual(args, template)
+        return
+
+    capture_backend = create_capture_backend(args.capture_backend, args.capture_socket)
+    logging.info(f"Screen capture: {capture_backend.name}")
+    if args.state_file:
+        detection_state = DetectionState(resource_path(args.state_file))
+    if args.checkpoint:
+        checkpointer = create_checkpointer(args.checkpoint)
+        if checkpointer:
+            checkpointer.start()
+            logging.info(f"Checkpoints: committing {os.path.abspath(args.checkpoint)} after each continue")
+    window_tracker = create_window_tracker(args.windows)
+    if window_tracker:
+        logging.info("Window discovery: X11 (searching Cursor chat areas only)")
+
+    if args.scan_once:
+        logging.info("Mode: SCAN ONCE (single scan, no tray or hotkeys)")
+        try:
+            run_once(args, template)
+        finally:
+            # Let a --notify notification out before the process exits
+            ui_dispatcher.stop()
+        return
+
+    if args.once:
+        logging.info("Mode: ONCE (will exit after the first successful action)")
+    logging.info("Hotkeys: [F8] Pause/Resume | [F9] Quit")
+    
+    logging.info(f"Logging to {os.path.abspath(LOG_FILE)}")
+    
+    # Apply config.json edits without a restart
+    config_watcher = ConfigWatcher(resource_path(CONFIG_FILE), sys.argv[1:], args)
+    config_watcher.start()
+
+    # Start Hotkey Listener
+    listener = start_hotkey_listener()
+
+    # Track user input for polite mode
+    if not args.no_polite:
+        activity_tracker = ActivityTracker()
+        activity_tracker.start()
+
+    # Start Bot Thread (joined on exit, so its final state save completes)
+    bot_thread = threading.Thread(target=bot_loop, args=(args, template), daemon=True)
+    bot_thread.start()
+
+    # Start Tray Icon (blocks main thread)
+    try:
+        def get_startup_checked(item):
+            return is_run_on_startup(refresh=False)
+
+        menu = pystray.Menu(
+            pystray.MenuItem("Cursor Auto-Bot", None, enabled=False),
             pystray.MenuItem("Pause/Resume", toggle_pause),
             pystray.MenuItem("Run on Startup", toggle_run_on_startup, checked=get_startup_checked),
+            pystray.MenuItem("Reload Config", reload_config),
             pystray.MenuItem("Quit", quit_app)
         )
         
-        tray_icon = pystray.Icon("CursorBot", create_tray_icon_image(bot_paused), "Cursor Auto-Bot", menu)
+        tray_icon = pystray.Icon("CursorBot", tray_icon_image(bot_paused), "Cursor Auto-Bot", menu)
+        
+        logging.info("System tray icon started. Check your taskbar.")
+        if bot_paused:
+            logging.info("Bot started in PAUSED state. Right-click tray icon or press F8 to resume.")
         
-        if not args.once:
-            logging.info("System tray icon started. Check your taskbar.")
-            if bot_paused:
-                logging.info("Bot started in PAUSED state. Right-click tray icon or press F8 to resume.")
-            
         tray_icon.run() 
         
     except Exception as e:
         logging.error(f"Failed to start system tray: {e}")
     finally:
         # Cleanup
-        global bot_running
-        bot_running = False
+        stop_bot_thread(bot_thread)
         if listener.is_alive():
             listener.stop()
+        if activity_tracker:
+            activity_tracker.stop()
+        config_watcher.stop()
+        ui_dispatcher.stop()
         logging.info("Bot stopped.")
 
 if __name__ == "__main__":
@@ -0,0 +1,454 @@
+"""
+Detection benchmarks.
+
+Matcher comparison (default): the previous full-screen path (pyscreeze.locate, which is what
+pyautogui.locateCenterOnScreen runs) vs auto_continue_bot.locate_pyramid on the same screenshots.
+Synthetic 4K / dual-monitor screenshots are generated with the icon pasted at each display scale.
+Pass --screenshots DIR to time real PNG screenshots instead.
+
+Corpus suite: runs the bot's real ROI and full-screen detection code against a directory of
+labelled screenshots and reports per-stage latency percentiles and precision/recall.
+
+    python benchmark_detection.py --make-corpus corpus/   # generate a synthetic labelled corpus
+    python benchmark_detection.py --corpus corpus/        # run the suite
+
+labels.json in the corpus directory lists one entry per screenshot:
+
+    {"file": "idle_0.png", "case": "idle", "icons": [[1650, 980]], "last_known": [1650, 980]}
+
+"icons" are the expected icon centers (empty when there is none) and "last_known" is the
+position the ROI search starts from (null for a cold start). Real screenshots can be added
+to the same file by hand. theme_*.png files in the corpus directory are icon variants for
+other themes; the suite matches them together with --image.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import auto_continue_bot as bot
+
+SYNTHETIC_SIZES = [(3840, 2160), (5120, 1440)]
+CORPUS_CASES = ['idle', 'moved', 'busy', 'dark', 'light', 'scale_125', 'scale_150', 'scale_200', 'multi_monitor', 'no_icon']
+# A detection this close (px) to an expected icon center counts as correct
+POSITION_TOLERANCE = 5
+# Icon variants written next to the synthetic corpus: (case, file)
+THEME_ICONS = [('dark', 'theme_dark.png'), ('light', 'theme_light.png')]
+# Libraries a one-shot scan must not import
+GUI_MODULES = ['pyautogui', 'pynput', 'pystray', 'PIL', 'plyer', 'pyscreeze']
+
+def make_screenshot(width, height, rng, background=30, palette=(20, 230)):
+    """IDE-like background with random panels and text-like strokes."""
+    image = np.full((height, width, 3), background, dtype=np.uint8)
+    for _ in range(int(400 * width * height / (3840 * 2160)) + 50):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        w, h = int(rng.integers(4, 300)), int(rng.integers(2, 40))
+        color = [int(c) for c in rng.integers(palette[0], palette[1], 3)]
+        cv2.rectangle(image, (x, y), (x + w, y + h), color, -1)
+    return image
+
+def paste(image, template, rng, x=None, y=None):
+    h, w = template.shape[:2]
+    if x is None:
+        x = int(rng.integers(0, image.shape[1] - w))
+        y = int(rng.integers(0, image.shape[0] - h))
+    image[y:y + h, x:x + w] = template
+    return bot.Point(x + w // 2, y + h // 2)
+
+def current_path(screen, template, scales):
+    """Full-resolution search, one pyscreeze call per scale."""
+    import pyscreeze
+    for scale in scales:
+        try:
+            box = pyscreeze.locate(template.scaled(scale), screen, confidence=bot.MATCH_CONFIDENCE)
+        except pyscreeze.ImageNotFoundException:
+            box = None
+        if box:
+            return bot.Point(box.left + box.width // 2, box.top + box.height // 2)
+    return None
+
+def pyramid_path(screen, template, scales, levels):
+    match = bot.locate_pyramid(screen, template, scales=scales, levels=levels)
+    return match.center if match else None
+
+def timed(func, runs):
+    durations = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - start)
+    return result, statistics.median(durations)
+
+def close(found, expected, tolerance=3):
+    if found is None or expected is None:
+        return found is None and expected is None
+    return abs(found.x - expected.x) <= tolerance and abs(found.y - expected.y) <= tolerance
+
+def build_cases(template, scales, seed):
+    rng = np.random.default_rng(seed)
+    cases = []
+    for width, height in SYNTHETIC_SIZES:
+        for scale in scales:
+            screen = make_screenshot(width, height, rng)
+            expected = paste(screen, template.scaled(scale), rng)
+            cases.append((f"{width}x{height} @{scale:g}", screen, expected))
+    return cases
+
+def load_cases(directory):
+    cases = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.png"))):
+        cases.append((os.path.basename(path), read_image(path), None))
+    return cases
+
+def read_image(path):
+    return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def run_comparison(args, template):
+    cases = load_cases(args.screenshots) if args.screenshots else build_cases(template, args.scales, args.seed)
+
+    print(f"{'screenshot':<24}{'current (s)':>12}{'pyramid (s)':>12}{'speedup':>9}  agree")
+    speedups = []
+    for name, screen, expected in cases:
+        found_current, t_current = timed(lambda: current_path(screen, template, args.scales), args.runs)
+        found_pyramid, t_pyramid = timed(lambda: pyramid_path(screen, template, args.scales, args.pyramid_levels), args.runs)
+        if expected is None:
+            agree = close(found_pyramid, found_current)
+        else:
+            agree = close(found_current, expected) and close(found_pyramid, expected)
+        speedups.append(t_current / t_pyramid)
+        print(f"{name:<24}{t_current:>12.3f}{t_pyramid:>12.3f}{t_current / t_pyramid:>8.1f}x  {'yes' if agree else 'NO'}")
+
+    print(f"Median speedup: {statistics.median(speedups):.1f}x")
+
+# --- Labelled corpus ---
+
+def theme_icon(icon, case):
+    """The icon as another theme draws it: recoloured for 'dark', inverted for 'light'."""
+    if case == 'dark':
+        # Blue accent palette instead of grey
+        return cv2.applyColorMap(icon, cv2.COLORMAP_OCEAN)
+    return 255 - icon
+
+def make_corpus(directory, template, count, seed, width=1920, height=1080):
+    """Write synthetic labelled screenshots covering the CORPUS_CASES, and the theme icons, to `directory`."""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    labels = []
+    icon = template.color
+    ih, iw = icon.shape[:2]
+    themes = {case: theme_icon(icon, case) for case, _ in THEME_ICONS}
+    for case, name in THEME_ICONS:
+        cv2.imwrite(os.path.join(directory, name), themes[case])
+
+    def chat_position(w, h, scale=1.0):
+        # Icons sit in the lower right chat area, like in Cursor
+        x = int(rng.integers(w // 2, w - int(iw * scale) - 20))
+        y = int(rng.integers(h - 200, h - int(ih * scale) - 10))
+        return x, y
+
+    for case in CORPUS_CASES:
+        for i in range(count):
+            last_known = None
+            icons = []
+            if case == 'light':
+                screen = make_screenshot(width, height, rng, background=235, palette=(120, 255))
+            elif case == 'multi_monitor':
+                screen = make_screenshot(width * 2, height, rng)
+            else:
+                screen = make_screenshot(width, height, rng)
+
+            if case in ('idle', 'dark', 'light'):
+                center = paste(screen, themes.get(case, icon), rng, *chat_position(width, height))
+                icons.append(center)
+                last_known = center
+            elif case == 'moved':
+                # Chat pane resized: icon moved well outside the old ROI
+                center = paste(screen, icon, rng, *chat_position(width, height))
+                icons.append(center)
+                last_known = bot.Point(max(0, center.x - 400), max(0, center.y - 300))
+            elif case == 'busy':
+                # Agent running: a stop button where the microphone was
+                x, y = chat_position(width, height)
+                cv2.rectangle(screen, (x, y), (x + iw, y + ih), (60, 60, 60), -1)
+                cv2.rectangle(screen, (x + iw // 3, y + ih // 3), (x + 2 * iw // 3, y + 2 * ih // 3), (220, 220, 220), -1)
+                last_known = bot.Point(x + iw // 2, y + ih // 2)
+            elif case.startswith('scale_'):
+                scale = int(case.split('_')[1]) / 100.0
+                icons.append(paste(screen, template.scaled(scale), rng, *chat_position(width, height, scale)))
+            elif case == 'multi_monitor':
+                for monitor in range(2):
+                    x, y = chat_position(width, height)
+                    icons.append(paste(screen, icon, rng, x + monitor * width, y))
+                last_known = icons[1]
+
+            name = f"{case}_{i}.png"
+            cv2.imwrite(os.path.join(directory, name), screen)
+            labels.append({
+                "file": name,
+                "case": case,
+                "icons": [[int(p.x), int(p.y)] for p in icons],
+                "last_known": [int(last_known.x), int(last_known.y)] if last_known else None,
+            })
+
+    with open(os.path.join(directory, "labels.json"), 'w') as f:
+        json.dump(labels, f, indent=2)
+    print(f"Wrote {len(labels)} labelled screenshots to {directory}")
+
+class ScreenshotCapture(bot.CaptureBackend):
+    """Capture backend serving a recorded screenshot, with the same buffer handling as the real ones."""
+    name = 'screenshot'
+
+    def __init__(self):
+        super().__init__()
+        self.screen = None
+
+    def screen_region(self):
+        return (0, 0, self.screen.shape[1], self.screen.shape[0])
+
+    def grab(self, region, out=None):
+        left, top, width, height = region
+        crop = self.screen[max(0, top):top + height, max(0, left):left + width]
+        buffer = self._buffer(crop.shape[1], crop.shape[0]) if out is None else out
+        np.copyto(buffer, crop)
+        return buffer
+
+def percentiles(values):
+    if not values:
+        return (float('nan'),) * 3
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return p50, p90, p99
+
+class Score:
+    """Precision/recall counters for one detection path."""
+
+    def __init__(self):
+        self.tp = self.fp = self.fn = 0
+
+    def add(self, found, expected):
+        """found: detected points, expected: labelled points."""
+        hits = set()
+        for point in found:
+            match = next((i for i, e in enumerate(expected)
+                          if i not in hits and abs(point.x - e[0]) <= POSITION_TOLERANCE and abs(point.y - e[1]) <= POSITION_TOLERANCE), None)
+            if match is None:
+                self.fp += 1
+            else:
+                hits.add(match)
+                self.tp += 1
+        self.fn += len(expected) - len(hits)
+
+    @property
+    def precision(self):
+        return self.tp / (self.tp + self.fp) if self.tp + self.fp else 1.0
+
+    @property
+    def recall(self):
+        return self.tp / (self.tp + self.fn) if self.tp + self.fn else 1.0
+
+def corpus_templates(directory, templates):
+    """`templates` plus the corpus's theme icon variants."""
+    themes = sorted(glob.glob(os.path.join(directory, "theme_*.png")))
+    if not themes:
+        return templates
+    return bot.TemplateSet(templates.variants + bot.TemplateSet.load([(path, None) for path in themes]).variants)
+
+def run_corpus(args, templates):
+    with open(os.path.join(args.corpus, "labels.json")) as f:
+        labels = json.load(f)
+    templates = corpus_templates(args.corpus, templates)
+
+    backend = ScreenshotCapture()
+    bot.capture_backend = backend
+    detect_args = argparse.Namespace(scales=args.scales, pyramid_levels=args.pyramid_levels)
+    stages = {name: [] for name in ['roi_capture', 'roi_match', 'roi_total', 'full_capture', 'full_match', 'full_total', 'cycle']}
+    scores = {'roi': Score(), 'full': Score(), 'cycle': Score(), 'all': Score()}
+    per_case = {}
+
+    for label in labels:
+        backend.screen = read_image(os.path.join(args.corpus, label["file"]))
+        expected = [tuple(p) for p in label["icons"]]
+        last_known = bot.Point(*label["last_known"]) if label.get("last_known") else None
+        case_score = per_case.setdefault(label.get("case", "unlabelled"), Score())
+
+        for _ in range(args.runs):
+            # Fresh state per run: no change-detection reuse, no remembered scale
+            bot.frame_detector.reset()
+            bot.last_matched_scale = 1.0
+
+            # Stage timings, using the same calls as process_cycle
+            roi_found = None
+            if last_known:
+                region = bot.roi_around(last_known)
+                start = time.perf_counter()
+                frame = bot.capture_screen(region)
+                stages['roi_capture'].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                bot.locate_pyramid(frame, templates, scales=[bot.last_matched_scale], levels=0)
+                stages['roi_match'].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                roi_found = bot.locate_in_region(region, templates)
+                stages['roi_total'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            frame = bot.capture_screen()
+            stages['full_capture'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            bot.locate_pyramid(frame, templates, scales=args.scales, levels=args.pyramid_levels)
+            stages['full_match'].append(time.perf_counter() - start)
+            bot.frame_detector.reset()
+            start = time.perf_counter()
+            full_found = bot.locate_full_screen(detect_args, templates)
+            stages['full_total'].append(time.perf_counter() - start)
+
+            # What a process_cycle search does: ROI first, full screen on a miss
+            bot.frame_detector.reset()
+            start = time.perf_counter()
+            cycle_found = None
+            if last_known:
+                cycle_found = bot.locate_in_region(bot.roi_around(last_known), templates)
+            if not cycle_found:
+                cycle_found = bot.locate_full_screen(detect_args, templates)
+            stages['cycle'].append(time.perf_counter() - start)
+
+        if last_known:
+            scores['roi'].add([roi_found] if roi_found else [], [e for e in expected if _in_region(e, bot.roi_around(last_known))])
+        # Single-target paths only have to find one of the icons
+        one = [cycle_found] if cycle_found else []
+        scores['cycle'].add(one, _nearest(one, expected))
+        case_score.add(one, _nearest(one, expected))
+        scores['full'].add([full_found] if full_found else [], _nearest([full_found] if full_found else [], expected))
+        all_found = [m.center for m in bot.locate_all_pyramid(frame, templates, scales=args.scales, levels=args.pyramid_levels)]
+        scores['all'].add(all_found, expected)
+
+    print(f"{len(labels)} screenshots, {args.runs} run(s) each\n")
+    print(f"{'stage':<14}{'p50 (ms)':>10}{'p90 (ms)':>10}{'p99 (ms)':>10}{'n':>6}")
+    results = {'stages': {}, 'paths': {}, 'cases': {}}
+    for name, values in stages.items():
+        p50, p90, p99 = percentiles(values)
+        results['stages'][name] = {'p50': p50, 'p90': p90, 'p99': p99, 'n': len(values)}
+        print(f"{name:<14}{p50 * 1000:>10.1f}{p90 * 1000:>10.1f}{p99 * 1000:>10.1f}{len(values):>6}")
+
+    print(f"\n{'path':<16}{'precision':>10}{'recall':>10}{'tp':>6}{'fp':>6}{'fn':>6}")
+    for name, score in list(scores.items()) + [(f"  {case}", score) for case, score in per_case.items()]:
+        key = name.strip()
+        (results['cases'] if name.startswith('  ') else results['paths'])[key] = {
+            'precision': score.precision, 'recall': score.recall, 'tp': score.tp, 'fp': score.fp, 'fn': score.fn}
+        print(f"{name:<16}{score.precision:>10.3f}{score.recall:>10.3f}{score.tp:>6}{score.fp:>6}{score.fn:>6}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+def _in_region(point, region):
+    left, top, width, height = region
+    return left <= point[0] < left + width and top <= point[1] < top + height
+
+def _nearest(found, expected):
+    """For single-target paths: the expected icon closest to the detection (any one if nothing was found)."""
+    if not expected:
+        return []
+    if not found:
+        return expected[:1]
+    point = found[0]
+    return [min(expected, key=lambda e: abs(e[0] - point.x) + abs(e[1] - point.y))]
+
+# --- Startup ---
+
+STARTUP_PROBE = """
+import argparse, json, sys, time
+start = time.perf_counter()
+import auto_continue_bot as bot
+imported = time.perf_counter()
+template = bot.TemplateSet.load([(sys.argv[1], None)])
+loaded = time.perf_counter()
+bot.capture_backend = bot.VirtualScreen(bot._virtual_background(1920, 1080),
+                                        icon=template.variants[0].template.color, icon_pos=(1500, 950))
+found = bot.locate_full_screen(argparse.Namespace(scales=[1.0], pyramid_levels=2), template)
+scanned = time.perf_counter()
+print(json.dumps({
+    "import": imported - start, "template": loaded - imported, "first_scan": scanned - loaded,
+    "found": found is not None, "gui_modules": [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+def run_startup(args, icon_path):
+    """Time import, template load and first scan in fresh interpreters, and a full --once run."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=here + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    icon_path = os.path.abspath(icon_path)
+    samples = {'process': [], 'import': [], 'template': [], 'first_scan': [], 'once': []}
+    gui_modules = set()
+    found = True
+    with tempfile.TemporaryDirectory() as tmp:
+        scene = os.path.join(tmp, 'scene.json')
+        with open(scene, 'w') as f:
+            json.dump({"size": [1920, 1080], "icon_pos": [1500, 950]}, f)
+        once_cmd = [sys.executable, os.path.join(here, 'auto_continue_bot.py'), '--once', '--no-polite',
+                    '--cooldown', '0', '--image', icon_path, '--virtual-screen', scene]
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            probe = subprocess.run([sys.executable, '-c', STARTUP_PROBE, icon_path] + GUI_MODULES,
+                                   cwd=tmp, env=env, capture_output=True, text=True, check=True)
+            samples['process'].append(time.perf_counter() - start)
+            result = json.loads(probe.stdout.strip().splitlines()[-1])
+            for key in ('import', 'template', 'first_scan'):
+                samples[key].append(result[key])
+            gui_modules.update(result['gui_modules'])
+            found = found and result['found']
+
+            start = time.perf_counter()
+            subprocess.run(once_cmd, cwd=tmp, env=env, capture_output=True, check=True, timeout=60)
+            samples['once'].append(time.perf_counter() - start)
+
+    results = {key: statistics.median(values) for key, values in samples.items()}
+    results['found'] = found
+    results['gui_modules'] = sorted(gui_modules)
+    print(f"Startup (median of {args.runs} fresh interpreters)")
+    print(f"  {'interpreter + import + scan':<30}{results['process'] * 1000:>8.0f} ms")
+    print(f"  {'import auto_continue_bot':<30}{results['import'] * 1000:>8.0f} ms")
+    print(f"  {'template load':<30}{results['template'] * 1000:>8.0f} ms")
+    print(f"  {'first full-screen scan':<30}{results['first_scan'] * 1000:>8.0f} ms")
+    print(f"  {'--once run (end to end)':<30}{results['once'] * 1000:>8.0f} ms")
+    print(f"  GUI libraries imported: {', '.join(results['gui_modules']) or 'none'}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark icon detection")
+    parser.add_argument("--image", type=bot.parse_image_spec, nargs='+', default=[("microphone_icon.png", None)], help="Template image(s)")
+    parser.add_argument("--scales", type=bot.parse_scales, default=[1.0, 1.25, 1.5, 2.0])
+    parser.add_argument("--pyramid-levels", type=int, default=2)
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per screenshot")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--screenshots", help="Matcher comparison on a directory of real PNG screenshots instead of synthetic ones")
+    parser.add_argument("--make-corpus", metavar="DIR", help="Generate a synthetic labelled corpus")
+    parser.add_argument("--count", type=int, default=3, help="Screenshots per case for --make-corpus")
+    parser.add_argument("--corpus", metavar="DIR", help="Run the labelled corpus suite")
+    parser.add_argument("--startup", action="store_true", help="Time import and first scan in fresh interpreters")
+    parser.add_argument("--json", metavar="FILE", help="Also write corpus or startup results as JSON")
+    args = parser.parse_args()
+
+    if args.startup:
+        run_startup(args, args.image[0][0])
+        return
+    templates = bot.TemplateSet.load(args.image)
+    if args.make_corpus:
+        make_corpus(args.make_corpus, templates.variants[0].template, args.count, args.seed)
+    elif args.corpus:
+        run_corpus(args, templates)
+    else:
+        run_comparison(args, templates.variants[0].template)
+
+if __name__ == "__main__":
+    main()
@@ -49,12 +49,24 @@ sys.modules['winreg'] = mock_winreg
 
 import unittest
 import argparse
+import logging
+import tempfile
+import socket
+import stat
+import urllib.request
+
+import cv2
+import numpy as np
 
 # Add current directory to path so we can import auto_continue_bot
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import auto_continue_bot
 
+# A test that sets up logging must never write bot.log into the working tree
+_log_dir = tempfile.TemporaryDirectory()
+auto_continue_bot.LOG_FILE = os.path.join(_log_dir.name, "bot.log")
+
 class TestAutoContinueBot(unittest.TestCase):
 
     def setUp(self):
@@ -69,12 +81,25 @@ class TestAutoContinueBot(unittest.TestCase):
             calibrate=False,
             notify=True,
             once=False,
-            background=False
+            background=False,
+            scales=[1.0],
+            pyramid_levels=2,
+            min_interval=0.25,
+            max_interval=5.0,
+            inject='type',
+            idle_threshold=2.0
         )
+        # Let UI jobs queued by the previous test finish before mocks are reset
+        auto_continue_bot.ui_dispatcher.flush()
         # Reset global state
+        auto_continue_bot._tray_images.clear()
+        auto_continue_bot._startup_enabled = None
         auto_continue_bot.bot_paused = False
         auto_continue_bot.bot_running = True
         auto_continue_bot.last_known_mic_pos = None
+        auto_continue_bot.roi_tracker = auto_continue_bot.RoiTracker()
+        auto_continue_bot.cycle_state = None
+        auto_continue_bot.activity_tracker = None
         auto_continue_bot.tray_icon = MagicMock()
         
         # Reset mocks
@@ -83,6 +108,11 @@ class TestAutoContinueBot(unittest.TestCase):
         mock_pyautogui.position.return_value = (100, 100)
         mock_pyautogui.locateCenterOnScreen.side_effect = None
         mock_notification.reset_mock()
+
+        # Full-screen fallback captures the real screen; tests drive it directly
+        patcher = patch('auto_continue_bot.locate_full_screen', return_value=None)
+        self.mock_locate_full = patcher.start()
+        self.addCleanup(patcher.stop)
         
         mock_winreg.reset_mock()
         mock_winreg.OpenKey.side_effect = None
@@ -208,17 +238,83 @@ class TestAutoContinueBot(unittest.TestCase):
             mock_img = MagicMock()
             mock_create.return_value = mock_img
             auto_continue_bot.update_tray_icon()
+            auto_continue_bot.ui_dispatcher.flush()
             self.assertEqual(mock_icon.icon, mock_img)
 
+    def test_tray_icon_image_cached(self):
+        with patch('auto_continue_bot.create_tray_icon_image', side_effect=lambda paused: MagicMock()) as mock_create:
+            paused = auto_continue_bot.tray_icon_image(True)
+            running = auto_continue_bot.tray_icon_image(False)
+            self.assertIs(auto_continue_bot.tray_icon_image(True), paused)
+            self.assertIs(auto_continue_bot.tray_icon_image(False), running)
+            self.assertEqual(mock_create.call_count, 2)
+
+    def test_startup_state_memoized_until_toggle(self):
+        auto_continue_bot.WIN_REG_AVAILABLE = True
+        auto_continue_bot.winreg = mock_winreg
+        self.assertTrue(auto_continue_bot.is_run_on_startup(refresh=False))
+        self.assertTrue(auto_continue_bot.is_run_on_startup(refresh=False))
+        self.assertEqual(mock_winreg.QueryValueEx.call_count, 1)
+
+        # Toggling disables it and re-reads the registry once
+        auto_continue_bot.toggle_run_on_startup()
+        mock_winreg.QueryValueEx.side_effect = OSError("Not found")
+        auto_continue_bot.is_run_on_startup()
+        mock_winreg.QueryValueEx.reset_mock()
+        self.assertFalse(auto_continue_bot.is_run_on_startup(refresh=False))
+        mock_winreg.QueryValueEx.assert_not_called()
+        mock_winreg.QueryValueEx.side_effect = None
+
     def test_send_notification_success(self):
         auto_continue_bot.send_notification("Test", "Message")
+        auto_continue_bot.ui_dispatcher.flush()
         mock_notification.notify.assert_called_once()
 
     def test_send_notification_failure(self):
         mock_notification.notify.side_effect = Exception("Failed")
         with patch('auto_continue_bot.logging') as mock_logging:
             auto_continue_bot.send_notification("Test", "Message")
+            auto_continue_bot.ui_dispatcher.flush()
             mock_logging.error.assert_called_once()
+        mock_notification.notify.side_effect = None
+
+    def test_send_notification_does_not_block_caller(self):
+        release = threading.Event()
+        mock_notification.notify.side_effect = lambda **kwargs: release.wait(5)
+        try:
+            start = time.monotonic()
+            auto_continue_bot.send_notification("Test", "Message")
+            self.assertLess(time.monotonic() - start, 1.0)
+        finally:
+            release.set()
+            auto_continue_bot.ui_dispatcher.flush()
+            mock_notification.notify.side_effect = None
+
+    def test_ui_dispatcher_drops_when_full(self):
+        dispatcher = auto_continue_bot.UiDispatcher(maxsize=1)
+        release = threading.Event()
+        self.addCleanup(dispatcher.stop)
+        self.addCleanup(release.set)
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        self.assertTrue(dispatcher.submit(block))
+        started.wait(1)
+        self.assertTrue(dispatcher.submit(lambda: None))
+        with patch('auto_continue_bot.logging') as mock_logging:
+            self.assertFalse(dispatcher.submit(lambda: None))
+            mock_logging.warning.assert_called_once()
+
+    def test_ui_dispatcher_stop_runs_queued_jobs(self):
+        # --scan-once stops the dispatcher before exiting so a notification still goes out
+        dispatcher = auto_continue_bot.UiDispatcher()
+        done = []
+        dispatcher.submit(lambda: (time.sleep(0.2), done.append(1)))
+        dispatcher.stop()
+        self.assertEqual(done, [1])
 
     def test_toggle_pause(self):
         auto_continue_bot.bot_paused = False
@@ -268,6 +364,7 @@ class TestAutoContinueBot(unittest.TestCase):
                 args = auto_continue_bot.parse_arguments()
                 self.assertEqual(args.text, auto_continue_bot.DEFAULT_TEXT)
                 self.assertEqual(args.cooldown, 15.0)
+                self.assertEqual(args.image, [("microphone_icon.png", None)])
 
     def test_parse_arguments_from_config(self):
         config = {"text": "Config text", "cooldown": 25.0, "offset_x": -100}
@@ -297,7 +394,9 @@ class TestAutoContinueBot(unittest.TestCase):
         
         result_time, acted = auto_continue_bot.process_cycle(self.args, "mic.png", 0)
         self.assertFalse(acted)
-        mock_time.sleep.assert_called_once_with(1)
+        # The scheduler does the waiting now
+        mock_time.sleep.assert_not_called()
+        self.assertEqual(auto_continue_bot.cycle_state, 'paused')
 
     @patch('auto_continue_bot.time')
     def test_process_cycle_cooldown_not_passed(self, mock_time):
@@ -307,35 +406,59 @@ class TestAutoContinueBot(unittest.TestCase):
         
         result_time, acted = auto_continue_bot.process_cycle(self.args, "mic.png", last_action_time)
         self.assertFalse(acted)
+        self.assertEqual(auto_continue_bot.cycle_state, 'cooldown')
 
     @patch('auto_continue_bot.time')
     def test_process_cycle_image_found(self, mock_time):
         auto_continue_bot.bot_paused = False
         mock_time.time.return_value = 200.0
+        mock_time.perf_counter.return_value = 0.0
         mock_location = MagicMock(x=100, y=100)
-        mock_pyautogui.locateCenterOnScreen.return_value = mock_location
+        self.mock_locate_full.return_value = mock_location
         mock_pyautogui.position.return_value = (50, 50)
         
         result_time, acted = auto_continue_bot.process_cycle(self.args, "mic.png", 0)
         self.assertTrue(acted)
         self.assertEqual(auto_continue_bot.last_known_mic_pos, mock_location)
+        self.assertEqual(auto_continue_bot.cycle_state, 'acted')
 
     @patch('auto_continue_bot.time')
     def test_process_cycle_image_not_found(self, mock_time):
         auto_continue_bot.bot_paused = False
         mock_time.time.return_value = 200.0
-        mock_pyautogui.locateCenterOnScreen.return_value = None
+        self.mock_locate_full.return_value = None
         
         result_time, acted = auto_continue_bot.process_cycle(self.args, "mic.png", 0)
         self.assertFalse(acted)
 
+    @patch('auto_continue_bot.time')
+    def test_process_cycle_injects_text(self, mock_time):
+        mock_time.time.return_value = 200.0
+        self.mock_locate_full.return_value = MagicMock(x=100, y=100)
+        with patch('auto_continue_bot.inject_text') as mock_inject:
+            auto_continue_bot.process_cycle(self.args, "mic.png", 0)
+            mock_inject.assert_called_once_with("Test Continue", 'type')
+        mock_pyautogui.press.assert_called_once_with('enter')
+
+    @patch('auto_continue_bot.time')
+    def test_process_cycle_screen_locked(self, mock_time):
+        mock_time.time.return_value = 200.0
+        self.mock_locate_full.side_effect = auto_continue_bot.ScreenUnavailableError("Screen is blank")
+        with patch('auto_continue_bot.logging') as mock_logging:
+            auto_continue_bot.process_cycle(self.args, "mic.png", 0)
+            auto_continue_bot.process_cycle(self.args, "mic.png", 0)
+            # Only logged when the screen goes away, not every cycle
+            mock_logging.warning.assert_called_once()
+            mock_logging.error.assert_not_called()
+        self.assertEqual(auto_continue_bot.cycle_state, 'locked')
+
     @patch('auto_continue_bot.time')
     def test_process_cycle_polite_mode_active(self, mock_time):
         auto_continue_bot.bot_paused = False
         self.args.no_polite = False
         mock_time.time.return_value = 200.0
         mock_location = MagicMock(x=100, y=100)
-        mock_pyautogui.locateCenterOnScreen.return_value = mock_location
+        self.mock_locate_full.return_value = mock_location
         
         with patch('auto_continue_bot.is_user_active', return_value=True):
             result_time, acted = auto_continue_bot.process_cycle(self.args, "mic.png", 0)
@@ -347,7 +470,7 @@ class TestAutoContinueBot(unittest.TestCase):
         self.args.dry_run = True
         mock_time.time.return_value = 200.0
         mock_location = MagicMock(x=100, y=100)
-        mock_pyautogui.locateCenterOnScreen.return_value = mock_location
+        self.mock_locate_full.return_value = mock_location
         mock_pyautogui.position.return_value = (50, 50)
         
         result_time, acted = auto_continue_bot.process_cycle(self.args, "mic.png", 0)
@@ -380,5 +503,2172 @@ class TestAutoContinueBot(unittest.TestCase):
                 result = auto_continue_bot.validate_image("corrupt.png")
                 self.assertFalse(result)
 
+class TestTemplateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "mic.png")
+        self.image = np.zeros((20, 30, 3), dtype=np.uint8)
+        self.image[5:15, 10:20] = (255, 128, 0)
+        cv2.imwrite(self.path, self.image)
+        auto_continue_bot.bot_paused = False
+        auto_continue_bot.last_known_mic_pos = None
+        auto_continue_bot.roi_tracker = auto_continue_bot.RoiTracker()
+        auto_continue_bot.last_matched_scale = 1.0
+        mock_pyautogui.reset_mock()
+        mock_pyautogui.locateCenterOnScreen.side_effect = None
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_decodes_color_and_grayscale(self):
+        cache = auto_continue_bot.TemplateCache(self.path)
+        self.assertEqual(cache.color.shape, (20, 30, 3))
+        self.assertEqual(cache.gray.shape, (20, 30))
+        np.testing.assert_array_equal(cache.color, self.image)
+
+    def test_get_does_not_decode_again_when_unchanged(self):
+        cache = auto_continue_bot.TemplateCache(self.path)
+        with patch('auto_continue_bot.cv2.imdecode') as mock_decode:
+            first = cache.get()
+            second = cache.get(grayscale=True)
+            mock_decode.assert_not_called()
+        self.assertIs(first, cache.color)
+        self.assertIs(second, cache.gray)
+
+    def test_reloads_when_mtime_changes(self):
+        cache = auto_continue_bot.TemplateCache(self.path)
+        cv2.imwrite(self.path, np.full((10, 10, 3), 200, dtype=np.uint8))
+        os.utime(self.path, (cache.mtime + 10, cache.mtime + 10))
+        self.assertEqual(cache.get().shape, (10, 10, 3))
+
+    def test_keeps_last_good_template_on_broken_reload(self):
+        cache = auto_continue_bot.TemplateCache(self.path)
+        with open(self.path, 'wb') as f:
+            f.write(b"not a png")
+        os.utime(self.path, (cache.mtime + 10, cache.mtime + 10))
+        with patch('auto_continue_bot.logging') as mock_logging:
+            self.assertEqual(cache.get().shape, (20, 30, 3))
+            cache.get()
+            mock_logging.error.assert_called_once()
+
+    @patch('auto_continue_bot.locate_full_screen', return_value=None)
+    @patch('auto_continue_bot.time')
+    def test_process_cycle_searches_roi_with_cached_array(self, mock_time, mock_full):
+        mock_time.time.return_value = 200.0
+        auto_continue_bot.roi_tracker.remember(auto_continue_bot.Point(300, 300))
+        auto_continue_bot.roi_tracker.absent = True
+        cache = auto_continue_bot.TemplateCache(self.path)
+        args = argparse.Namespace(cooldown=15.0, no_polite=True)
+        roi = np.zeros((200, 200, 3), dtype=np.uint8)
+        with patch('auto_continue_bot.capture_screen', return_value=roi) as mock_capture:
+            with patch('auto_continue_bot.locate_pyramid', return_value=None) as mock_locate:
+                auto_continue_bot.process_cycle(args, cache, 0)
+                mock_capture.assert_called_once_with((200, 200, 200, 200))
+                self.assertIs(mock_locate.call_args[0][1], cache)
+        mock_full.assert_called_once_with(args, cache)
+
+    def test_scaled_template_is_cached(self):
+        cache = auto_continue_bot.TemplateCache(self.path)
+        scaled = cache.scaled(1.5)
+        self.assertEqual(scaled.shape, (30, 45, 3))
+        self.assertIs(cache.scaled(1.5), scaled)
+        self.assertIs(cache.scaled(1.0), cache.color)
+        self.assertEqual(cache.scaled(2.0, grayscale=True).shape, (40, 60))
+
+
+class TestPyramidMatcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        cls.template = auto_continue_bot.TemplateCache(path)
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.screen = np.full((700, 1000, 3), 40, dtype=np.uint8)
+        for _ in range(60):
+            x, y = rng.integers(0, 880), rng.integers(0, 580)
+            cv2.rectangle(self.screen, (int(x), int(y)), (int(x) + 30, int(y) + 12), [int(c) for c in rng.integers(0, 255, 3)], -1)
+        auto_continue_bot.last_matched_scale = 1.0
+
+    def paste(self, scale, x, y):
+        tpl = self.template.scaled(scale)
+        self.screen[y:y + tpl.shape[0], x:x + tpl.shape[1]] = tpl
+        return x + tpl.shape[1] // 2, y + tpl.shape[0] // 2
+
+    def test_finds_icon(self):
+        expected = self.paste(1.0, 613, 421)
+        match = auto_continue_bot.locate_pyramid(self.screen, self.template)
+        self.assertEqual(tuple(match.center), expected)
+        self.assertGreaterEqual(match.score, auto_continue_bot.MATCH_CONFIDENCE)
+
+    def test_finds_icon_grayscale(self):
+        expected = self.paste(1.0, 101, 57)
+        match = auto_continue_bot.locate_pyramid(self.screen, self.template, grayscale=True)
+        self.assertEqual(tuple(match.center), expected)
+
+    def test_finds_scaled_icon(self):
+        expected = self.paste(1.5, 250, 300)
+        self.assertIsNone(auto_continue_bot.locate_pyramid(self.screen, self.template, scales=[1.0]))
+        match = auto_continue_bot.locate_pyramid(self.screen, self.template, scales=[1.0, 1.25, 1.5, 2.0])
+        self.assertEqual(match.scale, 1.5)
+        self.assertLessEqual(abs(match.center[0] - expected[0]), 1)
+        self.assertLessEqual(abs(match.center[1] - expected[1]), 1)
+
+    def test_no_icon(self):
+        self.assertIsNone(auto_continue_bot.locate_pyramid(self.screen, self.template, scales=[1.0, 2.0]))
+
+    def test_template_larger_than_screen(self):
+        small = self.screen[:20, :20]
+        self.assertIsNone(auto_continue_bot.locate_pyramid(small, self.template))
+
+    def test_locate_full_screen_remembers_scale(self):
+        expected = self.paste(2.0, 400, 200)
+        args = argparse.Namespace(scales=[1.0, 2.0], pyramid_levels=2)
+        with patch('auto_continue_bot.capture_backend') as mock_backend:
+            mock_backend.screen_region.return_value = (0, 0, 1000, 700)
+            mock_backend.grab.return_value = self.screen
+            with patch('auto_continue_bot.locate_pyramid', wraps=auto_continue_bot.locate_pyramid) as spy:
+                center = auto_continue_bot.locate_full_screen(args, self.template)
+                self.assertEqual(tuple(center), expected)
+                self.assertEqual(auto_continue_bot.last_matched_scale, 2.0)
+                auto_continue_bot.locate_full_screen(args, self.template)
+                self.assertEqual(spy.call_args.kwargs['scales'], [2.0, 1.0])
+
+    def test_locate_in_region_returns_screen_coordinates(self):
+        auto_continue_bot.frame_detector.reset()
+        self.paste(1.0, 60, 70)
+        region = (500, 400, 200, 200)
+        with patch('auto_continue_bot.capture_screen', return_value=self.screen[:200, :200].copy()):
+            center = auto_continue_bot.locate_in_region(region, self.template)
+        self.assertEqual(tuple(center), (500 + 60 + 42, 400 + 70 + 38))
+
+    def test_locate_full_screen_offsets_virtual_screen_origin(self):
+        auto_continue_bot.frame_detector.reset()
+        expected = self.paste(1.0, 300, 300)
+        args = argparse.Namespace(scales=[1.0], pyramid_levels=2)
+        with patch('auto_continue_bot.capture_backend') as mock_backend:
+            mock_backend.screen_region.return_value = (-1920, 0, 1000, 700)
+            mock_backend.grab.return_value = self.screen
+            center = auto_continue_bot.locate_full_screen(args, self.template)
+        self.assertEqual(tuple(center), (expected[0] - 1920, expected[1]))
+
+    def test_locate_all_finds_every_instance(self):
+        first = self.paste(1.0, 50, 60)
+        second = self.paste(1.0, 700, 500)
+        third = self.paste(1.5, 400, 100)
+        matches = auto_continue_bot.locate_all_pyramid(self.screen, self.template, scales=[1.0, 1.5])
+        centers = sorted(tuple(m.center) for m in matches)
+        self.assertEqual(len(centers), 3)
+        self.assertIn(first, centers)
+        self.assertIn(second, centers)
+        self.assertTrue(any(abs(c[0] - third[0]) <= 1 and abs(c[1] - third[1]) <= 1 for c in centers))
+
+    def test_locate_all_without_icon(self):
+        self.assertEqual(auto_continue_bot.locate_all_pyramid(self.screen, self.template), [])
+
+    def test_parse_scales(self):
+        self.assertEqual(auto_continue_bot.parse_scales("1, 1.25,2"), [1.0, 1.25, 2.0])
+        self.assertEqual(auto_continue_bot.parse_scales([1, 1.5]), [1.0, 1.5])
+        with self.assertRaises(argparse.ArgumentTypeError):
+            auto_continue_bot.parse_scales("0")
+
+    def test_single_scale_in_config(self):
+        config = {"scales": 1.25}
+        auto_continue_bot.validate_config(config)
+        self.assertEqual(auto_continue_bot.parse_arguments([], config=config).scales, [1.25])
+
+    def test_config_rejects_negative_counts(self):
+        for key in ('pyramid_levels', 'match_processes'):
+            auto_continue_bot.validate_config({key: 0})
+            with self.assertRaises(ValueError):
+                auto_continue_bot.validate_config({key: -1})
+
+class TestTemplateVariants(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        base = cv2.imread(os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png"))
+        self.light_path = os.path.join(self.tmpdir.name, "light.png")
+        self.dark_path = os.path.join(self.tmpdir.name, "dark.png")
+        cv2.imwrite(self.light_path, base)
+        cv2.imwrite(self.dark_path, 255 - base)
+        self.templates = auto_continue_bot.TemplateSet.load([(self.light_path, None), (self.dark_path, 0.9)])
+        self.screen = np.full((500, 700, 3), 128, dtype=np.uint8)
+        cv2.rectangle(self.screen, (20, 20), (300, 60), (10, 200, 30), -1)
+        auto_continue_bot.last_matched_variant = None
+        auto_continue_bot.last_matched_scale = 1.0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        auto_continue_bot.last_matched_variant = None
+
+    def paste(self, variant, x, y):
+        tpl = self.templates.variants[variant].template.color
+        self.screen[y:y + tpl.shape[0], x:x + tpl.shape[1]] = tpl
+        return (x + tpl.shape[1] // 2, y + tpl.shape[0] // 2)
+
+    def test_load_names_and_confidences(self):
+        names = [v.name for v in self.templates.variants]
+        self.assertEqual(names, ["light", "dark"])
+        self.assertEqual(self.templates.variants[0].confidence, auto_continue_bot.MATCH_CONFIDENCE)
+        self.assertEqual(self.templates.variants[1].confidence, 0.9)
+        explicit = auto_continue_bot.TemplateSet.load([(self.light_path, 0.0)])
+        self.assertEqual(explicit.variants[0].confidence, 0.0)
+        self.assertEqual(len(self.templates.mtime), 2)
+
+    def test_reports_matched_variant(self):
+        expected = self.paste(1, 400, 300)
+        match = auto_continue_bot.locate_pyramid(self.screen, self.templates)
+        self.assertEqual(match.variant, "dark")
+        self.assertEqual(tuple(match.center), expected)
+
+    def test_per_variant_confidence(self):
+        self.paste(1, 400, 300)
+        strict = auto_continue_bot.TemplateSet.load([(self.light_path, None), (self.dark_path, 1.01)])
+        self.assertIsNone(auto_continue_bot.locate_pyramid(self.screen, strict))
+
+    def test_locate_all_across_variants(self):
+        self.paste(0, 50, 300)
+        self.paste(1, 400, 300)
+        matches = auto_continue_bot.locate_all_pyramid(self.screen, self.templates)
+        self.assertEqual(sorted(m.variant for m in matches), ["dark", "light"])
+
+    def test_shares_frame_preprocessing(self):
+        self.paste(1, 400, 300)
+        with patch('auto_continue_bot.cv2.cvtColor', wraps=cv2.cvtColor) as spy:
+            auto_continue_bot.locate_pyramid(self.screen, self.templates)
+            self.assertEqual(spy.call_count, 1)
+
+    def test_last_matched_variant_is_tried_first(self):
+        expected = self.paste(1, 400, 300)
+        region = (0, 0, 700, 500)
+        with patch('auto_continue_bot.capture_screen', return_value=self.screen):
+            with patch('auto_continue_bot.logging') as mock_logging:
+                center = auto_continue_bot.locate_in_region(region, self.templates)
+                self.assertIn("'dark'", mock_logging.info.call_args[0][0])
+        self.assertEqual(tuple(center), expected)
+        self.assertEqual(auto_continue_bot.last_matched_variant, "dark")
+        self.assertEqual([v.name for v in self.templates.ordered()], ["dark", "light"])
+
+    def test_search_stops_at_the_matching_variant(self):
+        self.paste(1, 400, 300)
+        dark_only = auto_continue_bot.TemplateSet.load([(self.dark_path, 0.9)])
+
+        def match_calls(templates, **kwargs):
+            with patch('auto_continue_bot.cv2.matchTemplate', wraps=cv2.matchTemplate) as spy:
+                self.assertEqual(auto_continue_bot.locate_pyramid(self.screen, templates, **kwargs).variant, "dark")
+            return spy.call_count
+
+        for kwargs in ({}, {'levels': 0}, {'scales': (1.0, 1.25, 1.5)}):
+            single = match_calls(dark_only, **kwargs)
+            self.templates.last_matched = None
+            self.assertGreater(match_calls(self.templates, **kwargs), single)
+            # Once "dark" has matched, the other variant is never tried
+            self.templates.last_matched = "dark"
+            self.assertEqual(match_calls(self.templates, **kwargs), single)
+
+    def test_same_file_name_in_two_folders(self):
+        for folder, path in (("light", self.light_path), ("dark", self.dark_path)):
+            os.mkdir(os.path.join(self.tmpdir.name, folder))
+            os.rename(path, os.path.join(self.tmpdir.name, folder, "icon.png"))
+        light = os.path.join(self.tmpdir.name, "light", "icon.png")
+        dark = os.path.join(self.tmpdir.name, "dark", "icon.png")
+        templates = auto_continue_bot.TemplateSet.load([(light, None), (dark, 0.9)])
+        self.assertEqual([v.name for v in templates.variants], ["light/icon.png", "dark/icon.png"])
+        self.paste(1, 400, 300)
+        self.assertEqual(auto_continue_bot.locate_pyramid(self.screen, templates).variant, "dark/icon.png")
+        templates.last_matched = "dark/icon.png"
+        self.assertEqual([v.template for v in templates.ordered()], [templates.variants[1].template, templates.variants[0].template])
+        with self.assertRaises(ValueError):
+            auto_continue_bot.TemplateSet.load([(light, None), (light, 0.9)])
+
+    def test_parse_image_spec(self):
+        self.assertEqual(auto_continue_bot.parse_image_spec("mic.png"), ("mic.png", None))
+        self.assertEqual(auto_continue_bot.parse_image_spec("dark.png@0.9"), ("dark.png", 0.9))
+        self.assertEqual(auto_continue_bot.parse_image_spec("C:\\icons\\me@home.png"), ("C:\\icons\\me@home.png", None))
+        self.assertEqual(auto_continue_bot.parse_image_spec({"path": "a.png", "confidence": 0.8}), ("a.png", 0.8))
+
+    def test_parse_arguments_image_list(self):
+        config = {"image": ["light.png", {"path": "dark.png", "confidence": 0.9}]}
+        with patch('auto_continue_bot.load_config', return_value=config):
+            with patch('sys.argv', ['auto_continue_bot.py']):
+                args = auto_continue_bot.parse_arguments()
+        self.assertEqual(args.image, [("light.png", None), ("dark.png", 0.9)])
+        with patch('auto_continue_bot.load_config', return_value={}):
+            with patch('sys.argv', ['auto_continue_bot.py', '--image', 'a.png', 'b.png@0.8']):
+                args = auto_continue_bot.parse_arguments()
+        self.assertEqual(args.image, [("a.png", None), ("b.png", 0.8)])
+
+
+class TestDetectionBenchmark(unittest.TestCase):
+
+    def test_corpus_suite_smoke(self):
+        import benchmark_detection
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        templates = auto_continue_bot.TemplateSet.load([(path, None)])
+        original_backend = auto_continue_bot.capture_backend
+        with tempfile.TemporaryDirectory() as corpus:
+            with patch('builtins.print'):
+                benchmark_detection.make_corpus(corpus, templates.variants[0].template, 1, seed=0, width=960, height=540)
+                args = argparse.Namespace(corpus=corpus, scales=[1.0, 1.25, 1.5, 2.0], pyramid_levels=2, runs=1, json=None)
+                try:
+                    results = benchmark_detection.run_corpus(args, templates)
+                finally:
+                    auto_continue_bot.capture_backend = original_backend
+        self.assertEqual(set(results['cases']), set(benchmark_detection.CORPUS_CASES))
+        self.assertEqual(results['paths']['cycle']['recall'], 1.0)
+        self.assertEqual(results['paths']['cycle']['precision'], 1.0)
+        self.assertEqual(results['stages']['full_total']['n'], len(benchmark_detection.CORPUS_CASES))
+
+    def test_theme_cases_use_their_own_icons(self):
+        import benchmark_detection
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        base = auto_continue_bot.TemplateSet.load([(path, None)])
+        with tempfile.TemporaryDirectory() as corpus:
+            with patch('builtins.print'):
+                benchmark_detection.make_corpus(corpus, base.variants[0].template, 1, seed=0, width=960, height=540)
+            with open(os.path.join(corpus, "labels.json")) as f:
+                labels = {label['case']: label for label in json.load(f)}
+            templates = benchmark_detection.corpus_templates(corpus, base)
+            self.assertEqual([v.name for v in templates.variants], ["microphone_icon", "theme_dark", "theme_light"])
+            backend = benchmark_detection.ScreenshotCapture()
+            for case in ('dark', 'light'):
+                backend.screen = benchmark_detection.read_image(os.path.join(corpus, labels[case]['file']))
+                screen = backend.grab(backend.screen_region(), out=np.empty_like(backend.screen))
+                # The plain icon does not find the themed one; the corpus variants do
+                self.assertIsNone(auto_continue_bot.locate_pyramid(screen, base))
+                match = auto_continue_bot.locate_pyramid(screen, templates)
+                self.assertEqual(match.variant, f"theme_{case}")
+
+    def test_startup_imports_no_gui_libraries(self):
+        import benchmark_detection
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        args = argparse.Namespace(runs=1, json=None)
+        with patch('builtins.print'):
+            results = benchmark_detection.run_startup(args, path)
+        self.assertTrue(results['found'])
+        self.assertEqual(results['gui_modules'], [])
+
+
+class TestFrameChangeDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = auto_continue_bot.FrameChangeDetector()
+        self.frame = np.random.default_rng(3).integers(0, 255, (64, 64, 3), dtype=np.uint8)
+        self.match = MagicMock(return_value="result")
+
+    def test_reuses_result_for_identical_frame(self):
+        self.assertEqual(self.detector.detect('roi', 1, self.frame, self.match), "result")
+        self.assertEqual(self.detector.detect('roi', 1, self.frame.copy(), self.match), "result")
+        self.match.assert_called_once()
+        self.assertEqual(self.detector.reused, 1)
+
+    def test_rematches_when_sampled_pixels_change(self):
+        self.detector.detect('roi', 1, self.frame, self.match)
+        changed = self.frame.copy()
+        changed[8:24, 8:24] = 0
+        self.detector.detect('roi', 1, changed, self.match)
+        self.assertEqual(self.match.call_count, 2)
+
+    def test_rematches_when_params_change(self):
+        self.detector.detect('roi', (0, 0, 200, 200), self.frame, self.match)
+        self.detector.detect('roi', (10, 0, 200, 200), self.frame, self.match)
+        self.assertEqual(self.match.call_count, 2)
+
+    def test_kinds_are_tracked_separately(self):
+        self.detector.detect('roi', 1, self.frame, self.match)
+        self.detector.detect('full', 1, self.frame, self.match)
+        self.detector.detect('roi', 1, self.frame, self.match)
+        self.assertEqual(self.match.call_count, 2)
+
+    def test_negative_results_are_reused(self):
+        self.match.return_value = None
+        self.detector.detect('full', 1, self.frame, self.match)
+        self.assertIsNone(self.detector.detect('full', 1, self.frame, self.match))
+        self.match.assert_called_once()
+
+    def test_reset(self):
+        self.detector.detect('roi', 1, self.frame, self.match)
+        self.detector.reset()
+        self.detector.detect('roi', 1, self.frame, self.match)
+        self.assertEqual(self.match.call_count, 2)
+
+    def test_full_screen_skips_matching_when_unchanged(self):
+        auto_continue_bot.frame_detector.reset()
+        template = MagicMock(mtime=1.0)
+        args = argparse.Namespace(scales=[1.0], pyramid_levels=2)
+        with patch('auto_continue_bot.capture_backend') as mock_backend:
+            mock_backend.screen_region.return_value = (0, 0, 64, 64)
+            mock_backend.grab.return_value = self.frame
+            with patch('auto_continue_bot.locate_pyramid', return_value=None) as mock_locate:
+                auto_continue_bot.locate_full_screen(args, template)
+                auto_continue_bot.locate_full_screen(args, template)
+                mock_locate.assert_called_once()
+
+class FakeMssShot:
+    def __init__(self, width, height, value):
+        self.width = width
+        self.height = height
+        self.raw = bytearray(np.full((height, width, 4), value, dtype=np.uint8).tobytes())
+
+
+class TestCaptureBackends(unittest.TestCase):
+
+    def setUp(self):
+        mock_pyautogui.reset_mock()
+
+    def test_pyscreeze_converts_rgb_to_bgr(self):
+        rgb = np.zeros((4, 6, 3), dtype=np.uint8)
+        rgb[..., 0] = 255
+        mock_pyautogui.screenshot.return_value = rgb
+        frame = auto_continue_bot.PyscreezeCapture().grab((1, 2, 6, 4))
+        mock_pyautogui.screenshot.assert_called_once_with(region=(1, 2, 6, 4))
+        self.assertEqual(frame.shape, (4, 6, 3))
+        self.assertEqual(tuple(frame[0, 0]), (0, 0, 255))
+
+    def test_pyscreeze_screen_region(self):
+        mock_pyautogui.size.return_value = (1920, 1080)
+        self.assertEqual(auto_continue_bot.PyscreezeCapture().screen_region(), (0, 0, 1920, 1080))
+
+    def test_buffers_are_reused_per_size(self):
+        backend = auto_continue_bot.PyscreezeCapture()
+        mock_pyautogui.screenshot.return_value = np.zeros((4, 6, 3), dtype=np.uint8)
+        first = backend.grab((0, 0, 6, 4))
+        second = backend.grab((0, 0, 6, 4))
+        self.assertIs(first, second)
+        mock_pyautogui.screenshot.return_value = np.zeros((8, 8, 3), dtype=np.uint8)
+        self.assertIsNot(backend.grab((0, 0, 8, 8)), first)
+
+    def test_mss_grabs_only_requested_region(self):
+        backend = auto_continue_bot.MssCapture()
+        sct = MagicMock()
+        sct.grab.return_value = FakeMssShot(5, 3, 7)
+        sct.monitors = [{'left': -1920, 'top': 0, 'width': 3840, 'height': 1080},
+                        {'left': -1920, 'top': 0, 'width': 1920, 'height': 1080},
+                        {'left': 0, 'top': 0, 'width': 1920, 'height': 1080}]
+        with patch('auto_continue_bot.mss', create=True) as mock_mss:
+            mock_mss.mss.return_value = sct
+            frame = backend.grab((10, 20, 5, 3))
+            self.assertEqual(backend.screen_region(), (-1920, 0, 3840, 1080))
+            self.assertEqual(backend.monitor_regions(), [(-1920, 0, 1920, 1080), (0, 0, 1920, 1080)])
+            mock_mss.mss.assert_called_once()
+        sct.grab.assert_called_once_with({'left': 10, 'top': 20, 'width': 5, 'height': 3})
+        self.assertEqual(frame.shape, (3, 5, 3))
+        self.assertTrue((frame == 7).all())
+
+    def test_create_backend_auto(self):
+        with patch('auto_continue_bot.MSS_AVAILABLE', True):
+            self.assertIsInstance(auto_continue_bot.create_capture_backend('auto'), auto_continue_bot.MssCapture)
+        with patch('auto_continue_bot.MSS_AVAILABLE', False):
+            self.assertIsInstance(auto_continue_bot.create_capture_backend('auto'), auto_continue_bot.PyscreezeCapture)
+
+    def test_create_backend_falls_back_without_mss(self):
+        with patch('auto_continue_bot.MSS_AVAILABLE', False):
+            with patch('auto_continue_bot.logging') as mock_logging:
+                backend = auto_continue_bot.create_capture_backend('mss')
+                mock_logging.warning.assert_called_once()
+        self.assertIsInstance(backend, auto_continue_bot.PyscreezeCapture)
+
+    def test_create_backend_unknown(self):
+        with self.assertRaises(ValueError):
+            auto_continue_bot.create_capture_backend('nope')
+
+class TestScanScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = auto_continue_bot.ScanScheduler(min_interval=0.5, max_interval=4.0)
+
+    def test_backs_off_while_busy(self):
+        intervals = [self.scheduler.next_interval('busy', t) for t in range(8)]
+        self.assertEqual(intervals, sorted(intervals))
+        self.assertGreater(intervals[1], intervals[0])
+        self.assertEqual(intervals[-1], 4.0)
+        self.assertEqual(self.scheduler.last_interval, 4.0)
+
+    def test_sleeps_through_cooldown_then_polls_fast(self):
+        for t in range(5):
+            self.scheduler.next_interval('parked', t)
+        self.assertEqual(self.scheduler.next_interval('acted', 10.0, cooldown_remaining=15.0), 15.0)
+        self.assertEqual(self.scheduler.next_interval('cooldown', 25.0, cooldown_remaining=0.0), 0.5)
+        self.assertEqual(self.scheduler.next_interval('busy', 25.5), 0.75)
+
+    def test_dormant_when_paused_or_locked(self):
+        self.assertEqual(self.scheduler.next_interval('paused', 0), auto_continue_bot.DORMANT_INTERVAL)
+        self.assertEqual(self.scheduler.next_interval('locked', 0), auto_continue_bot.DORMANT_INTERVAL)
+
+    def test_found_retries_quickly(self):
+        self.scheduler.next_interval('busy', 0)
+        self.assertEqual(self.scheduler.next_interval('found', 1), 0.5)
+
+    def test_polls_fast_around_expected_finish(self):
+        self.scheduler.next_interval('acted', 0.0)
+        self.scheduler.next_interval('acted', 100.0)   # agent took 100s
+        self.assertEqual(self.scheduler.expected_run, 100.0)
+        for t in range(110, 170, 10):
+            self.scheduler.next_interval('busy', t)
+        self.assertEqual(self.scheduler.interval, 4.0)
+        # Within the expected finish window
+        self.assertEqual(self.scheduler.next_interval('busy', 185.0), 0.5)
+        # Long past it (agent parked): back off again
+        self.assertGreater(self.scheduler.next_interval('parked', 400.0), 0.5)
+
+    def test_max_never_below_min(self):
+        scheduler = auto_continue_bot.ScanScheduler(min_interval=2.0, max_interval=1.0)
+        self.assertEqual(scheduler.next_interval('busy', 0), 2.0)
+
+    def test_interval_is_reported(self):
+        with patch('auto_continue_bot.metrics', auto_continue_bot.Metrics()) as mock_metrics, \
+             patch('auto_continue_bot.logging') as mock_logging:
+            auto_continue_bot.report_scan_interval(0.75, 'busy', 0.5)
+            auto_continue_bot.report_scan_interval(0.75, 'busy', 0.75)
+        self.assertIn('bot_scan_interval_seconds 0.75', mock_metrics.render())
+        levels = [c.args[0] for c in mock_logging.log.call_args_list]
+        self.assertEqual(levels, [mock_logging.INFO, mock_logging.DEBUG])
+
+    def test_wait_is_cut_short_by_wake_event(self):
+        auto_continue_bot.wake_event.set()
+        start = time.monotonic()
+        auto_continue_bot.wait_for_next_cycle(5.0)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertFalse(auto_continue_bot.wake_event.is_set())
+
+    def test_toggle_pause_wakes_loop(self):
+        auto_continue_bot.wake_event.clear()
+        with patch('auto_continue_bot.update_tray_icon'):
+            with patch('auto_continue_bot.logging'):
+                auto_continue_bot.toggle_pause()
+                auto_continue_bot.toggle_pause()
+        self.assertTrue(auto_continue_bot.wake_event.is_set())
+        auto_continue_bot.wake_event.clear()
+
+
+class TestMultiTarget(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        cls.template = auto_continue_bot.TemplateCache(path)
+
+    def setUp(self):
+        self.args = argparse.Namespace(
+            cooldown=15.0, no_polite=True, idle_threshold=2.0, scales=[1.0], pyramid_levels=2,
+            offset_x=-10, offset_y=-10, dry_run=False, text="go", inject='type', notify=False)
+        self.monitors = [np.full((600, 800, 3), 40, dtype=np.uint8), np.full((600, 800, 3), 40, dtype=np.uint8)]
+        for monitor in self.monitors:
+            cv2.rectangle(monitor, (10, 10), (300, 40), (200, 200, 200), -1)
+        self.regions = [(0, 0, 800, 600), (800, 0, 800, 600)]
+        auto_continue_bot.frame_detector.reset()
+        auto_continue_bot.bot_paused = False
+        auto_continue_bot.activity_tracker = None
+        auto_continue_bot.cycle_state = None
+        patcher = patch('auto_continue_bot.capture_backend')
+        backend = patcher.start()
+        self.addCleanup(patcher.stop)
+        backend.monitor_regions.return_value = self.regions
+        backend.grab.side_effect = self.grab
+        self.tracker = auto_continue_bot.MultiTargetTracker(self.args, self.template, workers=2)
+        self.addCleanup(self.tracker.close)
+
+    def grab(self, region):
+        for (left, top, width, height), monitor in zip(self.regions, self.monitors):
+            if left <= region[0] < left + width:
+                x, y = region[0] - left, region[1] - top
+                return monitor[y:y + region[3], x:x + region[2]].copy()
+        raise AssertionError(region)
+
+    def paste(self, monitor, x, y):
+        tpl = self.template.color
+        self.monitors[monitor][y:y + tpl.shape[0], x:x + tpl.shape[1]] = tpl
+        return auto_continue_bot.Point(self.regions[monitor][0] + x + tpl.shape[1] // 2, y + tpl.shape[0] // 2)
+
+    def test_scan_finds_icons_on_all_monitors(self):
+        a = self.paste(0, 100, 300)
+        b = self.paste(1, 500, 400)
+        found = self.tracker.scan(1000.0)
+        self.assertEqual(sorted(found), sorted([a, b]))
+
+    def test_update_keeps_target_identity(self):
+        a = auto_continue_bot.Point(100, 100)
+        b = auto_continue_bot.Point(1200, 100)
+        self.tracker.update([a, b], 0.0)
+        ids = {t.id: t.pos for t in self.tracker.targets}
+        idle = self.tracker.update([auto_continue_bot.Point(1210, 105)], 1.0)
+        self.assertEqual([t.id for t in idle], [2])
+        self.assertEqual(len(self.tracker.targets), 2)
+        self.assertEqual(ids[1], a)
+
+    def test_targets_expire(self):
+        self.tracker.update([auto_continue_bot.Point(100, 100)], 0.0)
+        self.tracker.update([], auto_continue_bot.TARGET_EXPIRY + 1)
+        self.assertEqual(self.tracker.targets, [])
+
+    def test_known_targets_use_roi_scan(self):
+        self.paste(0, 100, 300)
+        now = 1000.0
+        self.tracker.update(self.tracker.scan(now), now)
+        with patch.object(self.tracker, '_scan_monitor', wraps=self.tracker._scan_monitor) as spy:
+            self.assertEqual(len(self.tracker.scan(now + 1)), 1)
+            spy.assert_not_called()
+
+    def test_acts_on_each_idle_target_with_own_cooldown(self):
+        self.paste(0, 100, 300)
+        self.paste(1, 500, 400)
+        with patch('auto_continue_bot._perform_action', side_effect=lambda args, pos, t: (1000.0, True)) as mock_act:
+            with patch('auto_continue_bot.time.time', return_value=1000.0):
+                self.assertEqual(auto_continue_bot.process_multi_cycle(self.args, self.tracker), 2)
+            self.assertEqual(mock_act.call_count, 2)
+            self.assertEqual(auto_continue_bot.cycle_state, 'acted')
+            # Both in cooldown now
+            with patch('auto_continue_bot.time.time', return_value=1005.0):
+                self.assertEqual(auto_continue_bot.process_multi_cycle(self.args, self.tracker), 0)
+            self.assertEqual(auto_continue_bot.cycle_state, 'cooldown')
+            self.assertAlmostEqual(self.tracker.cooldown_remaining(1005.0, 15.0), 10.0)
+        self.assertTrue(all(t.actions == 1 for t in self.tracker.targets))
+
+    def test_actions_are_serialized(self):
+        self.paste(0, 100, 300)
+        self.paste(1, 500, 400)
+        seen = []
+
+        def act(args, pos, t):
+            seen.append(auto_continue_bot.action_lock.locked())
+            return 1000.0, True
+
+        with patch('auto_continue_bot._perform_action', side_effect=act):
+            with patch('auto_continue_bot.time.time', return_value=1000.0):
+                auto_continue_bot.process_multi_cycle(self.args, self.tracker)
+        self.assertEqual(seen, [True, True])
+
+    def test_busy_agent_keeps_polling(self):
+        self.tracker.update([auto_continue_bot.Point(100, 100), auto_continue_bot.Point(1200, 100)], 0.0)
+        self.tracker.update([auto_continue_bot.Point(100, 100)], 1.0)
+        self.assertEqual(self.tracker.cooldown_remaining(1.0, 15.0), 0.0)
+
+    def test_blank_screens_are_locked(self):
+        self.monitors = [np.zeros((600, 800, 3), dtype=np.uint8)] * 2
+        with patch('auto_continue_bot.logging'):
+            auto_continue_bot.process_multi_cycle(self.args, self.tracker)
+        self.assertEqual(auto_continue_bot.cycle_state, 'locked')
+
+
+class TestActivityTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [1000.0]
+        patcher = patch('auto_continue_bot.time.monotonic', side_effect=lambda: self.now[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tracker = auto_continue_bot.ActivityTracker()
+
+    def tearDown(self):
+        auto_continue_bot.activity_tracker = None
+
+    def test_idle_query_does_not_sleep(self):
+        with patch('auto_continue_bot.time.sleep') as mock_sleep:
+            self.now[0] += 5
+            self.assertTrue(self.tracker.idle_for(2.0))
+            mock_sleep.assert_not_called()
+
+    def test_input_resets_idle_time(self):
+        self.now[0] += 10
+        self.tracker.on_input(10, 20)
+        self.now[0] += 1
+        self.assertFalse(self.tracker.idle_for(2.0))
+        self.assertAlmostEqual(self.tracker.idle_seconds(), 1.0)
+
+    def test_synthetic_input_is_ignored(self):
+        self.now[0] += 10
+        with self.tracker.synthetic_input():
+            self.tracker.on_input(1, 1)
+        self.tracker.on_input(1, 1)  # late event within the grace period
+        self.assertTrue(self.tracker.idle_for(5.0))
+        self.now[0] += 1
+        self.tracker.on_input(1, 1)
+        self.assertFalse(self.tracker.idle_for(5.0))
+
+    def test_keyboard_hotkey_listener_feeds_tracker(self):
+        auto_continue_bot.activity_tracker = self.tracker
+        self.now[0] += 10
+        auto_continue_bot.on_press(MagicMock())
+        self.assertEqual(self.tracker.idle_seconds(), 0.0)
+
+    def test_start_registers_mouse_listener(self):
+        with patch('auto_continue_bot.mouse') as mock_mouse:
+            self.tracker.start()
+            kwargs = mock_mouse.Listener.call_args.kwargs
+            self.assertEqual(kwargs['on_move'], self.tracker.on_input)
+            mock_mouse.Listener.return_value.start.assert_called_once()
+            self.tracker.stop()
+            mock_mouse.Listener.return_value.stop.assert_called_once()
+
+    def test_user_is_active_uses_tracker(self):
+        auto_continue_bot.activity_tracker = self.tracker
+        with patch('auto_continue_bot.is_user_active') as mock_probe:
+            self.assertFalse(auto_continue_bot.user_is_active(0.0))
+            self.assertTrue(auto_continue_bot.user_is_active(60.0))
+            mock_probe.assert_not_called()
+
+    def test_user_is_active_falls_back_to_probe(self):
+        with patch('auto_continue_bot.is_user_active', return_value=True) as mock_probe:
+            self.assertTrue(auto_continue_bot.user_is_active(2.0))
+            mock_probe.assert_called_once()
+
+
+class TestTextInjection(unittest.TestCase):
+
+    def setUp(self):
+        mock_pyautogui.reset_mock()
+        self.clipboard = ["previous"]
+        self.mock_pyperclip = MagicMock()
+        self.mock_pyperclip.paste.side_effect = lambda: self.clipboard[-1]
+        self.mock_pyperclip.copy.side_effect = self.clipboard.append
+        for target, value in [('auto_continue_bot.pyperclip', self.mock_pyperclip),
+                              ('auto_continue_bot.PYPERCLIP_AVAILABLE', True),
+                              ('auto_continue_bot.time.sleep', MagicMock())]:
+            patcher = patch(target, value, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_clipboard_paste_restores_previous_contents(self):
+        self.assertEqual(auto_continue_bot.inject_text("hello", 'clipboard'), 'clipboard')
+        self.assertEqual(self.clipboard, ["previous", "hello", "previous"])
+        mock_pyautogui.hotkey.assert_called_once()
+        self.assertEqual(mock_pyautogui.hotkey.call_args[0][1], 'v')
+        mock_pyautogui.write.assert_not_called()
+
+    def test_clipboard_restored_even_if_paste_fails(self):
+        mock_pyautogui.hotkey.side_effect = [Exception("no display"), None]
+        with patch('auto_continue_bot.shutil.which', return_value=None):
+            with patch('auto_continue_bot.logging'):
+                self.assertEqual(auto_continue_bot.inject_text("hello", 'clipboard'), 'bulk')
+        self.assertEqual(self.clipboard[-1], "previous")
+        mock_pyautogui.write.assert_called_once_with("hello", interval=0)
+        mock_pyautogui.hotkey.side_effect = None
+
+    def test_auto_prefers_clipboard(self):
+        self.assertEqual(auto_continue_bot.inject_text("hi"), 'clipboard')
+        with patch('auto_continue_bot.PYPERCLIP_AVAILABLE', False):
+            with patch('auto_continue_bot.shutil.which', return_value=None):
+                self.assertEqual(auto_continue_bot.inject_text("hi"), 'bulk')
+
+    def test_bulk_uses_xdotool_on_linux(self):
+        with patch('auto_continue_bot.sys.platform', 'linux'):
+            with patch('auto_continue_bot.shutil.which', return_value='/usr/bin/xdotool'):
+                with patch('auto_continue_bot.subprocess.run') as mock_run:
+                    auto_continue_bot.inject_text("hi there", 'bulk')
+                    self.assertEqual(mock_run.call_args[0][0], ['xdotool', 'type', '--delay', '0', '--', 'hi there'])
+        mock_pyautogui.write.assert_not_called()
+
+    def test_type_is_per_character(self):
+        self.assertEqual(auto_continue_bot.inject_text("hi", 'type'), 'type')
+        mock_pyautogui.write.assert_called_once_with("hi", interval=auto_continue_bot.TYPE_INTERVAL)
+
+    def test_type_failure_propagates(self):
+        mock_pyautogui.write.side_effect = Exception("boom")
+        try:
+            with self.assertRaises(Exception):
+                auto_continue_bot.inject_text("hi", 'type')
+        finally:
+            mock_pyautogui.write.side_effect = None
+
+    def test_delivery_time_is_logged(self):
+        with patch('auto_continue_bot.logging') as mock_logging:
+            auto_continue_bot.inject_text("hello", 'clipboard')
+            self.assertIn("Text delivered via clipboard", mock_logging.info.call_args[0][0])
+
+
+class TestBlankScreen(unittest.TestCase):
+
+    def test_is_blank(self):
+        self.assertTrue(auto_continue_bot.is_blank(np.zeros((100, 100, 3), dtype=np.uint8)))
+        frame = np.zeros((100, 100, 3), dtype=np.uint8)
+        frame[32:64, 32:64] = 200
+        self.assertFalse(auto_continue_bot.is_blank(frame))
+
+    def test_capture_failure_raises_screen_unavailable(self):
+        args = argparse.Namespace(scales=[1.0], pyramid_levels=2)
+        with patch('auto_continue_bot.capture_backend') as mock_backend:
+            mock_backend.screen_region.return_value = (0, 0, 100, 100)
+            mock_backend.grab.side_effect = OSError("screen grab failed")
+            with self.assertRaises(auto_continue_bot.ScreenUnavailableError):
+                auto_continue_bot.locate_full_screen(args, MagicMock(mtime=1.0))
+
+
+class TestRoiTracker(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        cls.template = auto_continue_bot.TemplateCache(path)
+
+    def setUp(self):
+        self.screen = auto_continue_bot.VirtualScreen(auto_continue_bot._virtual_background(1000, 700))
+        patcher = patch('auto_continue_bot.capture_backend', self.screen)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        auto_continue_bot.frame_detector.reset()
+        auto_continue_bot.last_matched_scale = 1.0
+        self.tracker = auto_continue_bot.RoiTracker()
+
+    def show_icon(self, x, y):
+        """Draw the icon centered on (x, y), removing it from anywhere else."""
+        frame = auto_continue_bot._virtual_background(1000, 700)
+        tpl = self.template.color
+        left, top = x - tpl.shape[1] // 2, y - tpl.shape[0] // 2
+        frame[top:top + tpl.shape[0], left:left + tpl.shape[1]] = tpl
+        self.screen.idle_frame = self.screen.busy_frame = frame
+        return auto_continue_bot.Point(left + tpl.shape[1] // 2, top + tpl.shape[0] // 2)
+
+    def test_widens_on_miss_and_shrinks_after_stable_hits(self):
+        self.tracker.remember(auto_continue_bot.Point(300, 300))
+        moved = self.show_icon(450, 300)
+        self.assertEqual(self.tracker.locate(self.template), moved)
+        self.assertEqual(self.tracker.level, 1)
+        self.assertEqual(self.tracker.candidates[0], moved)
+        for _ in range(auto_continue_bot.ROI_SHRINK_HITS):
+            self.assertEqual(self.tracker.locate(self.template), moved)
+        self.assertEqual(self.tracker.level, 0)
+
+    def test_half_screen_before_full_screen(self):
+        self.tracker.remember(auto_continue_bot.Point(300, 300))
+        kinds = [kind for _, kind, _ in self.tracker.regions()]
+        self.assertEqual(kinds, ['roi-0', 'roi-level-1', 'roi-level-2'])
+        moved = self.show_icon(300, 600)
+        self.assertEqual(self.tracker.locate(self.template), moved)
+        self.assertEqual(self.tracker.level, len(auto_continue_bot.ROI_LADDER) - 1)
+
+    def test_absent_icon_searches_only_small_boxes(self):
+        self.tracker.remember(auto_continue_bot.Point(300, 300))
+        self.tracker.full_scan(None)
+        self.assertEqual([kind for _, kind, _ in self.tracker.regions()], ['roi-0'])
+        self.assertIsNone(self.tracker.locate(self.template))
+        self.assertEqual(self.tracker.searched_area, 200 * 200 + 1000 * 700)
+
+    def test_ladder_costs_less_than_a_full_scan(self):
+        # 4K screen, icon gone (agent busy): the whole ladder runs, then the full scan
+        import benchmark_detection
+        background = benchmark_detection.make_screenshot(3840, 2160, np.random.default_rng(0))
+        screen = auto_continue_bot.VirtualScreen(background)
+        args = argparse.Namespace(scales=[1.0, 1.25, 1.5, 2.0], pyramid_levels=2)
+        costs = []
+        match_template = cv2.matchTemplate
+
+        def counting_match(image, templ, method):
+            # Template matching cost grows with haystack area times template area
+            costs.append(image.shape[0] * image.shape[1] * templ.shape[0] * templ.shape[1])
+            return match_template(image, templ, method)
+
+        with patch('auto_continue_bot.capture_backend', screen), \
+             patch('auto_continue_bot.window_tracker', None), \
+             patch('auto_continue_bot.cv2.matchTemplate', side_effect=counting_match):
+            self.tracker.remember(auto_continue_bot.Point(3000, 2000))
+            self.assertIsNone(self.tracker.locate(self.template, levels=args.pyramid_levels))
+            ladder, costs[:] = sum(costs), []
+            auto_continue_bot.frame_detector.reset()
+            self.assertIsNone(auto_continue_bot.locate_full_screen(args, self.template))
+            full = sum(costs)
+        self.assertEqual(self.tracker.level, 0)
+        self.assertLessEqual(ladder, full)
+
+    def test_remembers_several_locations(self):
+        first = self.show_icon(200, 200)
+        self.tracker.full_scan(first)
+        second = self.show_icon(800, 500)
+        self.tracker.full_scan(second)
+        self.assertEqual(self.tracker.candidates, [second, first])
+        self.show_icon(200, 200)
+        self.assertEqual(self.tracker.locate(self.template), first)
+        self.assertEqual(self.tracker.candidates[0], first)
+
+    def test_report(self):
+        self.assertEqual(self.tracker.report(), "ROI: no searches yet")
+        pos = self.show_icon(200, 200)
+        self.tracker.full_scan(pos)
+        self.tracker.locate(self.template)
+        self.assertIn("ROI hit rate 100% (1/1)", self.tracker.report())
+
+
+class TestVirtualScreen(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.icon_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        cls.template = auto_continue_bot.TemplateCache(cls.icon_path)
+
+    def setUp(self):
+        self.now = [100.0]
+        self.screen = auto_continue_bot.VirtualScreen(
+            auto_continue_bot._virtual_background(800, 600), icon=self.template.color,
+            icon_pos=(500, 400), busy_seconds=2.0, clock=lambda: self.now[0])
+        self.args = argparse.Namespace(
+            cooldown=0.0, no_polite=True, idle_threshold=2.0, scales=[1.0], pyramid_levels=2,
+            offset_x=-200, offset_y=-50, dry_run=False, text="go on", inject='auto', notify=False)
+        auto_continue_bot.frame_detector.reset()
+        auto_continue_bot.bot_paused = False
+        auto_continue_bot.last_known_mic_pos = None
+        auto_continue_bot.roi_tracker = auto_continue_bot.RoiTracker()
+        auto_continue_bot.activity_tracker = None
+        for name in ('capture_backend', 'screen_driver'):
+            patcher = patch(f'auto_continue_bot.{name}', self.screen)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_grab_pads_outside_screen(self):
+        frame = self.screen.grab((-10, -10, 20, 20))
+        self.assertEqual(frame.shape, (20, 20, 3))
+        self.assertTrue((frame[:10, :10] == 0).all())
+        self.assertTrue((frame[10:, 10:] == self.screen.busy_frame[:10, :10]).all())
+
+    def test_end_to_end_cycle(self):
+        self.now[0] += 0.25
+        with patch('auto_continue_bot.time.sleep') as mock_sleep:
+            _, acted = auto_continue_bot.process_cycle(self.args, self.template, 0)
+        self.assertTrue(acted)
+        mock_sleep.assert_not_called()
+        self.assertEqual(self.screen.submitted, ["go on"])
+        kinds = [kind for _, kind, _ in self.screen.actions]
+        self.assertEqual(kinds, ['click', 'text', 'press', 'move'])
+        self.assertEqual(self.screen.actions[0][2], auto_continue_bot.Point(300, 350))
+        self.assertEqual(self.screen.latencies, [0.25])
+        mock_pyautogui.click.assert_not_called()
+
+        # Agent is busy: the icon is gone until busy_seconds have passed
+        self.assertIsNone(auto_continue_bot.locate_full_screen(self.args, self.template))
+        self.now[0] += 2.5
+        self.assertEqual(auto_continue_bot.locate_full_screen(self.args, self.template), auto_continue_bot.Point(500, 400))
+
+    def test_static_image_records_without_latency(self):
+        screen = auto_continue_bot.load_virtual_screen(self.icon_path)
+        self.assertIsNone(screen.icon_pos)
+        screen.click(1, 2)
+        screen.press('enter')
+        self.assertEqual(screen.latencies, [])
+        self.assertEqual(screen.submitted, [""])
+
+    def test_load_scene(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'scene.json')
+            with open(path, 'w') as f:
+                json.dump({"size": [640, 480], "icon_pos": [100, 120], "max_actions": 1}, f)
+            screen = auto_continue_bot.load_virtual_screen(path, default_icon=self.icon_path)
+        self.assertEqual(screen.screen_region(), (0, 0, 640, 480))
+        self.assertEqual(screen.icon_pos, auto_continue_bot.Point(100, 120))
+        self.assertFalse(screen.done)
+        screen.press('enter')
+        self.assertTrue(screen.done)
+
+
+class TestAsyncRuntime(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        cls.template = auto_continue_bot.TemplateCache(path)
+
+    def setUp(self):
+        self.screen = auto_continue_bot.VirtualScreen(
+            auto_continue_bot._virtual_background(800, 600), icon=self.template.color,
+            icon_pos=(500, 400), busy_seconds=0.2)
+        self.args = argparse.Namespace(
+            cooldown=0.0, no_polite=True, idle_threshold=2.0, scales=[1.0], pyramid_levels=2,
+            offset_x=-200, offset_y=-50, dry_run=False, text="go on", inject='auto', notify=True,
+            min_interval=0.01, max_interval=0.05, multi=False, workers=1, once=False, runtime='asyncio')
+        auto_continue_bot.frame_detector.reset()
+        auto_continue_bot.roi_tracker = auto_continue_bot.RoiTracker()
+        auto_continue_bot.bot_paused = False
+        auto_continue_bot.bot_running = True
+        auto_continue_bot.activity_tracker = None
+        auto_continue_bot.wake_event.clear()
+        self.addCleanup(setattr, auto_continue_bot, 'bot_running', True)
+        for name in ('capture_backend', 'screen_driver'):
+            patcher = patch(f'auto_continue_bot.{name}', self.screen)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_pipeline_acts_and_notifies(self):
+        def stop_after_two_submissions():
+            deadline = time.monotonic() + 10
+            while len(self.screen.submitted) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            auto_continue_bot.bot_running = False
+            auto_continue_bot.wake_event.set()
+
+        watchdog = threading.Thread(target=stop_after_two_submissions)
+        watchdog.start()
+        with patch('auto_continue_bot.send_notification') as mock_notify:
+            auto_continue_bot.bot_loop(self.args, self.template)
+        watchdog.join()
+        self.assertGreaterEqual(len(self.screen.submitted), 2)
+        self.assertEqual(self.screen.submitted[0], "go on")
+        self.assertGreaterEqual(mock_notify.call_count, 2)
+
+    def test_target_is_queued_once(self):
+        runtime = auto_continue_bot.AsyncRuntime(self.args, self.template)
+
+        async def offer_twice():
+            runtime.actions = auto_continue_bot.asyncio.Queue(maxsize=4)
+            first = runtime.offer(None, auto_continue_bot.Point(1, 1))
+            second = runtime.offer(None, auto_continue_bot.Point(1, 1))
+            return first, second, runtime.actions.qsize()
+
+        self.assertEqual(auto_continue_bot.asyncio.run(offer_twice()), (True, False, 1))
+
+    def json_log_of_first_action(self):
+        def stop_after_first_submission():
+            deadline = time.monotonic() + 10
+            while not self.screen.submitted and time.monotonic() < deadline:
+                time.sleep(0.01)
+            auto_continue_bot.bot_running = False
+            auto_continue_bot.wake_event.set()
+
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+        root.handlers = []
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bot.log')
+            try:
+                with patch('auto_continue_bot.LOG_FILE', path), patch('sys.stdout', new=MagicMock()), \
+                     patch('auto_continue_bot.send_notification'):
+                    auto_continue_bot.setup_logging('json')
+                    root.setLevel(logging.DEBUG)
+                    watchdog = threading.Thread(target=stop_after_first_submission)
+                    watchdog.start()
+                    auto_continue_bot.bot_loop(self.args, self.template)
+                    watchdog.join()
+                    auto_continue_bot.stop_logging()
+            finally:
+                for handler in root.handlers:
+                    handler.close()
+                root.handlers, root.level = saved_handlers, saved_level
+            with open(path, encoding='utf-8') as f:
+                return [json.loads(line) for line in f]
+
+    def assert_action_logged_with_its_cycle(self, events, scan_stages):
+        sent = next(e for e in events if e['msg'] == "Sent 'continue'.")
+        self.assertIsNotNone(sent.get('cycle'))
+        summary = next(e for e in events if e.get('cycle') == sent['cycle'] and 'stages' in e)
+        self.assertEqual(summary['level'], "INFO")
+        for stage in ('detect', 'action', 'click', 'text_injection', 'mouse_restore') + scan_stages:
+            self.assertIn(stage, summary['stages'])
+
+    def test_json_log_keeps_cycle_across_executors(self):
+        events = self.json_log_of_first_action()
+        self.assert_action_logged_with_its_cycle(events, ('full_capture', 'full_match'))
+
+    def test_json_log_keeps_cycle_in_multi_mode(self):
+        self.args.multi = True
+        self.args.workers = 2
+        events = self.json_log_of_first_action()
+        self.assert_action_logged_with_its_cycle(events, ('full_capture', 'full_match'))
+
+
+class TestShutdown(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        self.template = auto_continue_bot.TemplateCache(path)
+        self.screen = auto_continue_bot.VirtualScreen(
+            auto_continue_bot._virtual_background(800, 600), icon=self.template.color, icon_pos=(500, 400))
+        self.args = argparse.Namespace(
+            cooldown=60.0, no_polite=True, idle_threshold=2.0, scales=[1.0], pyramid_levels=2,
+            offset_x=-200, offset_y=-50, dry_run=False, text="go on", inject='auto', notify=False,
+            min_interval=0.01, max_interval=0.05, multi=False, workers=1, once=False, runtime='thread',
+            metrics_file=None)
+        auto_continue_bot.frame_detector.reset()
+        auto_continue_bot.roi_tracker = auto_continue_bot.RoiTracker()
+        auto_continue_bot.bot_paused = False
+        auto_continue_bot.bot_running = True
+        auto_continue_bot.wake_event.clear()
+        self.addCleanup(setattr, auto_continue_bot, 'bot_running', True)
+        for name in ('capture_backend', 'screen_driver'):
+            patcher = patch(f'auto_continue_bot.{name}', self.screen)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.state = MagicMock()
+        patcher = patch('auto_continue_bot.detection_state', self.state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bot_thread_saves_state_before_exit(self):
+        thread = threading.Thread(target=auto_continue_bot.bot_loop, args=(self.args, self.template), daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 10
+        while not self.screen.submitted and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with patch('auto_continue_bot.logging'):
+            auto_continue_bot.stop_bot_thread(thread)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.state.save.call_args.kwargs, {'force': True})
+
+    def test_release_closes_capture(self):
+        backend = MagicMock()
+        with patch('auto_continue_bot.capture_backend', backend), patch('auto_continue_bot.match_pool', None), \
+             patch('auto_continue_bot.checkpointer', None), patch('auto_continue_bot.window_tracker', None):
+            auto_continue_bot.release_resources(self.args)
+        backend.close.assert_called_once()
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "fork start method needed to inherit the test mocks")
+class TestMatchWorkerPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        cls.template = auto_continue_bot.TemplateCache(cls.path)
+
+    def setUp(self):
+        self.pool = auto_continue_bot.MatchWorkerPool([(self.path, None)], processes=1, timeout=20, context='fork')
+        self.addCleanup(self.pool.close)
+        self.screen = np.full((400, 600, 3), 40, dtype=np.uint8)
+        cv2.rectangle(self.screen, (10, 10), (200, 40), (200, 200, 200), -1)
+        tpl = self.template.color
+        self.screen[300:300 + tpl.shape[0], 100:100 + tpl.shape[1]] = tpl
+        self.expected = (100 + tpl.shape[1] // 2, 300 + tpl.shape[0] // 2)
+
+    def test_matches_in_worker_process(self):
+        matches = self.pool.match(self.screen, (1.0,), 2)
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(tuple(matches[0].center), self.expected)
+        self.assertEqual(matches[0].variant, "microphone_icon")
+        self.assertNotEqual(self.pool.workers[0].process.pid, os.getpid())
+
+    def test_match_frame_uses_pool(self):
+        with patch('auto_continue_bot.match_pool', self.pool):
+            with patch('auto_continue_bot.locate_pyramid') as mock_locate:
+                match = auto_continue_bot.match_frame(self.screen, self.template, (1.0,), 2)
+        mock_locate.assert_not_called()
+        self.assertEqual(tuple(match.center), self.expected)
+
+    def test_worker_tries_the_last_matched_variant_first(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        dark_path = os.path.join(tmp.name, "dark.png")
+        cv2.imwrite(dark_path, 255 - self.template.color)
+        specs = [(self.path, None), (dark_path, None)]
+        templates = auto_continue_bot.TemplateSet.load(specs)
+        pool = auto_continue_bot.MatchWorkerPool(specs, processes=1, timeout=20, context='fork')
+        self.addCleanup(pool.close)
+        dark = templates.variants[1].template.color
+        self.screen[100:100 + dark.shape[0], 400:400 + dark.shape[1]] = dark
+        # Both variants are on screen: a single search returns whichever is tried first
+        with patch('auto_continue_bot.match_pool', pool):
+            for first in ("dark", "microphone_icon", "dark"):
+                templates.last_matched = first
+                self.assertEqual(auto_continue_bot.match_frame(self.screen, templates, (1.0,), 2).variant, first)
+
+    def test_crashed_worker_is_restarted(self):
+        self.pool.match(self.screen, (1.0,), 2)
+        worker = self.pool.workers[0]
+        old_pid = worker.process.pid
+        worker.process.kill()
+        worker.process.join(5)
+        with patch('auto_continue_bot.logging') as mock_logging:
+            matches = self.pool.match(self.screen, (1.0,), 2)
+            mock_logging.warning.assert_called_once()
+        self.assertEqual(tuple(matches[0].center), self.expected)
+        self.assertNotEqual(worker.process.pid, old_pid)
+
+    def test_spawned_worker_does_not_set_up_logging(self):
+        # Spawned workers re-import the module; only main() may open bot.log
+        with tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                pool = auto_continue_bot.MatchWorkerPool([(self.path, None)], processes=1, timeout=60, context='spawn')
+                try:
+                    self.assertEqual(tuple(pool.match(self.screen, (1.0,), 2)[0].center), self.expected)
+                finally:
+                    pool.close()
+            finally:
+                os.chdir(cwd)
+            self.assertFalse(os.path.exists(os.path.join(tmp, "bot.log")))
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_imported_on_first_use(self):
+        lazy = auto_continue_bot._LazyModule('json')
+        self.assertNotIn('loaded', repr(lazy))
+        self.assertIs(lazy.dumps, json.dumps)
+        self.assertIn('loaded', repr(lazy))
+
+    def test_attribute_of_module(self):
+        lazy = auto_continue_bot._LazyModule('os', 'path')
+        self.assertIs(lazy.join, os.path.join)
+
+    def test_patching_through_proxy(self):
+        with patch('auto_continue_bot.pyautogui.click') as mock_click:
+            auto_continue_bot.screen_driver.click(1, 2)
+            mock_click.assert_called_once_with(1, 2)
+
+    def test_once_flags(self):
+        with patch('auto_continue_bot.load_config', return_value={}):
+            args = auto_continue_bot.parse_arguments(['--once'])
+            self.assertTrue(args.once)
+            self.assertFalse(args.scan_once)
+            self.assertTrue(auto_continue_bot.parse_arguments(['--scan-once']).scan_once)
+
+    def test_scan_once_honours_cooldown_from_state_file(self):
+        args = argparse.Namespace(multi=False, scales=[1.0])
+        with tempfile.TemporaryDirectory() as tmp:
+            state = auto_continue_bot.DetectionState(os.path.join(tmp, 'state.json'))
+            with patch('auto_continue_bot.detection_state', state), \
+                 patch('auto_continue_bot.screen_fingerprint', return_value=[[0, 0, 100, 100]]), \
+                 patch('auto_continue_bot.roi_tracker', auto_continue_bot.RoiTracker()) as tracker, \
+                 patch('auto_continue_bot.logging'):
+                tracker.remember(auto_continue_bot.Point(10, 10))
+                with patch('auto_continue_bot.process_cycle', return_value=(1234.0, True)) as mock_cycle:
+                    self.assertTrue(auto_continue_bot.run_once(args, "mic.png"))
+                mock_cycle.assert_called_once_with(args, "mic.png", 0)
+                # The next run starts from the saved action time
+                state.last_action = 0.0
+                with patch('auto_continue_bot.process_cycle', return_value=(1234.0, False)) as mock_cycle:
+                    self.assertFalse(auto_continue_bot.run_once(args, "mic.png"))
+                mock_cycle.assert_called_once_with(args, "mic.png", 1234.0)
+
+    def test_once_runs_a_single_cycle_without_gui(self):
+        args = argparse.Namespace(multi=False)
+        with patch('auto_continue_bot.process_cycle', return_value=(0, False)) as mock_cycle, \
+                patch('auto_continue_bot.start_hotkey_listener') as mock_hotkeys, \
+                patch('auto_continue_bot.ActivityTracker') as mock_tracker:
+            self.assertFalse(auto_continue_bot.run_once(args, "mic.png"))
+        mock_cycle.assert_called_once_with(args, "mic.png", 0)
+        self.assertFalse(auto_continue_bot.bot_paused)
+        mock_hotkeys.assert_not_called()
+        mock_tracker.assert_not_called()
+        mock_pystray.Icon.assert_not_called()
+
+
+class TestConfigWatcher(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.path = os.path.join(self.dir, "config.json")
+        self.icon = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        self.write({"cooldown": 15.0, "text": "continue"})
+        with patch('auto_continue_bot.load_config', return_value={"cooldown": 15.0, "text": "continue"}):
+            self.args = auto_continue_bot.parse_arguments([])
+        self.watcher = auto_continue_bot.ConfigWatcher(self.path, [], self.args)
+        self.template = auto_continue_bot.TemplateSet.load([(self.icon, None)])
+
+    def write(self, config):
+        with open(self.path, 'w') as f:
+            json.dump(config, f)
+        # Make sure the change is visible even on coarse mtime filesystems
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    def test_unchanged_file_is_not_parsed(self):
+        with patch('auto_continue_bot.json.load') as mock_load:
+            self.assertFalse(self.watcher.check())
+            mock_load.assert_not_called()
+
+    def test_changes_applied_between_cycles(self):
+        self.write({"cooldown": 5.0, "text": "go on", "offset_x": -100})
+        self.assertTrue(self.watcher.check())
+        self.assertEqual(self.args.cooldown, 15.0)
+        changed = self.watcher.apply_pending(self.args, self.template)
+        self.assertEqual(changed, {'cooldown', 'text', 'offset_x'})
+        self.assertEqual((self.args.cooldown, self.args.text, self.args.offset_x), (5.0, "go on", -100))
+        self.assertEqual(self.watcher.apply_pending(self.args, self.template), set())
+
+    def test_invalid_config_keeps_current_settings(self):
+        for bad in ('{"cooldown": ', json.dumps({"cooldown": "fast"}), json.dumps({"cooldown": True}),
+                    json.dumps({"min_interval": 0}), json.dumps({"inject": "telepathy"})):
+            with open(self.path, 'w') as f:
+                f.write(bad)
+            self.watcher.force()
+            with patch('auto_continue_bot.logging') as mock_logging:
+                self.assertFalse(self.watcher.check(), bad)
+                mock_logging.error.assert_called_once()
+        self.assertEqual(self.watcher.apply_pending(self.args, self.template), set())
+        self.assertEqual(self.args.cooldown, 15.0)
+
+    def test_command_line_flags_still_win(self):
+        self.watcher.argv = ['--cooldown', '30']
+        self.args.cooldown = 30.0
+        self.write({"cooldown": 5.0, "text": "go on"})
+        self.watcher.check()
+        self.assertEqual(self.watcher.apply_pending(self.args, self.template), {'text'})
+        self.assertEqual(self.args.cooldown, 30.0)
+
+    def test_changed_image_is_redecoded(self):
+        dark = os.path.join(self.dir, "dark.png")
+        cv2.imwrite(dark, 255 - cv2.imread(self.icon))
+        self.write({"image": [dark, {"path": self.icon, "confidence": 0.9}]})
+        self.assertTrue(self.watcher.check())
+        self.watcher.apply_pending(self.args, self.template)
+        self.assertEqual([v.name for v in self.template.variants], ["dark", "microphone_icon"])
+        self.assertEqual(self.template.variants[1].confidence, 0.9)
+
+    def test_concurrent_checks_apply_one_reload(self):
+        self.write({"cooldown": 5.0, "text": "go on"})
+        results = []
+        real_parse = auto_continue_bot.parse_arguments
+
+        def slow_parse(*args, **kwargs):
+            time.sleep(0.1)
+            return real_parse(*args, **kwargs)
+
+        with patch('auto_continue_bot.parse_arguments', side_effect=slow_parse) as mock_parse, \
+             patch('auto_continue_bot.logging'):
+            threads = [threading.Thread(target=lambda: results.append(self.watcher.check())) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # The second check waited for the first and found the file already handled
+        self.assertEqual(sorted(results), [False, True])
+        self.assertEqual(mock_parse.call_count, 1)
+
+    def test_polite_mode_toggle_starts_and_stops_tracker(self):
+        self.addCleanup(setattr, auto_continue_bot, 'activity_tracker', None)
+        auto_continue_bot.activity_tracker = None
+        with patch('auto_continue_bot.ActivityTracker') as mock_tracker, patch('auto_continue_bot.logging'):
+            self.write({"cooldown": 15.0, "text": "continue", "no_polite": True})
+            self.watcher.check()
+            self.watcher.apply_pending(self.args, self.template)
+            mock_tracker.assert_not_called()
+            self.write({"cooldown": 15.0, "text": "continue", "no_polite": False})
+            self.watcher.check()
+            self.watcher.apply_pending(self.args, self.template)
+            mock_tracker.return_value.start.assert_called_once()
+            self.assertIs(auto_continue_bot.activity_tracker, mock_tracker.return_value)
+            self.write({"cooldown": 15.0, "text": "continue", "no_polite": True})
+            self.watcher.check()
+            self.watcher.apply_pending(self.args, self.template)
+            mock_tracker.return_value.stop.assert_called_once()
+            self.assertIsNone(auto_continue_bot.activity_tracker)
+
+    def test_scheduler_bounds(self):
+        scheduler = auto_continue_bot.ScanScheduler(0.25, 5.0)
+        scheduler.interval = 4.0
+        scheduler.set_bounds(0.5, 2.0)
+        self.assertEqual((scheduler.min_interval, scheduler.max_interval, scheduler.interval), (0.5, 2.0, 2.0))
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), "inotify is Linux only")
+    def test_inotify_wakes_on_write(self):
+        inotify = auto_continue_bot._Inotify(self.dir)
+        self.addCleanup(inotify.close)
+        self.assertFalse(inotify.wait(0))
+        self.write({"cooldown": 1.0})
+        self.assertTrue(inotify.wait(1))
+        self.assertFalse(inotify.wait(0))
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [0.0]
+        self.metrics = auto_continue_bot.Metrics(clock=lambda: self.now[0])
+
+    def test_time_records_histogram(self):
+        with self.metrics.time('roi_match'):
+            self.now[0] += 0.004
+        text = self.metrics.render()
+        self.assertIn('bot_stage_seconds_bucket{stage="roi_match",le="0.0025"} 0', text)
+        self.assertIn('bot_stage_seconds_bucket{stage="roi_match",le="0.005"} 1', text)
+        self.assertIn('bot_stage_seconds_bucket{stage="roi_match",le="+Inf"} 1', text)
+        self.assertIn('bot_stage_seconds_count{stage="roi_match"} 1', text)
+        self.assertIn('bot_stage_seconds_sum{stage="roi_match"} 0.004000', text)
+
+    def test_time_records_when_stage_raises(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.time('click'):
+                self.now[0] += 0.5
+                raise ValueError("boom")
+        self.assertEqual(self.metrics.stages['click'][-1], 1)
+
+    def test_counters(self):
+        self.metrics.inc('roi_hits')
+        self.metrics.inc('roi_hits', 2)
+        self.assertIn('bot_roi_hits_total 3', self.metrics.render())
+
+    def test_metrics_file_is_replaced(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bot.prom')
+            with patch('auto_continue_bot.metrics', self.metrics):
+                self.metrics.inc('actions')
+                auto_continue_bot.write_metrics_file(path)
+            with open(path) as f:
+                self.assertIn('bot_actions_total 1', f.read())
+            self.assertEqual(os.listdir(tmp), ['bot.prom'])
+
+    def test_metrics_endpoint(self):
+        with patch('auto_continue_bot.metrics', self.metrics):
+            self.metrics.inc('detections')
+            server = auto_continue_bot.start_metrics_server(0)
+            try:
+                url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    self.assertIn('bot_detections_total 1', response.read().decode())
+            finally:
+                server.shutdown()
+                server.server_close()
+
+class TestLoggingPipeline(unittest.TestCase):
+
+    def make_record(self, message, level=logging.ERROR):
+        return logging.LogRecord('root', level, __file__, 1, message, None, None)
+
+    def test_dedup_collapses_repeats_into_summary(self):
+        now = [0.0]
+        dedup = auto_continue_bot.LogDeduplicator(interval=60, clock=lambda: now[0])
+        self.assertTrue(dedup.filter(self.make_record("Error searching for image: x")))
+        for _ in range(29):
+            now[0] += 2
+            self.assertFalse(dedup.filter(self.make_record("Error searching for image: x")))
+        now[0] += 2
+        record = self.make_record("Error searching for image: x")
+        self.assertTrue(dedup.filter(record))
+        self.assertEqual(record.repeated, 29)
+        self.assertIn("repeated 29 more times", record.getMessage())
+
+    def test_dedup_keeps_info_lines(self):
+        dedup = auto_continue_bot.LogDeduplicator(interval=60, clock=lambda: 0.0)
+        for _ in range(3):
+            self.assertTrue(dedup.filter(self.make_record("Typing text...", logging.INFO)))
+
+    def test_dedup_flush_reports_pending(self):
+        dedup = auto_continue_bot.LogDeduplicator(interval=60, clock=lambda: 0.0)
+        dedup.filter(self.make_record("boom"))
+        dedup.filter(self.make_record("boom"))
+        with patch('auto_continue_bot.logging') as mock_logging:
+            dedup.flush()
+            mock_logging.log.assert_called_once()
+            self.assertIn("repeated 1 more times", mock_logging.log.call_args[0][1])
+
+    def test_cycle_log_collects_stage_durations(self):
+        now = [0.0]
+        metrics = auto_continue_bot.Metrics(clock=lambda: now[0])
+        cycle_log = auto_continue_bot.CycleLog()
+        with patch('auto_continue_bot.cycle_log', cycle_log), patch('auto_continue_bot.logging') as mock_logging:
+            auto_continue_bot.cycle_state = 'acted'
+            with cycle_log.cycle() as cycle_id:
+                self.assertEqual(cycle_log.current(), cycle_id)
+                with metrics.time('click'):
+                    now[0] += 0.02
+            self.assertIsNone(cycle_log.current())
+            level, message = mock_logging.log.call_args[0]
+            self.assertEqual(level, mock_logging.INFO)
+            self.assertIn(f"Cycle {cycle_id}", message)
+            self.assertEqual(mock_logging.log.call_args[1]['extra']['stages'], {'click': 0.02})
+
+    def test_executor_threads_record_into_the_cycle(self):
+        metrics = auto_continue_bot.Metrics()
+        cycle_log = auto_continue_bot.CycleLog()
+        seen = []
+
+        def scan(i):
+            seen.append(cycle_log.current())
+            with metrics.time('full_match'):
+                pass
+
+        with patch('auto_continue_bot.cycle_log', cycle_log), patch('auto_continue_bot.logging') as mock_logging, \
+             auto_continue_bot.ThreadPoolExecutor(4) as executor:
+            with cycle_log.cycle() as cycle_id:
+                list(executor.map(auto_continue_bot.in_context(scan), range(8)))
+        self.assertEqual(seen, [cycle_id] * 8)
+        self.assertIn('full_match', mock_logging.log.call_args[1]['extra']['stages'])
+
+    def test_json_lines_through_queue(self):
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+        root.handlers = []
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bot.log')
+            try:
+                with patch('auto_continue_bot.LOG_FILE', path), patch('sys.stdout', new=MagicMock()):
+                    auto_continue_bot.setup_logging('json')
+                    with auto_continue_bot.cycle_log.cycle() as cycle_id:
+                        logging.info("Microphone detected")
+                    auto_continue_bot.stop_logging()
+            finally:
+                for handler in root.handlers:
+                    handler.close()
+                root.handlers, root.level = saved_handlers, saved_level
+            with open(path, encoding='utf-8') as f:
+                events = [json.loads(line) for line in f]
+        self.assertEqual(events[0]['msg'], "Microphone detected")
+        self.assertEqual(events[0]['level'], "INFO")
+        self.assertEqual(events[0]['cycle'], cycle_id)
+
+    def log_exception(self, log_format):
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+        root.handlers = []
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bot.log')
+            try:
+                with patch('auto_continue_bot.LOG_FILE', path), patch('sys.stdout', new=MagicMock()):
+                    auto_continue_bot.setup_logging(log_format)
+                    try:
+                        raise ValueError("capture failed")
+                    except ValueError:
+                        logging.exception("Error searching for image: %s", "boom")
+                    auto_continue_bot.stop_logging()
+            finally:
+                for handler in root.handlers:
+                    handler.close()
+                root.handlers, root.level = saved_handlers, saved_level
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+
+    def test_json_keeps_traceback_through_queue(self):
+        event = json.loads(self.log_exception('json').splitlines()[0])
+        self.assertEqual(event['msg'], "Error searching for image: boom")
+        self.assertIn("Traceback", event['exc'])
+        self.assertIn("ValueError: capture failed", event['exc'])
+
+    def test_text_keeps_traceback_through_queue(self):
+        text = self.log_exception('text')
+        self.assertIn("ERROR - Error searching for image: boom", text)
+        self.assertEqual(text.count("ValueError: capture failed"), 1)
+
+class TestAutotune(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.icon_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        self.template = auto_continue_bot.TemplateSet.load([(self.icon_path, None)])
+        icon = cv2.imread(self.icon_path)
+        rng = np.random.default_rng(5)
+        self.frames = []
+        for i, pos in enumerate([(300, 200), (310, 190), None]):
+            frame = np.full((400, 600, 3), 40, dtype=np.uint8)
+            for _ in range(40):
+                x, y = rng.integers(0, 560), rng.integers(0, 380)
+                cv2.rectangle(frame, (int(x), int(y)), (int(x) + 30, int(y) + 12), [int(c) for c in rng.integers(0, 255, 3)], -1)
+            if pos:
+                frame[pos[1]:pos[1] + icon.shape[0], pos[0]:pos[0] + icon.shape[1]] = icon
+            cv2.imwrite(os.path.join(self.tmpdir.name, f"shot{i}.png"), frame)
+            self.frames.append((f"shot{i}.png", frame))
+
+    def test_load_frames_from_folder(self):
+        with open(os.path.join(self.tmpdir.name, "notes.txt"), "w") as f:
+            f.write("not a screenshot")
+        frames = auto_continue_bot.load_autotune_frames(self.tmpdir.name)
+        self.assertEqual([name for name, _ in frames], ["shot0.png", "shot1.png", "shot2.png"])
+
+    def test_picks_reliable_settings(self):
+        with patch('auto_continue_bot.AUTOTUNE_REPEATS', 1):
+            result = auto_continue_bot.autotune(self.frames, self.template, [1.0])
+        self.assertIn(result['pyramid_levels'], auto_continue_bot.AUTOTUNE_LEVELS)
+        self.assertGreaterEqual(result['roi_size'], auto_continue_bot.AUTOTUNE_ROI_FIT * 85)
+        confidence = result['confidences']['microphone_icon']
+        self.assertLessEqual(confidence, 1.0 - auto_continue_bot.AUTOTUNE_MARGIN)
+        self.assertGreaterEqual(confidence, auto_continue_bot.AUTOTUNE_MIN_SCORE)
+        mode = 'grayscale' if result['grayscale'] else 'color'
+        chosen = result['timings_ms'][f"{mode}/levels={result['pyramid_levels']}"]
+        self.assertEqual(chosen, min(ms for key, ms in result['timings_ms'].items() if '/levels=' in key and ms is not None))
+
+    def test_icon_missing_everywhere(self):
+        with self.assertRaises(ValueError):
+            auto_continue_bot.autotune(self.frames[2:], self.template, [1.0])
+
+    def test_look_alike_below_confidence_is_not_the_icon(self):
+        # A blurred icon scores about 0.9: below the default confidence, so not a reference
+        icon = cv2.GaussianBlur(cv2.imread(self.icon_path), (15, 15), 0)
+        frame = self.frames[2][1].copy()
+        frame[200:200 + icon.shape[0], 300:300 + icon.shape[1]] = icon
+        with self.assertRaises(ValueError):
+            auto_continue_bot.autotune([("blurred.png", frame)], self.template, [1.0])
+        loose = auto_continue_bot.TemplateSet.load([(self.icon_path, 0.8)])
+        with patch('auto_continue_bot.AUTOTUNE_REPEATS', 1):
+            result = auto_continue_bot.autotune([("blurred.png", frame)], loose, [1.0])
+        self.assertLess(result['confidences']['microphone_icon'], 0.9)
+
+    def test_run_autotune_writes_config(self):
+        config_path = os.path.join(self.tmpdir.name, "config.json")
+        with open(config_path, "w") as f:
+            json.dump({"cooldown": 30}, f)
+        args = auto_continue_bot.parse_arguments(
+            ["--autotune", self.tmpdir.name, "--image", "microphone_icon.png"], config={})
+        with patch('auto_continue_bot.resource_path', side_effect=lambda p: os.path.join(self.tmpdir.name, p)), \
+             patch('auto_continue_bot.AUTOTUNE_REPEATS', 1), patch('auto_continue_bot.logging'):
+            result = auto_continue_bot.run_autotune(args, self.template)
+        with open(config_path) as f:
+            config = json.load(f)
+        auto_continue_bot.validate_config(config)
+        self.assertEqual(config["cooldown"], 30)
+        self.assertEqual(config["pyramid_levels"], result['pyramid_levels'])
+        self.assertEqual(config["grayscale"], result['grayscale'])
+        self.assertEqual(config["image"], [{"path": "microphone_icon.png", "confidence": result['confidences']['microphone_icon']}])
+        self.assertEqual(config["autotune"]["screenshots"], 3)
+        tuned = auto_continue_bot.parse_arguments([], config=config)
+        self.assertEqual(tuned.roi_size, result['roi_size'])
+
+    def tune_on_screen(self, config, argv=()):
+        config_path = os.path.join(self.tmpdir.name, "config.json")
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        args = auto_continue_bot.parse_arguments(["--autotune", "--image", "microphone_icon.png", *argv], config=config)
+        with patch('auto_continue_bot.resource_path', side_effect=lambda p: os.path.join(self.tmpdir.name, p)), \
+             patch('auto_continue_bot.load_autotune_frames', return_value=self.frames), \
+             patch('auto_continue_bot.autotune_capture_backends', return_value={'mss': 5.0, 'pyscreeze': 40.0}) as mock_capture, \
+             patch('auto_continue_bot.capture_backend'), \
+             patch('auto_continue_bot.AUTOTUNE_REPEATS', 1), patch('auto_continue_bot.logging'):
+            auto_continue_bot.run_autotune(args, self.template)
+        with open(config_path) as f:
+            return json.load(f), mock_capture.called
+
+    def test_autotune_picks_backend_left_on_auto(self):
+        config, measured = self.tune_on_screen({})
+        self.assertTrue(measured)
+        self.assertEqual(config["capture_backend"], "mss")
+        self.assertEqual(config["autotune"]["capture_backend"], "mss")
+        # A later run may replace its own earlier pick
+        config, measured = self.tune_on_screen(config)
+        self.assertTrue(measured)
+        self.assertEqual(config["autotune"]["capture_backend"], "mss")
+
+    def test_autotune_keeps_backend_chosen_by_user(self):
+        config, measured = self.tune_on_screen({"capture_backend": "pyscreeze"})
+        self.assertFalse(measured)
+        self.assertEqual(config["capture_backend"], "pyscreeze")
+        self.assertIsNone(config["autotune"]["capture_backend"])
+        config, measured = self.tune_on_screen({}, ["--capture-backend", "shared"])
+        self.assertFalse(measured)
+        self.assertNotIn("capture_backend", config)
+
+    def test_match_frame_uses_grayscale_setting(self):
+        with patch('auto_continue_bot.match_grayscale', True), \
+             patch('auto_continue_bot.locate_pyramid', return_value=None) as mock_locate:
+            auto_continue_bot.match_frame(self.frames[0][1], self.template, [1.0], 2)
+        self.assertTrue(mock_locate.call_args.kwargs['grayscale'])
+
+class TestDetectionState(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "bot_state.json")
+        self.monitors = [(0, 0, 1920, 1080), (1920, 0, 2560, 1440)]
+        backend = MagicMock()
+        backend.monitor_regions.side_effect = lambda: list(self.monitors)
+        for name, value in (('capture_backend', backend), ('roi_tracker', auto_continue_bot.RoiTracker()),
+                            ('last_matched_scale', 1.0), ('last_matched_variant', None)):
+            patcher = patch(f'auto_continue_bot.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.now = [0.0]
+        self.state = auto_continue_bot.DetectionState(self.path, clock=lambda: self.now[0])
+        self.args = argparse.Namespace(scales=[1.0, 1.5])
+        icon = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png")
+        self.template = auto_continue_bot.TemplateSet.load([(icon, None)])
+
+    def seed(self):
+        auto_continue_bot.roi_tracker.remember(auto_continue_bot.Point(2500, 900))
+        auto_continue_bot.roi_tracker.remember(auto_continue_bot.Point(1500, 950))
+        auto_continue_bot.last_matched_scale = 1.5
+        auto_continue_bot.last_matched_variant = 'microphone_icon'
+
+    def restart(self):
+        auto_continue_bot.roi_tracker = auto_continue_bot.RoiTracker()
+        auto_continue_bot.last_matched_scale = 1.0
+        auto_continue_bot.last_matched_variant = None
+        return auto_continue_bot.DetectionState(self.path)
+
+    def test_round_trip(self):
+        self.seed()
+        self.assertTrue(self.state.save(force=True))
+        with open(self.path) as f:
+            saved = json.load(f)
+        self.assertEqual(saved['version'], auto_continue_bot.STATE_VERSION)
+        self.assertEqual([p['monitor'] for p in saved['positions']], [0, 1])
+
+        with patch('auto_continue_bot.logging'):
+            self.assertTrue(self.restart().restore(self.args, self.template))
+        self.assertEqual(auto_continue_bot.roi_tracker.candidates, [(1500, 950), (2500, 900)])
+        self.assertEqual(auto_continue_bot.last_matched_scale, 1.5)
+        self.assertEqual(self.template.last_matched, 'microphone_icon')
+
+    def test_ignored_when_layout_changes(self):
+        self.seed()
+        self.state.save(force=True)
+        self.monitors = [(0, 0, 3840, 2160)]
+        with patch('auto_continue_bot.logging'):
+            self.assertFalse(self.restart().restore(self.args, self.template))
+        self.assertEqual(auto_continue_bot.roi_tracker.candidates, [])
+        self.assertEqual(auto_continue_bot.last_matched_scale, 1.0)
+
+    def test_ignored_for_other_version(self):
+        self.seed()
+        self.state.save(force=True)
+        with open(self.path) as f:
+            saved = json.load(f)
+        saved['version'] = auto_continue_bot.STATE_VERSION + 1
+        with open(self.path, 'w') as f:
+            json.dump(saved, f)
+        with patch('auto_continue_bot.logging'):
+            self.assertFalse(self.restart().restore(self.args, self.template))
+
+    def test_corrupt_file_ignored(self):
+        with open(self.path, 'w') as f:
+            f.write("{not json")
+        with patch('auto_continue_bot.logging'):
+            self.assertFalse(self.state.restore(self.args, self.template))
+
+    def test_save_only_when_changed_and_throttled(self):
+        self.assertFalse(self.state.save())  # nothing seen yet: keep an older file
+        self.seed()
+        self.assertTrue(self.state.save())
+        self.assertFalse(self.state.save(force=True))  # unchanged
+        auto_continue_bot.roi_tracker.remember(auto_continue_bot.Point(100, 100))
+        self.assertFalse(self.state.save())  # within STATE_SAVE_INTERVAL
+        self.now[0] += auto_continue_bot.STATE_SAVE_INTERVAL
+        self.assertTrue(self.state.save())
+        self.assertEqual(os.listdir(self.tmpdir.name), ["bot_state.json"])
+
+    def test_multi_targets_restored(self):
+        args = argparse.Namespace(scales=[1.0], workers=1)
+        tracker = auto_continue_bot.MultiTargetTracker(args, self.template, 1)
+        self.addCleanup(tracker.close)
+        tracker.update([auto_continue_bot.Point(300, 400), auto_continue_bot.Point(2400, 600)], 0.0)
+        self.state.save(tracker, force=True)
+
+        restored = auto_continue_bot.MultiTargetTracker(args, self.template, 1)
+        self.addCleanup(restored.close)
+        with patch('auto_continue_bot.logging'):
+            self.assertTrue(self.restart().restore(args, self.template, restored))
+        self.assertEqual([tuple(t.pos) for t in restored.targets], [(300, 400), (2400, 600)])
+        self.assertEqual(len({t.id for t in restored.targets}), 2)
+
+class FakeWindowSource:
+
+    def __init__(self, clients):
+        self.clients_list = clients
+        self.events = False
+        self.listed = 0
+        self.watched = []
+
+    def clients(self):
+        self.listed += 1
+        return list(self.clients_list)
+
+    def watch(self, windows):
+        self.watched = list(windows)
+
+    def changed(self):
+        changed, self.events = self.events, False
+        return changed
+
+    def close(self):
+        pass
+
+class TestWindowDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        backend = MagicMock()
+        backend.screen_region.return_value = (0, 0, 3840, 2160)
+        patcher = patch('auto_continue_bot.capture_backend', backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = [0.0]
+
+    def client(self, window_id, region, wm_class=('cursor', 'Cursor'), visible=True):
+        return auto_continue_bot.ClientWindow(window_id, tuple(c.lower() for c in wm_class), f"win{window_id}", region, visible)
+
+    def tracker(self, clients):
+        self.source = FakeWindowSource(clients)
+        return auto_continue_bot.WindowTracker(self.source, clock=lambda: self.now[0])
+
+    def test_chat_area_is_bottom_of_window(self):
+        self.assertEqual(auto_continue_bot.chat_area((100, 200, 1000, 1000)), (100, 800, 1000, 400))
+
+    def test_visible_part(self):
+        rect = (0, 0, 100, 100)
+        self.assertEqual(auto_continue_bot.visible_part(rect, []), rect)
+        self.assertIsNone(auto_continue_bot.visible_part(rect, [(-10, -10, 200, 200)]))
+        # Left half covered: only the right half is left
+        self.assertEqual(auto_continue_bot.visible_part(rect, [(-10, -10, 60, 200)]), (50, 0, 50, 100))
+        # Covered by two windows together
+        self.assertIsNone(auto_continue_bot.visible_part(rect, [(0, 0, 100, 50), (0, 50, 100, 50)]))
+
+    def test_regions_skip_hidden_covered_and_other_apps(self):
+        tracker = self.tracker([
+            self.client(1, (0, 0, 1920, 1080)),                          # covered by the browser
+            self.client(2, (1920, 0, 1920, 1080), visible=False),        # minimized
+            self.client(3, (0, 0, 1920, 2160), wm_class=('firefox',)),   # not Cursor
+            self.client(4, (1920, 1080, 1920, 1080)),
+        ])
+        regions = tracker.regions()
+        self.assertEqual(regions, [auto_continue_bot.chat_area((1920, 1080, 1920, 1080))])
+        self.assertEqual(self.source.watched, [1, 2, 4])
+        area = sum(r[2] * r[3] for r in regions)
+        self.assertLessEqual(area * 10, 3840 * 2160)
+
+    def test_no_cursor_window_means_full_screen(self):
+        tracker = self.tracker([self.client(3, (0, 0, 1920, 1080), wm_class=('firefox',))])
+        self.assertIsNone(tracker.regions())
+
+    def test_all_windows_minimized_means_nothing_to_scan(self):
+        tracker = self.tracker([self.client(1, (0, 0, 1920, 1080), visible=False)])
+        self.assertEqual(tracker.regions(), [])
+
+    def test_cache_refreshed_on_events_and_interval(self):
+        tracker = self.tracker([self.client(1, (0, 0, 1920, 1080))])
+        tracker.regions()
+        tracker.regions()
+        self.assertEqual(self.source.listed, 1)
+        self.source.events = True
+        tracker.regions()
+        self.assertEqual(self.source.listed, 2)
+        self.now[0] += auto_continue_bot.WINDOW_REFRESH_INTERVAL
+        tracker.regions()
+        self.assertEqual(self.source.listed, 3)
+
+    def test_x11_unavailable_without_display(self):
+        with patch.dict(os.environ, {'DISPLAY': ':987'}):
+            with self.assertRaises(OSError):
+                auto_continue_bot._X11Windows()
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(auto_continue_bot.create_window_tracker('auto'))
+        self.assertIsNone(auto_continue_bot.create_window_tracker('off'))
+
+    def test_full_scan_limited_to_windows(self):
+        icon = cv2.imread(os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png"))
+        template = auto_continue_bot.TemplateCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), "microphone_icon.png"))
+        frame = np.full((400, 1000, 3), 40, dtype=np.uint8)
+        frame[300:300 + icon.shape[0], 600:600 + icon.shape[1]] = icon
+        region = (2000, 1500, 1000, 400)
+        args = argparse.Namespace(scales=[1.0], pyramid_levels=2)
+        auto_continue_bot.frame_detector.reset()
+        with patch('auto_continue_bot.search_regions', return_value=[region]), \
+             patch('auto_continue_bot.capture_screen', return_value=frame) as mock_capture, \
+             patch('auto_continue_bot.last_matched_scale', 1.0):
+            pos = auto_continue_bot.locate_full_screen(args, template)
+        mock_capture.assert_called_once_with(region)
+        self.assertEqual(tuple(pos), (2000 + 600 + icon.shape[1] // 2, 1500 + 300 + icon.shape[0] // 2))
+
+    def test_full_scan_skipped_when_windows_hidden(self):
+        args = argparse.Namespace(scales=[1.0], pyramid_levels=2)
+        with patch('auto_continue_bot.search_regions', return_value=[]), \
+             patch('auto_continue_bot.capture_screen') as mock_capture:
+            self.assertIsNone(auto_continue_bot.locate_full_screen(args, MagicMock()))
+        mock_capture.assert_not_called()
+
+class TestActionVerifier(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [100.0]
+        self.verifier = auto_continue_bot.ActionVerifier(clock=lambda: self.now[0], sleep=self.advance)
+        self.args = argparse.Namespace(verify_window=1.0, dry_run=False, cooldown=15.0)
+        self.pos = auto_continue_bot.Point(500, 400)
+        self.retries = []
+        patcher = patch('auto_continue_bot.metrics', auto_continue_bot.Metrics())
+        self.metrics = patcher.start()
+        self.addCleanup(patcher.stop)
+        auto_continue_bot.bot_paused = False
+        auto_continue_bot.bot_running = True
+
+    def advance(self, seconds):
+        self.now[0] += seconds
+
+    def retry(self, action_time):
+        self.retries.append(action_time)
+        return action_time + 10, True
+
+    def verify(self, visible, deadline=None):
+        with patch('auto_continue_bot.locate_in_region', side_effect=lambda *a, **k: self.pos if visible() else None), \
+             patch('auto_continue_bot.logging'):
+            return self.verifier.verify(self.args, MagicMock(), self.pos, 99.0, 1000.0, self.retry, deadline)
+
+    def test_confirmed_releases_cooldown(self):
+        with patch('auto_continue_bot.time.time', return_value=2000.0):
+            result = self.verify(lambda: False)
+        self.assertEqual(result, 2000.0 - self.args.cooldown)
+        self.assertEqual(self.retries, [])
+        self.assertEqual(self.metrics.counters['actions_confirmed'], 1)
+        self.assertEqual(self.metrics.stages['detect_to_restart'][-1], 1)
+
+    def test_retries_with_backoff_then_gives_up(self):
+        result = self.verify(lambda: True)
+        self.assertEqual(self.retries, [1000.0, 1010.0])
+        self.assertEqual(result, 1020.0)
+        self.assertEqual(self.metrics.counters['action_retries'], auto_continue_bot.VERIFY_RETRIES)
+        self.assertEqual(self.metrics.counters['actions_unconfirmed'], 1)
+        # 1s + 2s, then the last 4s window is cut to the 4-window budget
+        self.assertAlmostEqual(self.now[0] - 100.0, auto_continue_bot.VERIFY_BUDGET, delta=0.5)
+
+    def test_capture_error_is_unknown_not_a_retry(self):
+        def visible():
+            raise OSError("screen grab failed")
+        with patch('auto_continue_bot.logging') as mock_logging, \
+             patch('auto_continue_bot.locate_in_region', side_effect=lambda *a, **k: visible()):
+            result = self.verifier.verify(self.args, MagicMock(), self.pos, 99.0, 1000.0, self.retry)
+        self.assertEqual(result, 1000.0)
+        self.assertEqual(self.retries, [])
+        self.assertEqual(self.metrics.counters['actions_unconfirmed'], 1)
+        self.assertIn("Verification capture failed", mock_logging.warning.call_args[0][0])
+
+    def test_targets_share_the_cycle_deadline(self):
+        deadline = self.verifier.deadline(self.args)
+        self.verify(lambda: True, deadline)
+        self.assertAlmostEqual(self.now[0], deadline, delta=0.2)
+        # A second target in the same cycle is not watched at all
+        with patch('auto_continue_bot.locate_in_region') as mock_locate:
+            self.assertEqual(self.verifier.verify(self.args, MagicMock(), self.pos, 99.0, 1000.0, self.retry, deadline), 1000.0)
+        mock_locate.assert_not_called()
+
+    def test_confirmed_after_retry(self):
+        with patch('auto_continue_bot.time.time', return_value=2000.0):
+            result = self.verify(lambda: not self.retries)
+        self.assertEqual(len(self.retries), 1)
+        self.assertEqual(result, 2000.0 - self.args.cooldown)
+
+    def test_disabled(self):
+        self.args.verify_window = 0
+        with patch('auto_continue_bot.locate_in_region') as mock_locate:
+            self.assertEqual(self.verifier.verify(self.args, MagicMock(), self.pos, 99.0, 1000.0, self.retry), 1000.0)
+        mock_locate.assert_not_called()
+
+    def test_no_retry_when_paused(self):
+        auto_continue_bot.bot_paused = True
+        self.addCleanup(setattr, auto_continue_bot, 'bot_paused', False)
+        self.assertEqual(self.verify(lambda: True), 1000.0)
+        self.assertEqual(self.retries, [])
+
+@unittest.skipUnless(auto_continue_bot.shutil.which('git'), "git not installed")
+class TestCheckpointer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.repo = self.tmp.name
+        for args in (['init', '-q'], ['config', 'user.name', 'Test'], ['config', 'user.email', 'test@example.com']):
+            auto_continue_bot.subprocess.run(['git', '-C', self.repo] + args, check=True)
+        patcher = patch('auto_continue_bot.metrics', auto_continue_bot.Metrics())
+        self.metrics = patcher.start()
+        self.addCleanup(patcher.stop)
+        log_patcher = patch('auto_continue_bot.logging')
+        self.logging = log_patcher.start()
+        self.addCleanup(log_patcher.stop)
+
+    def write(self, name, text):
+        with open(os.path.join(self.repo, name), 'w') as f:
+            f.write(text)
+
+    def log(self):
+        result = auto_continue_bot.subprocess.run(['git', '-C', self.repo, 'log', '--format=%s'],
+                                                  capture_output=True, text=True)
+        return result.stdout.splitlines()
+
+    def test_commit_and_no_changes(self):
+        checkpointer = auto_continue_bot.Checkpointer(self.repo)
+        self.write('a.txt', 'one')
+        self.assertTrue(checkpointer.commit())
+        self.assertIsNone(checkpointer.commit())
+        self.write('a.txt', 'two')
+        self.assertTrue(checkpointer.commit(merged=3))
+        log = self.log()
+        self.assertEqual(len(log), 2)
+        self.assertIn('(3 continues)', log[0])
+
+    def test_burst_is_merged_into_one_commit(self):
+        checkpointer = auto_continue_bot.Checkpointer(self.repo, coalesce=0.2)
+        self.write('a.txt', 'one')
+        for _ in range(3):
+            checkpointer.request()
+        checkpointer.start()
+        checkpointer.stop()
+        self.assertEqual(len(self.log()), 1)
+        self.assertEqual(self.metrics.counters['checkpoints'], 1)
+        self.assertEqual(self.metrics.counters['checkpoints_merged'], 2)
+        self.assertEqual(self.metrics.stages['checkpoint'][-1], 1)
+
+    def test_request_does_not_block(self):
+        checkpointer = auto_continue_bot.Checkpointer(self.repo, coalesce=5)
+        checkpointer.start()
+        self.addCleanup(checkpointer.stop)
+        start = time.monotonic()
+        checkpointer.request()
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_timeout(self):
+        checkpointer = auto_continue_bot.Checkpointer(self.repo, timeout=0)
+        with self.assertRaises(auto_continue_bot.CheckpointError):
+            checkpointer.commit()
+
+    def test_create_rejects_non_repo(self):
+        with tempfile.TemporaryDirectory() as plain:
+            self.assertIsNone(auto_continue_bot.create_checkpointer(plain))
+        self.assertIsInstance(auto_continue_bot.create_checkpointer(self.repo), auto_continue_bot.Checkpointer)
+
+class TestCaptureDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'capture.sock')
+        self.now = [100.0]
+        background = np.random.RandomState(0).randint(0, 255, (120, 160, 3), dtype=np.uint8)
+        self.screen = auto_continue_bot.VirtualScreen(background)
+        self.grabs = 0
+        original = self.screen.grab
+        def counting_grab(region, out=None):
+            self.grabs += 1
+            return original(region, out)
+        self.screen.grab = counting_grab
+        patcher = patch('auto_continue_bot.metrics', auto_continue_bot.Metrics())
+        self.metrics = patcher.start()
+        self.addCleanup(patcher.stop)
+        log_patcher = patch('auto_continue_bot.logging')
+        log_patcher.start()
+        self.addCleanup(log_patcher.stop)
+        # Daemon and bots share this process's resource tracker here
+        tracker_patcher = patch('auto_continue_bot.resource_tracker')
+        tracker_patcher.start()
+        self.addCleanup(tracker_patcher.stop)
+
+    def start_daemon(self, **kwargs):
+        daemon = auto_continue_bot.CaptureDaemon(self.screen, self.path, clock=lambda: self.now[0], **kwargs)
+        thread = threading.Thread(target=daemon.serve, daemon=True)
+        thread.start()
+        for _ in range(100):
+            if os.path.exists(self.path):
+                break
+            time.sleep(0.01)
+        self.addCleanup(thread.join, 2)
+        self.addCleanup(daemon.close)
+        return daemon
+
+    def client(self, fallback=None):
+        capture = auto_continue_bot.SharedCapture(self.path, clock=lambda: self.now[0])
+        capture._fallback = fallback
+        self.addCleanup(capture.close)
+        return capture
+
+    def test_bots_share_one_capture_per_interval(self):
+        daemon = self.start_daemon(interval=0.5)
+        bots = [self.client(), self.client()]
+        self.assertEqual(bots[0].screen_region(), (0, 0, 160, 120))
+        frames = [bot.grab((10, 20, 30, 40)) for bot in bots]
+        for frame in frames:
+            np.testing.assert_array_equal(frame, self.screen.busy_frame[20:60, 10:40])
+            self.assertFalse(frame.flags.writeable)
+        self.assertEqual(daemon.captures, 1)
+        self.assertEqual(self.grabs, 1)
+        self.now[0] += 1.0
+        bots[1].grab((0, 0, 160, 120))
+        self.assertEqual(daemon.captures, 2)
+
+    def test_pinned_frame_is_not_overwritten(self):
+        self.start_daemon(interval=0.1, slots=3)
+        reader, writer = self.client(), self.client()
+        frame = reader.grab((0, 0, 160, 120))
+        expected = frame.copy()
+        self.screen.busy_frame = np.zeros_like(self.screen.busy_frame)
+        self.screen.idle_frame = self.screen.busy_frame
+        for _ in range(4):
+            self.now[0] += 1.0
+            np.testing.assert_array_equal(writer.grab((0, 0, 160, 120)), self.screen.busy_frame)
+        np.testing.assert_array_equal(frame, expected)
+
+    def test_falls_back_without_daemon(self):
+        fallback = auto_continue_bot.VirtualScreen(np.full((50, 60, 3), 7, dtype=np.uint8))
+        capture = self.client(fallback)
+        self.assertEqual(capture.screen_region(), (0, 0, 60, 50))
+        self.assertEqual(int(capture.grab((0, 0, 10, 10))[0, 0, 0]), 7)
+        self.assertFalse(capture.attached)
+
+    def test_falls_back_when_daemon_stops(self):
+        daemon = self.start_daemon()
+        fallback = auto_continue_bot.VirtualScreen(np.full((50, 60, 3), 7, dtype=np.uint8))
+        capture = self.client(fallback)
+        capture.grab((0, 0, 10, 10))
+        self.assertTrue(capture.attached)
+        daemon.close()
+        self.assertEqual(int(capture.grab((0, 0, 10, 10))[0, 0, 0]), 7)
+        self.assertEqual(self.metrics.counters['capture_daemon_fallbacks'], 1)
+
+    def test_falls_back_when_frame_memory_is_gone(self):
+        self.start_daemon()
+        fallback = auto_continue_bot.VirtualScreen(np.full((50, 60, 3), 7, dtype=np.uint8))
+        capture = self.client(fallback)
+        self.assertEqual(capture.screen_region(), (0, 0, 160, 120))
+        with patch('auto_continue_bot.attach_shared_memory', side_effect=FileNotFoundError("no such segment")):
+            self.assertEqual(int(capture.grab((0, 0, 10, 10))[0, 0, 0]), 7)
+        self.assertFalse(capture.attached)
+        self.assertEqual(self.metrics.counters['capture_daemon_fallbacks'], 1)
+        # The daemon's screen layout is forgotten along with the connection
+        self.assertEqual(capture.screen_region(), (0, 0, 60, 50))
+        self.now[0] += auto_continue_bot.CAPTURE_DAEMON_RETRY
+        capture.grab((0, 0, 10, 10))
+        self.assertTrue(capture.attached)
+        self.assertEqual(capture.screen_region(), (0, 0, 160, 120))
+
+    def test_replaced_frame_memory_is_unmapped(self):
+        daemon = self.start_daemon()
+        capture = self.client(auto_continue_bot.VirtualScreen(np.full((50, 60, 3), 7, dtype=np.uint8)))
+        frame = capture.grab((0, 0, 10, 10))
+        old = next(iter(capture._segments))
+        # The daemon comes back with a new ring; the old mapping is still read from
+        daemon.close()
+        self.now[0] += 1.0
+        capture.grab((0, 0, 10, 10))
+        self.start_daemon()
+        self.now[0] += auto_continue_bot.CAPTURE_DAEMON_RETRY
+        capture.grab((0, 0, 10, 10))
+        self.assertNotIn(old, capture._segments)
+        self.assertEqual(len(capture._segments), 1)
+        # The frame still in use keeps its mapping (unmapping it would crash the reader)
+        self.assertEqual(len(capture._retired), 1)
+        np.testing.assert_array_equal(frame, self.screen.busy_frame[0:10, 0:10])
+        del frame
+        self.assertEqual(capture._unmap(capture._retired), [])
+
+    def test_second_daemon_refused_and_stale_socket_replaced(self):
+        self.start_daemon()
+        with self.assertRaises(OSError):
+            auto_continue_bot.CaptureDaemon(self.screen, self.path)._listen()
+        stale = os.path.join(self.tmp.name, 'stale.sock')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(stale)
+        sock.close()
+        server = auto_continue_bot.CaptureDaemon(self.screen, stale)._listen()
+        server.close()
+
+    def test_default_socket_is_private(self):
+        with patch.dict(os.environ, {'XDG_RUNTIME_DIR': self.tmp.name}):
+            self.assertEqual(auto_continue_bot.default_capture_socket(), os.path.join(self.tmp.name, 'cursor-capture.sock'))
+        with patch.dict(os.environ, {'XDG_RUNTIME_DIR': ''}), \
+             patch('auto_continue_bot.tempfile.gettempdir', return_value=self.tmp.name):
+            path = auto_continue_bot.default_capture_socket()
+        self.assertEqual(os.path.dirname(os.path.dirname(path)), self.tmp.name)
+        auto_continue_bot.prepare_socket_dir(path)
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode), 0o700)
+
+    def test_shared_directory_refused(self):
+        shared = os.path.join(self.tmp.name, 'shared')
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        with self.assertRaises(PermissionError):
+            auto_continue_bot.CaptureDaemon(self.screen, os.path.join(shared, 'capture.sock'))._listen()
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), "no Unix users")
+    def test_other_users_socket_refused(self):
+        self.start_daemon()
+        fallback = auto_continue_bot.VirtualScreen(np.full((50, 60, 3), 7, dtype=np.uint8))
+        capture = self.client(fallback)
+        with patch('auto_continue_bot.os.getuid', return_value=os.getuid() + 1):
+            self.assertEqual(int(capture.grab((0, 0, 10, 10))[0, 0, 0]), 7)
+        self.assertFalse(capture.attached)
+
+    @unittest.skipUnless(hasattr(socket, 'SO_PEERCRED'), "no SO_PEERCRED")
+    def test_peer_credentials_checked(self):
+        left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(left.close)
+        self.addCleanup(right.close)
+        auto_continue_bot.check_peer(left)
+        with patch('auto_continue_bot.os.getuid', return_value=os.getuid() + 1):
+            with self.assertRaises(PermissionError):
+                auto_continue_bot.check_peer(left)
+
 if __name__ == '__main__':
     unittest.main()